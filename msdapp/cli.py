@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+MSD Analysis: command line runner (no GUI)
+Runs the full pipeline for all cells found in an input directory:
+    filter -> histogram -> batchd -> stats -> msd -> compare
+
+INPUT DIRECTORY
+ | -- STIM                                  <-- group taken from directory name (or expt prefix + group)
+        | -- cell1
+                | -- AllROI-D.txt           <-- DATA_FILENAME in config
+                | -- AllROI-MSD.txt         <-- MSD_FILENAME in config
+                (or Tracks.csv              <-- TRACKS_FILENAME in config - data files are calculated from tracks)
+
+Per-cell processes run with a pool of worker processes (--jobs) and processes for different groups
+run concurrently as soon as their input files are available.
+A run summary with timings for each process is written as JSON to the output directory.
+
+Usage:
+    python -m msdapp --config msd.cfg --inputdir data --outputdir output --expt EXPT1_ --groups stim nostim --jobs 4
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import argparse
+import json
+import logging
+import re
+import sys
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from os import R_OK, access, mkdir
+from os.path import join, expanduser, exists, sep, dirname
+
+from configobj import ConfigObj
+
+from msdapp.fileindex import getIndex, configFilenames
+from msdapp.msd.msdStats import MSDStats
+from msdapp.scheduler import StageScheduler
+from msdapp.msd.limitIndex import limitPairs, limitCounts
+from msdapp.workers import PROCESSES, CheckFilenames, runCells, filterCell, histogramCell, batchGroup, tracksCell, \
+    limitIndexCell
+
+# Comparison of groups - only run from command line (GUI has Compare Groups panel)
+COMPARE = {'caption': '5. Compare Groups', 'href': 'compare',
+           'description': 'Statistical comparison of groups from compiled histogram and MSD files',
+           'files': 'ALLSTATS_FILENAME, AVGMSD_FILENAME', 'ptype': 'batch',
+           'filesout': ''}
+# Sweep of filter limits - run after filter tasks with MINLIMIT_SWEEP and MAXLIMIT_SWEEP in config
+LIMITS = {'caption': 'Limit Sweep', 'href': 'limits',
+          'description': 'Retained trajectories of each cell for a range of filter limits',
+          'files': 'DATA_FILENAME, MSD_FILENAME', 'ptype': 'batch',
+          'filesout': ''}
+
+
+def findFiles(inputdir, datafile, expt='', groups=None, indexnames=None):
+    """
+    Find all data files in input directory and assign groups as in Files panel
+    :param inputdir: top level directory
+    :param datafile: DATA_FILENAME from config
+    :param expt: experiment prefix - if set, only matching files are included
+    :param groups: list of group names
+    :param indexnames: filenames to index for later processes (default datafile only)
+    :return: dict of filenames by group with 'all'
+    """
+    if groups is None:
+        groups = []
+    filenames = OrderedDict([('all', [])] + [(g, []) for g in groups])
+    index = getIndex(inputdir, filenames=indexnames if indexnames is not None else [datafile])
+    for fname in index.find(datafile, inputdir):
+        if len(expt) > 0 and not re.search(expt, fname, flags=re.IGNORECASE):
+            continue
+        filenames['all'].append(fname)
+        # group as directory name ONLY
+        for pfix in groups:
+            if pfix.upper() in fname.upper().split(sep):
+                filenames[pfix].append(fname)
+                break
+            elif len(expt) > 0 and re.search(expt + pfix, fname, flags=re.IGNORECASE):
+                filenames[pfix].append(fname)
+                break
+    return filenames
+
+
+def stageState(states):
+    """
+    Combined state of tasks (or stages)
+    :param states: list of 'done', 'error' or 'skipped'
+    :return: 'error' if any failed, 'skipped' if any skipped, else 'done'
+    """
+    for state in ['error', 'skipped']:
+        if state in states:
+            return state
+    return 'done'
+
+
+class PipelineRunner():
+    def __init__(self, configfile, inputdir, outputdir, expt='', groups=None, jobs=None, processes=None, force=False,
+                 control=None):
+        """
+        Run processes without GUI
+        :param configfile: config file
+        :param inputdir: top level directory with cell data
+        :param outputdir: directory for compiled files (created if required)
+        :param expt: experiment prefix
+        :param groups: list of groups (default GROUP1 and GROUP2 from config)
+        :param jobs: number of worker processes (default WORKERS from config, 0 for all cores)
+        :param processes: list of process hrefs to run (default all)
+        :param force: rebuild all outputs (otherwise only changed inputs if INCREMENTAL in config)
+        :param control: control group for compare (default CONTROL_GROUP in config or all pairs of groups)
+        """
+        self.encoding = 'ISO-8859-1'
+        self.configfile = configfile
+        self.__loadConfig(configfile)
+        self.inputdir = inputdir
+        self.outputdir = outputdir
+        self.expt = expt
+        if groups is None or len(groups) <= 0:
+            groups = [self.group1, self.group2]
+        self.groups = groups
+        self.control = control
+        if jobs is not None:
+            self.workers = int(jobs)
+        if force:
+            self.incremental = 0
+        self.processes = deepcopy(PROCESSES) + [deepcopy(COMPARE)]
+        if processes is not None:
+            self.processes = [p for p in self.processes if p['href'] in processes]
+        if 'filter' in [p['href'] for p in self.processes] and len(limitPairs(self.config)) > 0:
+            self.processes.append(deepcopy(LIMITS))
+        # In-memory pipeline: filtered and histogram dataframes by output filename
+        self.datastore = dict()
+        self.outputs = []
+        self.counts = dict()
+        self.scheduler = None
+
+    def __loadConfig(self, configfile):
+        if configfile is None or not access(configfile, R_OK):
+            raise ValueError("Cannot read config file: %s" % configfile)
+        config = ConfigObj(configfile, encoding=self.encoding)
+        self.config = config
+        self.datafile = config['DATA_FILENAME']
+        self.msdfile = config['MSD_FILENAME']
+        self.tracksfile = config['TRACKS_FILENAME'] if 'TRACKS_FILENAME' in config else None
+        self.group1 = config['GROUP1']
+        self.group2 = config['GROUP2']
+        if 'INMEMORY' in config:
+            self.inmemory = int(config['INMEMORY'])
+        else:
+            self.inmemory = 0
+        if 'SAVE_INTERMEDIATE' in config and self.inmemory:
+            self.saveintermediate = int(config['SAVE_INTERMEDIATE'])
+        else:
+            self.saveintermediate = 1
+        if 'INCREMENTAL' in config:
+            self.incremental = int(config['INCREMENTAL'])
+        else:
+            self.incremental = 1
+        if 'WORKERS' in config:
+            self.workers = int(config['WORKERS'])
+        else:
+            self.workers = 1
+
+    def filesIn(self, href):
+        """
+        Input filenames for process from config
+        :param href:
+        :return: list
+        """
+        process = [p for p in self.processes if p['href'] == href][0]
+        return [self.config[f] for f in process['files'].split(", ")]
+
+    def __count(self, href, n):
+        self.counts[href] = self.counts.get(href, 0) + n
+
+    def runTracks(self):
+        """
+        Calculate data files from tracks file of each cell - before data files are found
+        :return:
+        """
+        index = getIndex(self.inputdir, [self.tracksfile])
+        files = [f for f in index.find(self.tracksfile, self.inputdir)
+                 if len(self.expt) <= 0 or re.search(self.expt, f, flags=re.IGNORECASE)]
+        tasks = [(self.configfile, f, self.incremental) for f in files]
+        for (filename, results) in runCells(tracksCell, tasks, self.workers):
+            self.outputs += list(results[:2])
+            self.__count('tracks', 1)
+        logging.info("Tracks: data files calculated for %d cells", len(files))
+
+    def runFilter(self, files):
+        """
+        Filter each cell
+        :param files: list of data files
+        :return:
+        """
+        checkedfilenames = CheckFilenames(files, self.filesIn('filter'))
+        files = [f for f in checkedfilenames if self.datafile in f]
+        tasks = [(self.configfile, f, self.datafile, self.msdfile, self.saveintermediate, self.inmemory,
+                  self.incremental) for f in files]
+        for (filename, results, outputs) in runCells(filterCell, tasks, self.workers):
+            if results is None:
+                logging.warning("Filter: no data in %s", filename)
+                continue
+            if outputs is not None:
+                self.datastore.update(outputs)
+            self.__count('filter', 1)
+
+    def runLimitSweep(self, files):
+        """
+        Retained rows of each cell for all limit pairs from MINLIMIT_SWEEP and MAXLIMIT_SWEEP in config
+        (from sorted log10D saved with each data file - see limitIndex)
+        :param files: list of data files
+        :return: sweep filename or None if no sweep in config
+        """
+        pairs = limitPairs(self.config)
+        if len(pairs) <= 0:
+            return None
+        files = [f for f in files if self.datafile in f]
+        tasks = [(self.configfile, f, self.datafile, self.msdfile) for f in files]
+        indexes = OrderedDict([(dirname(f), index) for (f, index) in runCells(limitIndexCell, tasks, self.workers)
+                               if index is not None])
+        sweepfile = join(self.outputdir, self.expt + "limits_sweep.csv")
+        limitCounts(indexes, pairs).to_csv(sweepfile, index=False)
+        self.outputs.append(sweepfile)
+        self.__count('limits', 1)
+        logging.info("Limits: %d limit pairs for %d cells saved to %s", len(pairs), len(indexes), sweepfile)
+        return sweepfile
+
+    def runHistogram(self, files):
+        """
+        Histogram for each cell
+        :param files: list of data files (filtered files are found in each cell directory)
+        :return:
+        """
+        datastore = self.datastore if self.inmemory else None
+        checkedfilenames = CheckFilenames(files, self.filesIn('histogram'), datastore)
+        tasks = [(self.configfile, f, datastore.get(f) if datastore is not None else None,
+                  False, self.saveintermediate, self.incremental) for f in checkedfilenames]
+        for (datafile, results, histdata) in runCells(histogramCell, tasks, self.workers):
+            if results is None:
+                logging.warning("Histogram: no data in %s", datafile)
+                continue
+            if datastore is not None and histdata is not None:
+                datastore[results[0]] = histdata
+            self.__count('histogram', 1)
+
+    def runBatch(self, type, files, groups, nolistfilter):
+        """
+        Compile cells for each group
+        :param type: batchd, stats or msd
+        :param files: list of data files
+        :param groups: list of groups
+        :param nolistfilter: True if files are already grouped
+        :return:
+        """
+        datastore = self.datastore if self.inmemory else None
+        checkedfilenames = CheckFilenames(files, self.filesIn(type), datastore)
+        for group in groups:
+            (compiledfile, ratiofile, plotfile) = batchGroup(type, checkedfilenames, self.outputdir, group,
+                                                             self.expt, self.configfile, nolistfilter, datastore,
+                                                             incremental=self.incremental)
+            self.outputs += [f for f in [compiledfile, ratiofile] if f]
+            self.__count(type, 1)
+            logging.info("%s: %s: %s\nFILES CREATED:\n\t%s\n\t%s\n", type, self.expt, group, compiledfile, ratiofile)
+
+    def runCompare(self):
+        """
+        T-tests of all pairs of groups (or each group vs control) from compiled files in output directory
+        :return:
+        """
+        if len(self.groups) < 2:
+            logging.warning("Compare: two or more groups required - skipping (groups: %s)", ", ".join(self.groups))
+            return
+        prefixes = [self.expt + g for g in self.groups]
+        control = self.expt + self.control if self.control is not None else None
+        rs = MSDStats([self.outputdir], self.outputdir, prefixes, self.configfile, control)
+        results_df = rs.runTtests()
+        outputfile = join(self.outputdir, rs.outputfilename)
+        results_df.to_csv(outputfile, index=False)
+        self.outputs.append(outputfile)
+        summary_df = rs.summarizeGroups()
+        if summary_df is not None:
+            summaryfile = join(self.outputdir, rs.summaryfilename)
+            summary_df.to_csv(summaryfile, index=False)
+            self.outputs.append(summaryfile)
+        bootstrap_df = rs.runBootstrap()
+        if bootstrap_df is not None:
+            bootstrapfile = join(self.outputdir, rs.bootstrapfilename)
+            bootstrap_df.to_csv(bootstrapfile, index=False)
+            self.outputs.append(bootstrapfile)
+        comparisons_df = rs.runComparisons()
+        if comparisons_df is not None:
+            comparisonsfile = join(self.outputdir, rs.comparisonsfilename)
+            comparisons_df.to_csv(comparisonsfile, index=False)
+            self.outputs.append(comparisonsfile)
+        self.__count('compare', 1)
+        logging.info("Compare: results saved to %s", outputfile)
+
+    def run(self):
+        """
+        Run all processes - returns when all are finished
+        :return: summary dict
+        """
+        start = time.time()
+        if not exists(self.outputdir):
+            mkdir(self.outputdir)
+        if self.tracksfile is not None:
+            self.runTracks()
+        filenames = findFiles(self.inputdir, self.datafile, self.expt, self.groups, configFilenames(self.config))
+        groups = [g for g in self.groups if len(filenames[g]) > 0]
+        logging.info("Found %d cells in %s (%s)", len(filenames['all']), self.inputdir,
+                     ", ".join(["%s: %d" % (g, len(filenames[g])) for g in self.groups]))
+        self.scheduler = StageScheduler(self.processes)
+        for process in self.processes:
+            type = process['href']
+            if type == 'compare':
+                self.scheduler.submit(type, None, self.runCompare)
+            elif type == 'limits':
+                # counted from data files once filter tasks are complete (skipped if a filter task failed)
+                filtertasks = [key for key in self.scheduler.tasks.keys() if key[0] == 'filter']
+                self.scheduler.submit(type, None, lambda: self.runLimitSweep(filenames['all']), deps=filtertasks)
+            elif process['ptype'] == 'indiv':
+                func = self.runFilter if type == 'filter' else self.runHistogram
+                grouped = [f for g in groups for f in filenames[g]]
+                ungrouped = [f for f in filenames['all'] if f not in grouped]
+                for g in groups:
+                    self.scheduler.submit(type, g, lambda func=func, files=filenames[g]: func(files))
+                if len(ungrouped) > 0:
+                    self.scheduler.submit(type, '', lambda func=func, files=ungrouped: func(files))
+            elif len(groups) > 0:
+                for g in groups:
+                    self.scheduler.submit(type, g, lambda type=type, g=g: self.runBatch(type, filenames[g], [g], True))
+            else:
+                # If no groups found - use all
+                self.scheduler.submit(type, None,
+                                      lambda type=type: self.runBatch(type, filenames['all'], self.groups, False))
+        self.scheduler.wait()
+        return self.summary(start, time.time(), filenames)
+
+    def summary(self, start, end, filenames):
+        """
+        Machine-readable summary of run
+        :return: dict
+        """
+        tasks = self.scheduler.summary()
+        stages = []
+        for process in self.processes:
+            ptasks = [t for t in tasks if t['process'] == process['href']]
+            if len(ptasks) <= 0:
+                continue
+            starts = [t['start'] for t in ptasks if t['start'] is not None]
+            ends = [t['end'] for t in ptasks if t['end'] is not None]
+            stage = {'process': process['href'], 'caption': process['caption'],
+                     'state': stageState([t['state'] for t in ptasks]),
+                     'tasks': len(ptasks), 'completed': self.counts.get(process['href'], 0),
+                     'start': min(starts) if len(starts) else None, 'end': max(ends) if len(ends) else None,
+                     'seconds': sum([t['seconds'] for t in ptasks if t['seconds'] is not None])}
+            if stage['start'] is not None and stage['end'] is not None:
+                stage['elapsed'] = stage['end'] - stage['start']
+            stages.append(stage)
+        return {'config': self.configfile, 'inputdir': self.inputdir, 'outputdir': self.outputdir,
+                'expt': self.expt, 'groups': self.groups, 'jobs': self.workers, 'inmemory': self.inmemory,
+                'incremental': self.incremental,
+                'cells': OrderedDict([(g, len(files)) for g, files in filenames.items()]),
+                'state': stageState([s['state'] for s in stages]),
+                'start': start, 'end': end, 'seconds': end - start,
+                'stages': stages, 'tasks': tasks, 'outputs': self.outputs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='msdapp',
+                                     description='''\
+            Runs MSD analysis processes for all cells in input directory without GUI
+            (filter, histogram, batchd, stats, msd, compare)
+
+             ''')
+    parser.add_argument('--config', action='store', help='Configfile', default=join(expanduser('~'), '.msdcfg'))
+    parser.add_argument('--inputdir', action='store', help='Top level directory with cell data', required=True)
+    parser.add_argument('--outputdir', action='store', help='Output directory for compiled files (default inputdir)')
+    parser.add_argument('--expt', action='store', help='Experiment prefix', default='')
+    parser.add_argument('--groups', action='store', nargs='+', help='Groups (default GROUP1 GROUP2 from config)')
+    parser.add_argument('--jobs', action='store', type=int, help='Worker processes (0 for all cores)')
+    parser.add_argument('--processes', action='store', nargs='+', help='Processes to run (default all)',
+                        choices=[p['href'] for p in PROCESSES] + [COMPARE['href']])
+    parser.add_argument('--control', action='store', help='Control group for compare (default all pairs of groups)')
+    parser.add_argument('--force', action='store_true', help='Rebuild all outputs even if up to date')
+    parser.add_argument('--summary', action='store', help='Run summary JSON file (default in outputdir)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='[ %(asctime)s %(levelname)-4s ] (%(threadName)-9s) %(message)s')
+    outputdir = args.outputdir if args.outputdir is not None else args.inputdir
+    try:
+        runner = PipelineRunner(args.config, args.inputdir, outputdir, args.expt, args.groups, args.jobs,
+                                args.processes, args.force, args.control)
+        summary = runner.run()
+    except ValueError as e:
+        print("Error: ", e)
+        return 1
+    summaryfile = args.summary
+    if summaryfile is None:
+        summaryfile = join(outputdir, args.expt + 'run_summary.json')
+    with open(summaryfile, 'w') as f:
+        json.dump(summary, f, indent=2)
+    for stage in summary['stages']:
+        print("%-10s %-6s %4d completed in %8.2f s" % (stage['process'], stage['state'], stage['completed'],
+                                                       stage.get('elapsed', 0.0)))
+    print("Run summary: %s (%.2f s)" % (summaryfile, summary['seconds']))
+    return 0 if summary['state'] == 'done' else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+MSD Analysis: fileindex
+Index of data files in an input directory tree - walked once and answered from memory
+
+Only files whose names end with one of the indexed filenames (eg AllROI-D.txt, Filtered_log10D.csv) are recorded.
+The index is saved per root directory in ~/.msdapp/index_<hash>.json and refreshed by directory mtime:
+only directories with entries added or removed since the last walk are listed again. Directories modified
+within the mtime granularity of the last listing are also listed again, as entries added later in the same
+tick (eg network shares with coarse mtimes) do not change the mtime.
+Hidden files and directories are skipped (as with glob).
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from os import R_OK, access, mkdir, scandir, stat
+from os.path import join, expanduser, abspath, sep
+
+# Config fields with filenames to index
+INDEX_FIELDS = ['TRACKS_FILENAME', 'DATA_FILENAME', 'MSD_FILENAME', 'FILTERED_FILENAME', 'FILTERED_MSD', 'HISTOGRAM_FILENAME']
+# Coarsest directory mtime resolution expected (ns) - FAT and SMB shares use 2 seconds
+MTIME_GRANULARITY = 2 * 10 ** 9
+
+
+def configFilenames(config):
+    """
+    Filenames to index from config
+    :param config: ConfigObj or dict
+    :return: list of filenames
+    """
+    return [config[f] for f in INDEX_FIELDS if f in config]
+
+
+class FileIndex():
+    def __init__(self, root, filenames=None, indexdir=None):
+        """
+        Load saved index for root directory (call refresh to update)
+        :param root: top level directory
+        :param filenames: filenames to index
+        :param indexdir: directory for saved index (default ~/.msdapp)
+        """
+        self.root = abspath(root)
+        self.filenames = sorted(set(filenames)) if filenames is not None else []
+        if indexdir is None:
+            indexdir = join(expanduser('~'), '.msdapp')
+        self.indexdir = indexdir
+        key = hashlib.sha1(self.root.encode('utf-8')).hexdigest()[:16]
+        self.indexfile = join(indexdir, 'index_%s.json' % key)
+        self.dirs = dict()
+        self.lock = threading.RLock()
+        self.__load()
+
+    def __load(self):
+        if not access(self.indexfile, R_OK):
+            return
+        try:
+            with open(self.indexfile, 'r') as f:
+                saved = json.load(f)
+            if saved['root'] == self.root and set(self.filenames) <= set(saved['filenames']):
+                self.filenames = saved['filenames']
+                self.dirs = saved['dirs']
+        except (ValueError, KeyError, IOError, OSError) as e:
+            logging.warning("FileIndex: cannot load index %s - %s", self.indexfile, e)
+
+    def save(self):
+        """
+        Save index - failure to write is not an error
+        :return: True if saved
+        """
+        try:
+            if not access(self.indexdir, R_OK):
+                mkdir(self.indexdir)
+            with open(self.indexfile, 'w') as f:
+                json.dump({'root': self.root, 'filenames': self.filenames, 'dirs': self.dirs}, f)
+            return True
+        except (IOError, OSError) as e:
+            logging.warning("FileIndex: cannot save index %s - %s", self.indexfile, e)
+            return False
+
+    def addFilenames(self, filenames):
+        """
+        Add filenames to index - all directories are listed again on next refresh
+        :param filenames:
+        :return: True if any were added
+        """
+        with self.lock:
+            new = set(filenames) - set(self.filenames)
+            if len(new) > 0:
+                self.filenames = sorted(set(self.filenames) | new)
+                self.dirs = dict()
+            return len(new) > 0
+
+    def matches(self, name):
+        for filename in self.filenames:
+            if name.endswith(filename):
+                return True
+        return False
+
+    def refresh(self):
+        """
+        Walk directory tree - directories are only listed if changed since last walk
+        :return: number of directories listed
+        """
+        with self.lock:
+            dirs = dict()
+            listed = 0
+            stack = ['']
+            while len(stack) > 0:
+                rel = stack.pop()
+                path = join(self.root, rel) if len(rel) > 0 else self.root
+                try:
+                    mtime = stat(path).st_mtime_ns
+                    entry = self.dirs.get(rel)
+                    if entry is None or entry['mtime'] != mtime or self.__recent(entry):
+                        entry = self.__list(path, mtime)
+                        listed += 1
+                except OSError as e:
+                    logging.warning("FileIndex: cannot read directory %s - %s", path, e)
+                    continue
+                dirs[rel] = entry
+                stack += [join(rel, d) for d in entry['subdirs']]
+            changed = listed > 0 or len(dirs) != len(self.dirs)
+            self.dirs = dirs
+            if changed:
+                self.save()
+            logging.debug("FileIndex: %s - %d directories, %d listed", self.root, len(dirs), listed)
+            return listed
+
+    def __recent(self, entry):
+        """
+        Directory modified within mtime granularity of its listing - may have changed without a new mtime
+        """
+        return 'listed' not in entry or entry['mtime'] >= entry['listed'] - MTIME_GRANULARITY
+
+    def __list(self, path, mtime):
+        listed = int(time.time() * 10 ** 9)
+        files = []
+        subdirs = []
+        with scandir(path) as it:
+            for e in it:
+                if e.name.startswith('.'):
+                    continue
+                if e.is_dir():
+                    subdirs.append(e.name)
+                elif self.matches(e.name) and e.is_file():
+                    files.append(e.name)
+        return {'mtime': mtime, 'listed': listed, 'files': sorted(files), 'subdirs': sorted(subdirs)}
+
+    def find(self, filename, subdir=None, matchany=False):
+        """
+        Indexed files with filename
+        :param filename: filename (must be one of the indexed filenames)
+        :param subdir: only files below this directory
+        :param matchany: match files ending in filename
+        :return: sorted list of full path filenames
+        """
+        rtn = []
+        prefix = None
+        if subdir is not None and abspath(subdir) != self.root:
+            if not abspath(subdir).startswith(join(self.root, '')):
+                return rtn
+            prefix = abspath(subdir)[len(self.root) + 1:]
+        with self.lock:
+            for rel, entry in self.dirs.items():
+                if prefix is not None and rel != prefix and not rel.startswith(join(prefix, '')):
+                    continue
+                for name in entry['files']:
+                    if name == filename or (matchany and name.endswith(filename)):
+                        rtn.append(join(self.root, rel, name) if len(rel) > 0 else join(self.root, name))
+        return sorted(rtn)
+
+    def components(self, filename, base=None):
+        """
+        Directory names of file relative to root
+        :param filename: full path filename
+        :param base: directory to use instead of root
+        :return: list of directory names
+        """
+        base = abspath(base) if base is not None else self.root
+        return abspath(filename)[len(join(base, '')):].split(sep)[:-1]
+
+
+# Indexes in use by root directory
+_indexes = dict()
+_indexlock = threading.Lock()
+
+
+def getIndex(root, filenames):
+    """
+    Index covering root directory - an index of a parent directory is reused - refreshed before return
+    :param root: directory
+    :param filenames: filenames required in index
+    :return: FileIndex
+    """
+    root = abspath(root)
+    with _indexlock:
+        index = None
+        for r in sorted(_indexes.keys(), key=len):
+            if root == r or root.startswith(join(r, '')):
+                index = _indexes[r]
+                break
+        if index is None:
+            index = FileIndex(root, filenames)
+            _indexes[root] = index
+    index.addFilenames(filenames)
+    index.refresh()
+    return index
@@ -1,21 +1,20 @@
 import logging
 import threading
-from glob import iglob
+from copy import deepcopy
 from logging.handlers import RotatingFileHandler
-from multiprocessing import freeze_support, Pool
+from multiprocessing import freeze_support
 from os import access, R_OK, mkdir
-from os.path import join, dirname, exists, split, splitext, expanduser
+from os.path import join, expanduser
 
 import matplotlib.pyplot as plt
 import wx
 from configobj import ConfigObj
 import msdapp
-from msdapp.msd.batchCompareMSD import CompareMSD
-from msdapp.msd.batchHistogramStats import HistoStats
-from msdapp.msd.filterMSD import FilterMSD
-from msdapp.msd.histogramLogD import HistogramLogD
+from msdapp.msd.dataCache import fingerprint
 from msdapp.msd.msdStats import MSDStats
-from msdapp.msd.batchLogD import BatchLogd
+from msdapp.scheduler import StageScheduler
+from msdapp.workers import PROCESSES, CheckFilenames, runCells, filterCell, histogramCell, batchGroup, numWorkers, \
+    limitIndexCell
 
 # Required for dist?
 freeze_support()
@@ -55,25 +54,6 @@ class DataEvent(wx.PyEvent):
         self.data = data
 
 
-def CheckFilenames(filenames, configfiles):
-    """
-    Check that filenames are appropriate for the script required
-    :param filenames: list of full path filenames
-    :param configfiles: matching filename for script as in config
-    :return: filtered list
-    """
-    newfiles = []
-    for conf in configfiles:
-        for f in filenames:
-            parts = split(f)
-            if conf in parts[1]:
-                newfiles.append(f)
-            else:
-                # extract directory and seek files
-                newfiles = newfiles + [y for y in iglob(join(parts[0], '**', conf), recursive=True)]
-    return newfiles
-
-
 # #### LoggingConfig
 # logger = logging.getLogger()
 # logger.setLevel(logging.INFO)
@@ -90,23 +70,60 @@ def CheckFilenames(filenames, configfiles):
 
 ########################################################################
 
-lock = threading.Lock()
-event = threading.Event()
-hevent = threading.Event()
+class StageProgress():
+    """Combined progress of all tasks for one process (row) - tasks may run concurrently."""
+
+    def __init__(self, wxObject, row, processname, total, ntasks):
+        self.wxObject = wxObject
+        self.row = row
+        self.processname = processname
+        self.total = total
+        self.ntasks = ntasks
+        self.completed = 0
+        self.tasksdone = 0
+        self.lock = threading.Lock()
+
+    # ----------------------------------------------------------------------
+    def update(self, n=1):
+        """
+        Post progress to GUI as each cell or group completes
+        :param n: number completed
+        :return:
+        """
+        with self.lock:
+            self.completed += n
+            count = (self.completed * 100) / max(self.total, 1)
+            if count < 100:
+                wx.PostEvent(self.wxObject, ResultEvent((count, self.row, self.completed, self.total, self.processname)))
 
+    # ----------------------------------------------------------------------
+    def taskDone(self):
+        """
+        Post completion when all tasks of this process are finished
+        :return:
+        """
+        with self.lock:
+            self.tasksdone += 1
+            if self.tasksdone >= self.ntasks:
+                wx.PostEvent(self.wxObject, ResultEvent((100, self.row, self.completed, self.total, self.processname)))
 
+    # ----------------------------------------------------------------------
+    def error(self):
+        wx.PostEvent(self.wxObject, ResultEvent((-1, self.row, self.completed + 1, self.total, self.processname)))
+
+
+########################################################################
 class FilterThread(threading.Thread):
     """Multi Worker Thread Class."""
 
     # ----------------------------------------------------------------------
-    def __init__(self, controller, wxObject, filenames, filesin, type, row, processname):
+    def __init__(self, controller, progress, filenames, filesin, type, processname):
         """Init Worker Thread Class."""
         threading.Thread.__init__(self)
         self.controller = controller
-        self.wxObject = wxObject
+        self.progress = progress
         self.filenames = filenames
         self.filesIn = filesin
-        self.row = row
         self.type = type
         self.processname = processname
         logger = logging.getLogger(processname)
@@ -114,10 +131,7 @@ class FilterThread(threading.Thread):
 
     # ----------------------------------------------------------------------
     def run(self):
-        i = 0
         try:
-            event.set()
-            lock.acquire(True)
             # Do work
             q = dict()
             checkedfilenames = CheckFilenames(self.filenames, self.filesIn)
@@ -125,49 +139,27 @@ class FilterThread(threading.Thread):
             total_files = len(files)
             logger.info("Checked by type: (%s): \nFILES LOADED:%d\n%s", self.processname, total_files,
                         "\n\t".join(files))
-            for i in range(total_files):
-                count = ((i + 1) * 100) / total_files
-                logger.info("FilterThread.run: count= %d", count)
-                wx.PostEvent(self.wxObject, ResultEvent((count, self.row, i + 1, total_files, self.processname)))
-                self.processFilter(files[i], q)
-
-            wx.PostEvent(self.wxObject, ResultEvent((100, self.row, total_files, total_files, self.processname)))
+            tasks = [(self.controller.configfile, f, self.controller.datafile, self.controller.msdfile,
+                      self.controller.saveintermediate, self.controller.inmemory, self.controller.incremental)
+                     for f in files]
+            for (filename, results, outputs) in runCells(filterCell, tasks, self.controller.workers,
+                                                         lambda i, n: self.progress.update()):
+                q[filename] = results
+                if outputs is not None:
+                    self.controller.datastore.update(outputs)
+            self.progress.taskDone()
         except Exception as e:
-            wx.PostEvent(self.wxObject, ResultEvent((-1, self.row, i + 1, total_files, self.processname)))
-            logging.error(e)
+            self.progress.error()
+            logger.error(e)
+            # failed task - dependent tasks are skipped by scheduler
+            raise e
+            # failed task - dependent tasks are skipped by scheduler
+            raise e
         except KeyboardInterrupt:
             logger.warning("Keyboard interrupt in FilterThread")
             self.terminate()
         finally:
             logger.info('Finished FilterThread')
-            # self.terminate()
-            lock.release()
-            event.clear()
-
-    # ----------------------------------------------------------------------
-    def processFilter(self, filename, q):
-        """
-        Activate filter process - multithreaded
-        :param datafile:
-        :param q:
-        :return:
-        """
-        logger.info("Process Filter with file: %s", filename)
-        datafile_msd = filename.replace(self.controller.datafile, self.controller.msdfile)
-        # Check datafile_msd is accessible - can use txt instead of xls
-        if not access(datafile_msd, R_OK) and '.xls' in splitext(datafile_msd)[1]:
-            f1 = datafile_msd.replace(splitext(datafile_msd)[1], '.txt')
-            if access(f1, R_OK):
-                datafile_msd = f1
-        # create local subdir for output
-        outputdir = join(dirname(filename), 'processed')
-        if not exists(outputdir):
-            mkdir(outputdir)
-        fmsd = FilterMSD(self.controller.configfile, filename, datafile_msd, outputdir)
-        if fmsd.data is not None:
-            q[filename] = fmsd.runFilter()
-        else:
-            q[filename] = None
 
     # ----------------------------------------------------------------------
     def terminate(self):
@@ -180,14 +172,13 @@ class HistogramThread(threading.Thread):
     """Multi Worker Thread Class."""
 
     # ----------------------------------------------------------------------
-    def __init__(self, controller, wxObject, filenames, filesIn, type, row, processname,showplots):
+    def __init__(self, controller, progress, filenames, filesIn, type, processname, showplots):
         """Init Worker Thread Class."""
         threading.Thread.__init__(self)
         self.controller = controller
-        self.wxObject = wxObject
+        self.progress = progress
         self.filenames = filenames
         self.filesIn = filesIn
-        self.row = row
         self.type = type
         self.processname = processname
         self.showplots = showplots
@@ -196,32 +187,31 @@ class HistogramThread(threading.Thread):
     # ----------------------------------------------------------------------
     def run(self):
         try:
-            hevent.set()
-            lock.acquire(True)
             q = dict()
-            checkedfilenames = CheckFilenames(self.filenames, self.filesIn)
+            datastore = self.controller.datastore if self.controller.inmemory else None
+            checkedfilenames = CheckFilenames(self.filenames, self.filesIn, datastore)
             logger.info("Checked by type: (%s): \nFILES LOADED:\n%s", self.processname, "\n\t".join(checkedfilenames))
-            total_files = len(checkedfilenames)
-            for i in range(total_files):
-                count = (i + 1 / total_files) * 100
-                datafile = checkedfilenames[i]
-                logger.info("Process histogram with file: %s", datafile)
-                outputdir = dirname(datafile)
-                fd = HistogramLogD(datafile, configfile=self.controller.configfile, showplots=self.showplots)
-                q[datafile] = fd.generateHistogram(freq=0,outputdir=outputdir)
-                wx.PostEvent(self.wxObject, ResultEvent((count, self.row, i + 1, total_files, self.type)))
-
-            wx.PostEvent(self.wxObject, ResultEvent((100, self.row, total_files, total_files, self.processname)))
+            # plots cannot be shown from worker processes
+            showplots = self.showplots and numWorkers(self.controller.workers) <= 1
+            tasks = [(self.controller.configfile, f, datastore.get(f) if datastore is not None else None,
+                      showplots, self.controller.saveintermediate, self.controller.incremental)
+                     for f in checkedfilenames]
+            for (datafile, results, histdata) in runCells(histogramCell, tasks, self.controller.workers,
+                                                          lambda i, n: self.progress.update()):
+                q[datafile] = results
+                if datastore is not None and histdata is not None:
+                    datastore[results[0]] = histdata
+            self.progress.taskDone()
         except Exception as e:
-            wx.PostEvent(self.wxObject, ResultEvent((-1, self.row, total_files, total_files, self.processname)))
+            self.progress.error()
             logger.error(e)
+            # failed task - dependent tasks are skipped by scheduler
+            raise e
         except KeyboardInterrupt:
             logger.warning("Keyboard interrupt in HistogramThread")
             self.terminate()
         finally:
             logger.info('Finished HistogramThread')
-            lock.release()
-            hevent.clear()
 
     # ----------------------------------------------------------------------
     def terminate(self):
@@ -234,77 +224,60 @@ class BatchThread(threading.Thread):
     """Multi Worker Thread Class."""
 
     # ----------------------------------------------------------------------
-    def __init__(self, configfile, wxObject, filenames, filesIn, outputdir, expt, groups, type, row, processname, showplots, total, i, nolistfilter):
+    def __init__(self, configfile, progress, filenames, filesIn, outputdir, expt, groups, type, processname, showplots, nolistfilter, datastore=None, incremental=False):
         """Init Worker Thread Class."""
         threading.Thread.__init__(self)
         self.configfile = configfile
-        self.wxObject = wxObject
+        self.progress = progress
         self.filenames = filenames
         self.filesIn = filesIn
-        self.row = row
         self.type = type
         self.expt = expt
         self.groups = groups
         self.outputdir = outputdir
         self.processname = processname
         self.showplots = showplots
-        self.total = total
-        self.i = i
         self.nolistfilter = nolistfilter
+        self.datastore = datastore
+        self.incremental = incremental
         logger = logging.getLogger(processname)
 
     # ----------------------------------------------------------------------
     def run(self):
         try:
-            lock.acquire(True)
-            #total = len(self.groups)
-            checkedfilenames = CheckFilenames(self.filenames, self.filesIn)
+            checkedfilenames = CheckFilenames(self.filenames, self.filesIn, self.datastore)
             logger.info("Checked by type: (%s): \nFILES LOADED:\n%s", self.processname, "\n\t".join(checkedfilenames))
-            i = self.i
             group = ''
             fmsds = []
             for group in self.groups:
                 logger.info("Running %s script: %s (%s)", self.type.title(), self.expt, group)
-                if self.type == 'stats':
-                    fmsd = HistoStats(checkedfilenames, self.outputdir, group, self.expt, self.configfile,self.nolistfilter)
-                    compiledfile = fmsd.runStats()
-                    # Split to Mobile/immobile fractions - output
-                    ratiofile = fmsd.splitMobile()
-                    if self.showplots:
-                        fmsds.append(fmsd.showPlotly())
-                elif self.type == 'msd':
-                    fmsd = CompareMSD(checkedfilenames, self.outputdir, group, self.expt, self.configfile,self.nolistfilter)
-                    compiledfile = fmsd.compiledfile
-                    ratiofile = fmsd.calculateAreas()
-                    if self.showplots:
-                        fmsds.append(fmsd.showPlotly())
-                elif self.type == 'batchd':
-                    fmsd = BatchLogd(checkedfilenames, self.outputdir, group, self.expt, self.configfile,self.nolistfilter)
-                    fmsd.saveCompiled()
-                    compiledfile = fmsd.compiledfile
-                    ratiofile =''
-                else:
+                (compiledfile, ratiofile, plotfile) = batchGroup(self.type, checkedfilenames, self.outputdir, group,
+                                                                 self.expt, self.configfile, self.nolistfilter,
+                                                                 self.datastore, self.showplots, self.incremental)
+                if compiledfile is None:
                     continue
-
-                count = (i / self.total) * 100
-                wx.PostEvent(self.wxObject, ResultEvent((count, self.row, i, self.total, self.processname)))
+                if plotfile is not None:
+                    fmsds.append(plotfile)
+                self.progress.update()
                 logger.info("%s: %s: %s\nFILES CREATED:\n\t%s\n\t%s\n", self.processname,self.expt, group, compiledfile,ratiofile)
-                i += 1
 
-            wx.PostEvent(self.wxObject, ResultEvent((100, self.row, i - 1, self.total, self.processname)))
+            self.progress.taskDone()
             if self.showplots and len(fmsds) > 0:
                 group = ''
                 logger.info("%s: %s: %s\nPLOTS CREATED:\n\t%s\n", self.processname,self.expt, group, ("\n\t").join(fmsds))
         except Exception as e:
-            wx.PostEvent(self.wxObject, ResultEvent((-1, self.row, 2,2, self.processname)))
-            logging.error(e)
+            self.progress.error()
+            logger.error(e)
+            # failed task - dependent tasks are skipped by scheduler
+            raise e
+            # failed task - dependent tasks are skipped by scheduler
+            raise e
         except KeyboardInterrupt:
             logger.warning("Keyboard interrupt in BatchThread")
             self.terminate()
         finally:
             msg = 'Finished BatchThread: %s' % self.type.title()
             logger.info(msg)
-            lock.release()
 
     # ----------------------------------------------------------------------
     def terminate(self):
@@ -318,30 +291,13 @@ class BatchThread(threading.Thread):
 class MSDController():
     def __init__(self, configfile):
 
-        self.processes = [
-            {'caption': '1. Filter Data', 'href': 'filter',
-             'description': 'For each cell, generate log10 of diffusion coefficient, then filters between min and max range. MSD data is also filtered with corresponding rows.','ptype':'indiv',
-             'files': 'DATA_FILENAME, MSD_FILENAME',
-             'filesout': 'FILTERED_FILENAME, FILTERED_MSD'},
-            {'caption': '2. Generate Histograms', 'href': 'histogram',
-             'description': 'For each cell, generate relative frequency histograms of log10(D) data',
-             'files': 'FILTERED_FILENAME','ptype':'indiv',
-             'filesout': 'HISTOGRAM_FILENAME'},
-            {'caption': '2. Batch Log10(D)', 'href': 'batchd',
-             'description': 'Compiles all filtered log10(D) data',
-             'files': 'FILTERED_FILENAME', 'ptype': 'batch',
-             'filesout': 'BATCHD_FILENAME'},
-            {'caption': '3. Histogram Stats', 'href': 'stats',
-             'description': 'Compiles histogram data with descriptive statistics from all cells (batch) into one file per group in output directory',
-             'files': 'HISTOGRAM_FILENAME','ptype':'batch',
-             'filesout': 'ALLSTATS_FILENAME'},
-            {'caption': '4. Compile MSD', 'href': 'msd',
-             'description': 'Compiles MSD data with descriptive statistics from all cells (batch) into one file per group in output directory',
-             'files': 'FILTERED_MSD','ptype':'batch',
-             'filesout': 'AVGMSD_FILENAME'}
-        ]
+        self.processes = deepcopy(PROCESSES)
 
         self.configfile = configfile
+        # In-memory pipeline: filtered and histogram dataframes by output filename
+        self.datastore = dict()
+        # Tasks of the current run
+        self.scheduler = None
         self.loaded = self.loadConfig()
         self.logger = self.loadLogger()
 
@@ -408,13 +364,74 @@ class MSDController():
                 self.roi = config['GROUPBY_ROI']
             else:
                 self.roi = 0
+            # Pass data between processes in memory - intermediate files optional
+            if 'INMEMORY' in config:
+                self.inmemory = int(config['INMEMORY'])
+            else:
+                self.inmemory = 0
+            if 'SAVE_INTERMEDIATE' in config:
+                self.saveintermediate = int(config['SAVE_INTERMEDIATE'])
+            else:
+                self.saveintermediate = 1
+            if not self.inmemory:
+                self.saveintermediate = 1
+            # Number of worker processes for per-cell processes (0 for all cores)
+            # Only rebuild outputs when input files or config values have changed
+            if 'INCREMENTAL' in config:
+                self.incremental = int(config['INCREMENTAL'])
+            else:
+                self.incremental = 1
+            if 'WORKERS' in config:
+                self.workers = int(config['WORKERS'])
+            else:
+                self.workers = 1
             self.config = config
+            # Sorted log10D of cells for previews of filter limits - keyed on data files, depend on config
+            self.limitindexes = dict()
             rtn = True
 
         except:
             raise IOError
         return rtn
 
+    # ----------------------------------------------------------------------
+    def __limitKey(self, datafile):
+        """
+        Size and mtime of data files of a cell - a preview index is stale once a run rewrites these
+        :param datafile: D file of cell
+        :return: tuple of (size, mtime) or None for missing files
+        """
+        key = []
+        for f in [datafile, datafile.replace(self.datafile, self.msdfile)]:
+            try:
+                fp = fingerprint(f, hashed=False)
+                key.append((fp['size'], fp['mtime']))
+            except OSError:
+                key.append(None)
+        return tuple(key)
+
+    # ----------------------------------------------------------------------
+    def LimitCounts(self, filenames, minlimit, maxlimit):
+        """
+        Preview of filter limits - trajectories of all cells retained by limits (without running filter)
+        Sorted log10D of each cell is loaded again only if its data files changed (saved index or data files)
+        :param filenames: list of data files
+        :param minlimit: min log10D
+        :param maxlimit: max log10D
+        :return: (retained, total, number of cells)
+        """
+        files = [f for f in filenames if self.datafile in f]
+        keys = dict([(f, self.__limitKey(f)) for f in files])
+        tasks = [(self.config.filename, f, self.datafile, self.msdfile) for f in files
+                 if f not in self.limitindexes or self.limitindexes[f][0] != keys[f]]
+        for (f, index) in runCells(limitIndexCell, tasks, self.workers):
+            self.limitindexes[f] = (keys[f], index)
+        indexes = [self.limitindexes[f][1] for f in files
+                   if f in self.limitindexes and self.limitindexes[f][1] is not None]
+        retained = sum([int(index.count(minlimit, maxlimit)) for index in indexes])
+        total = sum([len(index) for index in indexes])
+        return (retained, total, len(indexes))
+
     # ----------------------------------------------------------------------
     def RunCompare(self, wxGui, indirs, outputdir, prefixes, searchtext):
         """
@@ -432,6 +449,21 @@ class MSDController():
             rs = MSDStats(indirs, outputdir, prefixes, self.configfile)
             results_df = rs.runTtests()
             logger.info("RunCompare results: %d files", len(results_df))
+            summary_df = rs.summarizeGroups()
+            if summary_df is not None:
+                summaryfile = join(outputdir, rs.summaryfilename)
+                summary_df.to_csv(summaryfile, index=False)
+                logger.info("RunCompare summary: %s", summaryfile)
+            bootstrap_df = rs.runBootstrap()
+            if bootstrap_df is not None:
+                bootstrapfile = join(outputdir, rs.bootstrapfilename)
+                bootstrap_df.to_csv(bootstrapfile, index=False)
+                logger.info("RunCompare bootstrap: %s", bootstrapfile)
+            comparisons_df = rs.runComparisons()
+            if comparisons_df is not None:
+                comparisonsfile = join(outputdir, rs.comparisonsfilename)
+                comparisons_df.to_csv(comparisonsfile, index=False)
+                logger.info("RunCompare comparisons: %s", comparisonsfile)
             wx.PostEvent(wxGui, DataEvent(results_df))
             # Show plots
             if len(searchtext) <= 0:
@@ -448,97 +480,87 @@ class MSDController():
     # ----------------------------------------------------------------------
     def RunProcess(self, wxGui, filenames, i, outputdir, expt, row, showplots=False):
         """
-        Instantiate Thread with type for Process
+        Submit tasks for Process to scheduler - each task starts when the processes producing its input files
+        have finished for the same group (or all cells)
         :param wxGui:
-        :param filenames:
-        :param type:
+        :param filenames: dict of filenames by group (with 'all') or list of filenames
+        :param i: index of process
         :param row:
         :return:
         """
         type = self.processes[i]['href']
         processname = self.processes[i]['caption']
         filesIn = [self.config[f] for f in self.processes[i]['files'].split(", ")]
+        datastore = self.datastore if self.inmemory else None
+        if self.scheduler is None:
+            self.startRun()
         logger.info("Running Threads - start: %s (Expt prefix: %s) [row: %d]", type, expt, row)
-        wx.PostEvent(wxGui, ResultEvent((0, row, 0, len(filenames), processname)))
-
-        if type == 'filter':
-            t = FilterThread(self, wxGui, filenames, filesIn, type, row, processname)
-            t.start()
-
-        elif type == 'histogram':
-            if row > 1:
-                event.wait()
-            t = HistogramThread(self, wxGui, filenames, filesIn, type, row, processname,showplots)
-            t.start()
-        elif type == 'stats':
-            if row > 2:
-                event.wait()
-            if row > 1:
-                hevent.wait()
-            #Allow for filenames already grouped - flag=True for no further filtering
-            groupflag = 0
-            total=len(filenames.keys())-1
-            for k in filenames.keys():
-                if k == 'all':
-                    continue
-                if len(filenames[k]) > 0:
-                    groupflag += 1
-                    t = BatchThread(self.configfile, wxGui, filenames[k], filesIn, outputdir, expt, [k], type, row, processname,showplots, total, groupflag, True)
-                    t.start()
-
-            #If no groups provided - use all
-            if not groupflag:
-                total = len([self.group1,self.group2])
-                t = BatchThread(self.configfile, wxGui, filenames, filesIn, outputdir, expt, [self.group1,self.group2], type, row, processname,showplots, total, groupflag+1, False)
-                t.start()
-
-        elif type == 'batchd':
-            if row > 1:
-                event.wait()
-            #Allow for filenames already grouped - flag=True for no further filtering
-            groupflag = 0
-            total=len(filenames.keys())-1
-            for k in filenames.keys():
-                if k == 'all':
-                    continue
-                if len(filenames[k]) > 0:
-                    groupflag += 1
-                    t = BatchThread(self.configfile, wxGui, filenames[k], filesIn, outputdir, expt, [k], type, row, processname,showplots, total, groupflag, True)
-                    t.start()
-
-            #If no groups provided - use all
-            if not groupflag:
-                total = len([self.group1,self.group2])
-                t = BatchThread(self.configfile, wxGui, filenames, filesIn, outputdir, expt, [self.group1,self.group2], type, row, processname,showplots, total, groupflag+1, False)
-                t.start()
-
-        elif type == 'msd':
-            if row > 1:
-                event.wait()
-            # Allow for filenames already grouped - flag=True for no further filtering
-            groupflag = 0
-            total = len(filenames.keys()) - 1
-            for k in filenames.keys():
-                if k == 'all':
+        # Allow for filenames already grouped
+        groups = []
+        if isinstance(filenames, dict):
+            groups = [k for k in filenames.keys() if k != 'all' and len(filenames[k]) > 0]
+
+        if self.processes[i]['ptype'] == 'indiv':
+            if isinstance(filenames, dict):
+                tasks = [(k, filenames[k]) for k in groups]
+                grouped = [f for k in groups for f in filenames[k]]
+                ungrouped = [f for f in filenames['all'] if f not in grouped]
+                if len(ungrouped) > 0 or len(tasks) == 0:
+                    tasks.append(('', ungrouped))
+            else:
+                tasks = [(None, filenames)]
+            total = sum([len(files) for (k, files) in tasks])
+            progress = StageProgress(wxGui, row, processname, total, len(tasks))
+            wx.PostEvent(wxGui, ResultEvent((0, row, 0, total, processname)))
+            for (k, files) in tasks:
+                if type == 'filter':
+                    t = FilterThread(self, progress, files, filesIn, type, processname)
+                elif type == 'histogram':
+                    t = HistogramThread(self, progress, files, filesIn, type, processname, showplots)
+                else:
                     continue
-                if len(filenames[k]) > 0:
-                    groupflag += 1
-                    t = BatchThread(self.configfile, wxGui, filenames[k], filesIn, outputdir, expt,
-                                  [k], type, row, processname, showplots, total, groupflag, True)
-                    t.start()
-
-            # If no groups provided - use all
-            if not groupflag:
-                total = len([self.group1, self.group2])
-                t = BatchThread(self.configfile, wxGui, filenames, filesIn, outputdir, expt, [self.group1, self.group2],
-                              type, row, processname, showplots, total, groupflag+1, False)
-                t.start()
+                self.scheduler.submit(type, k, t.run)
+        else:
+            if len(groups) > 0:
+                # flag=True for no further filtering
+                tasks = [(k, filenames[k], [k], True) for k in groups]
+                total = len(groups)
+            else:
+                # If no groups provided - use all
+                if isinstance(filenames, dict):
+                    filenames = filenames['all']
+                tasks = [(None, filenames, [self.group1, self.group2], False)]
+                total = 2
+            progress = StageProgress(wxGui, row, processname, total, len(tasks))
+            wx.PostEvent(wxGui, ResultEvent((0, row, 0, total, processname)))
+            for (k, files, batchgroups, nolistfilter) in tasks:
+                t = BatchThread(self.configfile, progress, files, filesIn, outputdir, expt, batchgroups, type,
+                                processname, showplots, nolistfilter, datastore, self.incremental)
+                self.scheduler.submit(type, k, t.run)
 
         logger.info("Running Thread - loaded: %s", type)
 
     # ----------------------------------------------------------------------
+    def startRun(self):
+        """
+        Start a new run - releases dataframes and limit indexes held from a previous run and resets the scheduler
+        :return:
+        """
+        self.clearStore()
+        # previews of filter limits are counted again from data written by this run
+        self.limitindexes = dict()
+        self.scheduler = StageScheduler(self.processes)
+
+    # ----------------------------------------------------------------------
 
 
+    def clearStore(self):
+        """
+        Release dataframes held from a previous run
+        :return:
+        """
+        self.datastore.clear()
+
     def shutdown(self):
         logger.info('Close extra thread')
         t = threading.current_thread()
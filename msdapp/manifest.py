@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+MSD Analysis: manifest
+Record of how output files were built - for incremental processing
+
+Each output directory has a manifest with an entry per process step:
+    processed
+        | -- .manifest.json      <-- {step: {inputs: [fingerprints], params: {config values}, outputs: [files], results}}
+        | -- Filtered_log10D.csv
+        | -- Histogram_log10D.csv
+
+A step is up to date when its outputs exist, the config values are unchanged
+and each input matches its fingerprint (see dataCache).
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import json
+import logging
+import threading
+from os import R_OK, access, replace
+from os.path import join, exists, abspath
+
+from msdapp.msd.dataCache import fingerprint, matchFingerprint
+
+# Batch processes for different groups share a manifest in the output directory
+_lock = threading.Lock()
+
+
+class Manifest():
+    def __init__(self, outputdir, filename='.manifest.json'):
+        self.manifestfile = join(outputdir, filename)
+        self.entries = self.__load()
+
+    def __load(self):
+        entries = dict()
+        if access(self.manifestfile, R_OK):
+            try:
+                with open(self.manifestfile, 'r') as f:
+                    entries = json.load(f)
+            except ValueError as e:
+                logging.warning("Manifest: corrupt file %s - %s", self.manifestfile, e)
+        return entries
+
+    def isCurrent(self, step, inputs, params):
+        """
+        Check outputs of step are up to date
+        :param step: name of step
+        :param inputs: list of input files
+        :param params: dict of config values used
+        :return: True if up to date
+        """
+        entry = self.entries.get(step)
+        if entry is None or entry['params'] != params:
+            return False
+        if sorted([abspath(f) for f in inputs]) != sorted([fp['path'] for fp in entry['inputs']]):
+            return False
+        if len(entry['outputs']) <= 0 or not all([exists(f) for f in entry['outputs']]):
+            return False
+        updated = False
+        try:
+            for i, cached in enumerate(entry['inputs']):
+                (match, fp) = matchFingerprint(cached['path'], cached)
+                if not match:
+                    return False
+                if fp is not None:
+                    entry['inputs'][i] = fp
+                    updated = True
+        except OSError:
+            return False
+        if updated:
+            self.__saveEntry(step, entry)
+        return True
+
+    def results(self, step):
+        """
+        Saved results of step
+        :param step:
+        :return: results or None
+        """
+        entry = self.entries.get(step)
+        return entry.get('results') if entry is not None else None
+
+    def update(self, step, inputs, params, outputs, results=None):
+        """
+        Record step after outputs are written
+        :param step: name of step
+        :param inputs: list of input files
+        :param params: dict of config values used
+        :param outputs: list of output files
+        :param results: return values of step (json serializable)
+        :return: True if saved
+        """
+        try:
+            # inputs already recorded by any step are not hashed again if unchanged
+            known = [fp for e in self.entries.values() if e is not None for fp in e.get('inputs', [])]
+            entry = {'inputs': [fingerprint(f, known=known) for f in inputs], 'params': params,
+                     'outputs': [abspath(f) for f in outputs], 'results': results}
+        except OSError as e:
+            logging.warning("Manifest: cannot fingerprint inputs for %s - %s", step, e)
+            entry = None
+        return self.__saveEntry(step, entry)
+
+    def remove(self, step):
+        return self.__saveEntry(step, None)
+
+    def __saveEntry(self, step, entry):
+        """
+        Save entry (or remove if None) - merged with saved manifest - failure to write is not an error
+        :return: True if saved
+        """
+        with _lock:
+            self.entries = self.__load()
+            if entry is not None:
+                self.entries[step] = entry
+            else:
+                self.entries.pop(step, None)
+            try:
+                tmpfile = self.manifestfile + '.tmp'
+                with open(tmpfile, 'w') as f:
+                    json.dump(self.entries, f, indent=2)
+                replace(tmpfile, self.manifestfile)
+                return True
+            except (IOError, OSError) as e:
+                logging.warning("Manifest: cannot save %s - %s", self.manifestfile, e)
+                return False
+
+
+def configParams(config, fields):
+    """
+    Config values used by a step
+    :param config: ConfigObj or dict
+    :param fields: list of config fields
+    :return: dict
+    """
+    return dict([(f, config[f]) for f in fields if f in config])
@@ -14,6 +14,11 @@ Analysis per run (prefix):
       1. All cells data with Mean, SEM, Count, STD per timepoint - appended to compiled file
       2. Overlay MSD vs timepoints -> Calculate Area Under Curve -> add to file
       3. Plot Avg MSD with SD
+      4. Area under curve per trajectory (with TRAJECTORY_AUC = 1 in config) - saved to
+         <prefix>_trajectory_areas.npz as an array per cell ID
+      5. Accumulators per cell (as saved by filter with each Filtered_MSD.csv), of all traces (POOLED) and of
+         cell means (CELLMEANS) - saved to <prefix>_MSD_accumulators.json for merging with other groups
+         (see statsAccumulator).  Cell files are still read for the compiled table (exact medians).
 (Data files encoded in ISO-8859-1)
 
 
@@ -29,22 +34,36 @@ from os.path import join
 
 import matplotlib.pyplot as plt
 import pandas as pd
-from numpy import sqrt, trapz, nan
+from numpy import nan, full, repeat, float32, savez
 from plotly import offline
 from plotly.graph_objs import Layout, Scatter
 
-from msdapp.msd.batchStats import BatchStats
+from msdapp.msd.batchStats import BatchStats, rowStats
+from msdapp.msd.statsAccumulator import StatsAccumulator, mergeAccumulators, saveAccumulators, loadCellAccumulator
+
+
+def trapezoid(y, dx):
+    """
+    Area under curves by trapezoidal rule (as numpy trapz) - NaN if any point is NaN
+    :param y: numpy array curves x points (or one curve)
+    :param dx: spacing of points
+    :return: area per curve
+    """
+    return (dx * (y[..., 1:] + y[..., :-1]) / 2.0).sum(axis=-1)
 
 
 class CompareMSD(BatchStats):
-    def __init__(self, *args):
+    def __init__(self, *args, **kwargs):
         self.datafield = 'FILTERED_MSD'
-        super().__init__(*args)
+        self.trajectoryauc = 0
+        super().__init__(*args, **kwargs)
         if self.config is not None:
             self.datafile = self.config['FILTERED_MSD']
             self.outputfile = self.config['AVGMSD_FILENAME']
             self.msdpoints = int(self.config['MSD_POINTS'])
             self.timeint = float(self.config['TIME_INTERVAL'])
+            if 'TRAJECTORY_AUC' in self.config:
+                self.trajectoryauc = int(self.config['TRAJECTORY_AUC'])
             print("MSD: Config file loaded")
         else:  # defaults
             self.outputfile = 'Avg_MSD.csv'
@@ -54,77 +73,77 @@ class CompareMSD(BatchStats):
             print("MSD: Using config defaults")
 
         self.compiledfile = join(self.outputdir, self.searchtext + "_" + self.outputfile)
+        self.accumulatorfile = join(self.outputdir, self.searchtext + "_MSD_accumulators.json")
+        self.accumulators = OrderedDict()
+        self.areasfile = join(self.outputdir, self.searchtext + "_trajectory_areas.npz")
+        self.trajectoryareas = OrderedDict()
         self.compiled = self.__compile()
         self.saveCompiled()
 
     def __compile(self):
+        """
+        Mean, Std, SEM, Count, Median per timepoint for each cell then of cell means for ALL cells
+        :return: dataframe with rows per cell and stat
+        """
         try:
             # Compile all selected files
             timepoints = [str(x) for x in range(1, self.msdpoints + 1)]
-            cols = ['Cell', 'Stats'] + timepoints
-            data = pd.DataFrame(columns=cols, dtype=float)
-            ctr = 0
-
-            for f in self.inputfiles:
-                df = pd.read_csv(f)
-                cell = self.generateID(f)
-                stats = OrderedDict({'avgs': [cell, 'Mean'],
-                                     'stds': [cell, 'Std'],
-                                     'sems': [cell, 'SEM'],
-                                     'counts': [cell, 'Count'],
-                                     'medians': [cell, 'Median']})
-
-                for i in timepoints:
-                    stats['avgs'].append(df[i].mean())
-                    stats['counts'].append(df[i].count())
-                    stats['stds'].append(df[i].std())
-                    stats['sems'].append(df[i].std() / sqrt(df[i].count()))
-                    stats['medians'].append(df[i].median())
-
-                for key in stats.keys():
-                    data.loc[ctr] = stats[key]
-                    ctr += 1
-
-            #blank line
-            ctr += 1
-            data.loc[ctr] =['' for i in range(0, len(cols))]
+            cellstats = ['Mean', 'Std', 'SEM', 'Count', 'Median']
+            allstats = ['Mean', 'Count', 'Std', 'SEM', 'Median']
+            fields = {'Mean': 'MEAN', 'Std': 'STD', 'SEM': 'SEM', 'Count': 'COUNT', 'Median': 'MEDIAN'}
+            nstats = len(cellstats)
+            table = full((nstats * (self.numcells + 1), self.msdpoints), nan)
+            cells = []
+            for (n, f) in enumerate(self.inputfiles):
+                df = self.loadFile(f)
+                cells.append(self.generateID(f))
+                values = df[timepoints].values.astype(float)
+                self.accumulators[cells[-1]] = self.cellAccumulator(f, values)
+                if self.trajectoryauc:
+                    self.trajectoryareas[cells[-1]] = trapezoid(values, self.timeint).astype(float32)
+                # timepoints x traces
+                stats = rowStats(values.T, median=True)
+                for (j, stat) in enumerate(cellstats):
+                    table[n * nstats + j] = stats[fields[stat]]
             # Calculate mean,std,sem,count,median of Cell Means
-            cell = 'ALL'
-            stats = OrderedDict({'avgs': [cell, 'Mean'],
-                                 'counts': [cell, 'Count'],
-                                 'stds': [cell, 'Std'],
-                                 'sems': [cell, 'SEM'],
-                                 'medians': [cell, 'Median']})
-            for i in timepoints:
-                coldata = data[data['Stats']=='Mean'][i]
-                dmean = coldata.mean()
-                dcount =coldata.count()
-                std = coldata.std()
-                sem = std/sqrt(dcount)
-                median = coldata.median()
-
-                stats['avgs'].append(dmean)
-                stats['counts'].append(dcount)
-                stats['stds'].append(std)
-                stats['sems'].append(sem)
-                stats['medians'].append(median)
-
-            for key in ['avgs', 'counts', 'stds', 'sems', 'medians']:
-                data.loc[ctr] = stats[key]
-                ctr += 1
-            #data.replace(nan,'', inplace=True)
+            means = table[0:nstats * self.numcells:nstats]
+            stats = rowStats(means.T, median=True)
+            for (j, stat) in enumerate(allstats):
+                table[nstats * self.numcells + j] = stats[fields[stat]]
+            data = pd.DataFrame(table, columns=timepoints)
+            data.insert(0, 'Stats', cellstats * self.numcells + allstats)
+            data.insert(0, 'Cell', repeat(cells + ['ALL'], nstats))
+            # Group accumulators from cells
+            self.accumulators['POOLED'] = mergeAccumulators(list(self.accumulators.values()))
+            self.accumulators['CELLMEANS'] = StatsAccumulator(self.msdpoints, sketch=self.sketch).add(means)
             return data
-
-            # Sort by Stats
-            df1 = data.sort_values(by=['Stats', 'Cell'])
-            return df1
         except Exception as e:
             raise e
 
+    def cellAccumulator(self, f, values):
+        """
+        Accumulator of cell emitted by filter (saved with file) - from values if not saved or data in memory
+        :param f: filtered MSD file
+        :param values: traces x timepoints
+        :return: StatsAccumulator
+        """
+        acc = None
+        if f not in self.datastore:
+            acc = loadCellAccumulator(f, [str(x) for x in range(1, self.msdpoints + 1)])
+        if acc is None:
+            acc = StatsAccumulator(self.msdpoints, sketch=self.sketch).add(values)
+        return acc
+
     def saveCompiled(self):
         if not self.compiled.empty:
             self.compiled.to_csv(self.compiledfile, index=False)
             logging.info("BatchMSD: Data saved to " + self.compiledfile)
+            if self.accumulators.get('POOLED') is not None:
+                timepoints = [str(x) for x in range(1, self.msdpoints + 1)]
+                saveAccumulators(self.accumulatorfile, timepoints, self.accumulators)
+            if len(self.trajectoryareas) > 0:
+                savez(self.areasfile, **self.trajectoryareas)
+                logging.info("BatchMSD: Trajectory areas saved to " + self.areasfile)
 
     def calculateAreas(self):
         print('Calculating Area under curve of MSDs')
@@ -132,16 +151,11 @@ class CompareMSD(BatchStats):
         if self.compiled is not None:
             df = self.compiled
             means = df.groupby('Stats').get_group('Mean')
-            #sems = df.groupby('Stats').get_group('SEM')
             x = [str(x) for x in range(1, self.msdpoints + 1)]
-            xi = [x * self.timeint for x in range(1, self.msdpoints + 1)]
-            labels = []
-            areas = []
-            for ctr in range(0, len(means)):
-                labels.append(means['Cell'].iloc[ctr])
-                areas.append(trapz(means[x].iloc[ctr], dx=self.timeint))
+            # all cells (and ALL) at once
+            areas = trapezoid(means[x].values.astype(float), self.timeint)
             # save areas to new file
-            df_area = pd.DataFrame({'Cell': labels, 'MSD Area': areas}, columns=['Cell', 'MSD Area'])
+            df_area = pd.DataFrame({'Cell': means['Cell'].values, 'MSD Area': areas}, columns=['Cell', 'MSD Area'])
             df_area.to_csv(areasfile, index=False)
             print('Areas under curve calculated: %s', areasfile)
         return areasfile
@@ -12,7 +12,13 @@ and compiles to top level as <prefix>_AllHistogram_log10D.csv where prefix can b
 
 Analysis per run (prefix):
       1. All cells data with Mean, SEM, Count, STD, Sum per bin - appended to compiled file
+         (and Median, IQR, Min, Max with EXTRA_STATS = 1 in config)
       2. Immobile, Mobile, Ratio per cell
+      3. Accumulator of cells per bin (CELLS, merged from the accumulator saved with each histogram) - saved to
+         <prefix>_Histogram_accumulators.json for merging with other groups (see statsAccumulator)
+      4. Immobile, Mobile, Ratio per cell for a range of thresholds - with THRESHOLD_SWEEP in config as
+         start:stop:step (eg -3:0:0.1) or a list of thresholds (eg -2.0, -1.6, -1.2)
+Alpha histograms (ALPHA_HISTOGRAM, see fitMSD) are compiled with stats (1, 3) to <prefix>_<ALLSTATS_ALPHA>
 
 Plots:
     1. Overlaid histogram plot of each cell with threshold line
@@ -26,26 +32,43 @@ Created on Sep 8 2017
 
 import argparse
 import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from os.path import join
 
 import matplotlib.pyplot as plt
 import pandas as pd
 # import numpy as np
-from numpy import sqrt, round
+from numpy import round, column_stack, full, nan, allclose, isnan, errstate, where, argsort, searchsorted, \
+    zeros, vstack, repeat, tile, asarray
 from plotly import offline
 from plotly.graph_objs import Layout, Scatter
 
-from msdapp.msd.batchStats import BatchStats
+from msdapp.msd.batchStats import BatchStats, rowStats
+from msdapp.msd.statsAccumulator import StatsAccumulator, saveAccumulators, mergeAccumulators, loadCellAccumulator
+from msdapp.utils import sweepThresholds
 
 
 class HistoStats(BatchStats):
-    def __init__(self, *args):
-        self.datafield = 'HISTOGRAM_FILENAME'
-        super().__init__(*args)
+    def __init__(self, *args, histograms=None, alpha=False, **kwargs):
+        """
+        :param histograms: HistogramMatrix of cells (from HistogramLogD.batch) - used instead of histogram files
+        :param alpha: compile alpha histograms (ALPHA_HISTOGRAM to ALLSTATS_ALPHA) instead of log10D
+        """
+        self.datafield = 'ALPHA_HISTOGRAM' if alpha else 'HISTOGRAM_FILENAME'
+        self.histograms = histograms
+        self.extrastats = 0
+        self.thresholds = None
+        self.cells = []
+        super().__init__(*args, **kwargs)
         if self.config is not None:
             # self.datafile = self.config['HISTOGRAM_FILENAME']
             self.threshold = float(self.config['THRESHOLD'])
-            self.outputfile = self.config['ALLSTATS_FILENAME']
+            self.outputfile = self.config['ALLSTATS_ALPHA' if alpha else 'ALLSTATS_FILENAME']
+            if 'EXTRA_STATS' in self.config:
+                self.extrastats = int(self.config['EXTRA_STATS'])
+            if 'THRESHOLD_SWEEP' in self.config and not alpha:
+                self.thresholds = sweepThresholds(self.config['THRESHOLD_SWEEP'])
             print("BatchHisto: Config file loaded")
         else:  # defaults
             self.outputfile = 'AllHistogram_log10D.csv'
@@ -54,42 +77,53 @@ class HistoStats(BatchStats):
             print("BatchHisto: Using config defaults")
 
         self.compiledfile = join(self.outputdir, self.searchtext + "_" + self.outputfile)
+        self.accumulatorfile = join(self.outputdir, self.searchtext + ("_Histogram_alpha_accumulators.json" if alpha
+                                                                       else "_Histogram_accumulators.json"))
         self.compiled = self.__compile()
 
     def __compile(self):
         """
-        Reads all inputfiles from inputdir, appends data into single dataframe
+        Reads all inputfiles (in parallel) into a bins x cells matrix - bins must match in all files
         :return: dataframe
         """
         try:
             # Compile all selected files
             logging.info("BatchHisto: Compiling %d files" % self.numcells)
-            c = pd.DataFrame()
-            # base = self.base.split(sep)
-            suffixes = ['bins']
-            for f in self.inputfiles:
-                df = pd.read_csv(f)
-                cell = self.generateID(f)
-                suffixes.append(cell)
-                if c.empty:
-                    c = df
-                else:
-                    try:
-                        c = pd.concat([c, df.iloc[:, 1:]], axis=1)
-                    except ValueError as e:
-                        print(e)
-                        raise Exception(e)
-            if not c.empty:
-                suffixes = self.deduplicate(suffixes)
-                c.columns = suffixes
-                logging.info("BatchHisto: Compiled %d files" % self.numcells)
-            else:
+            if self.histograms is not None and all([f in self.histograms.rows for f in self.inputfiles]):
+                return self.__compileMatrix()
+            if self.numcells <= 0:
                 logging.error("BatchHisto: Unable to compile files to: %s" % self.compiledfile)
+                return pd.DataFrame()
+            with ThreadPoolExecutor() as pool:
+                frames = list(pool.map(self.loadFile, self.inputfiles))
+            bins = frames[0].values[:, 0]
+            matrix = full((len(bins), self.numcells), nan)
+            for i, (f, df) in enumerate(zip(self.inputfiles, frames)):
+                values = df.values
+                if len(values) != len(bins) or not allclose(values[:, 0], bins):
+                    raise ValueError("Histogram bins do not match other cells: %s" % f)
+                matrix[:, i] = values[:, 1]
+            cells = self.deduplicate(['bins'] + [self.generateID(f) for f in self.inputfiles])
+            c = pd.DataFrame(column_stack([bins, matrix]), columns=cells)
+            self.cells = cells[1:]
+            logging.info("BatchHisto: Compiled %d files" % self.numcells)
             return c
         except Exception as e:
             msg = "Error: in BatchHisto compile process - %s" % e
             raise IOError(msg)
 
+    def __compileMatrix(self):
+        """
+        Compile from histogram matrix of all cells
+        :return: dataframe
+        """
+        rows = [self.histograms.rows[f] for f in self.inputfiles]
+        cells = self.deduplicate(['bins'] + [self.generateID(f) for f in self.inputfiles])
+        c = pd.DataFrame(column_stack([self.histograms.bins, self.histograms.freqs[rows].T]), columns=cells)
+        self.cells = cells[1:]
+        logging.info("BatchHisto: Compiled %d cells from histogram matrix" % self.numcells)
+        return c
+
     def saveCompiled(self):
         if not self.compiled.empty:
             self.compiled.to_csv(self.compiledfile, index=False)
@@ -97,25 +131,36 @@ class HistoStats(BatchStats):
 
     def runStats(self):
         """
-        Generates statistics for compiled data and appends columns for mean, count, std,sem and sum.  Outputs file to compiledfilename (will overwrite compile function)
+        Generates statistics for compiled data and appends columns for mean, sem, count, std and sum (plus median, iqr,
+        min, max if EXTRA_STATS in config).  Outputs file to compiledfilename (will overwrite compile function)
         :return: compiledfilename
         """
         print("Running stats")
         df = self.compiled
-        # Calculate stats
-        n = self.numcells + 1
-        df['MEAN'] = df.apply(lambda x: (x[1:n].mean()), axis=1)
-        df['COUNT'] = df.apply(lambda x: (x[1:n].count()), axis=1)
-        df['STD'] = df.apply(lambda x: (x[1:n].std()), axis=1)
-        df['SEM'] = df.apply(lambda x: (x.loc['STD'] / sqrt(x.loc['COUNT'])), axis=1)
-        df['SUM'] = df.apply(lambda x: (x[1:n].sum()), axis=1)
-        # reorder ORDER: mean,sem,count,std,sum
-        cols = df.columns[0:n].tolist() + ['MEAN', 'SEM', 'COUNT', 'STD', 'SUM']
-        df = df.reindex_axis(cols, axis=1)
+        # Calculate stats in one pass over cells matrix - ORDER: mean,sem,count,std,sum
+        for (field, values) in rowStats(df[self.cells].values, self.extrastats).items():
+            df[field] = values
         self.compiled = df
         self.saveCompiled()
+        if len(self.cells) > 0:
+            saveAccumulators(self.accumulatorfile, df['bins'].tolist(),
+                             OrderedDict([('CELLS', self.cellsAccumulator())]))
         return self.compiledfile
 
+    def cellsAccumulator(self):
+        """
+        Accumulator of cells per bin - merged from accumulators saved by histogram with each file, or from compiled
+        data if not saved or data in memory
+        :return: StatsAccumulator
+        """
+        bins = self.compiled['bins'].tolist()
+        accumulators = []
+        if self.histograms is None:
+            accumulators = [loadCellAccumulator(f, bins) for f in self.inputfiles if f not in self.datastore]
+        if len(accumulators) == len(self.inputfiles) and all([a is not None for a in accumulators]):
+            return mergeAccumulators(accumulators)
+        return StatsAccumulator(len(bins), sketch=self.sketch).add(self.compiled[self.cells].values.T)
+
     def splitMobile(self):
         """
         Calculates total number * bins below and above (incl) threshold.  Outputs to new file _ratios.csv
@@ -123,8 +168,7 @@ class HistoStats(BatchStats):
         """
         print("Split mobile and immobile fractions")
         df = self.compiled
-        n = len(df.columns)
-        labels = df.columns[1:n - 5].tolist()
+        labels = list(self.cells)
         immobile = []
         mobile = []
         ratiofile = None
@@ -147,6 +191,40 @@ class HistoStats(BatchStats):
             raise e
         return ratiofile
 
+    def sweepMobile(self, thresholds=None):
+        """
+        Immobile, Mobile and Ratio per cell at each threshold (as splitMobile) from cumulative sums over bins.
+        Outputs to new file _ratios_sweep.csv with one row per threshold and cell
+        :param thresholds: list of thresholds (default THRESHOLD_SWEEP from config)
+        :return: sweepfilename or None if no thresholds
+        """
+        if thresholds is None:
+            thresholds = self.thresholds
+        if thresholds is None or len(thresholds) <= 0:
+            return None
+        print("Sweep mobile and immobile fractions over %d thresholds" % len(thresholds))
+        df = self.compiled
+        order = argsort(df['bins'].values, kind='stable')
+        bins = df['bins'].values[order]
+        matrix = df[self.cells].values[order]
+        matrix = where(isnan(matrix), 0.0, matrix)
+        # sums of bins below (immobile) and from (mobile) each bin position
+        below = vstack([zeros((1, len(self.cells))), matrix.cumsum(axis=0)])
+        above = vstack([matrix[::-1].cumsum(axis=0)[::-1], zeros((1, len(self.cells)))])
+        thresholds = asarray(thresholds, dtype=float)
+        k = searchsorted(bins, thresholds, side='left')
+        immobile = below[k].ravel()
+        mobile = above[k].ravel()
+        with errstate(invalid='ignore', divide='ignore'):
+            ratio = mobile / immobile
+        df_results = pd.DataFrame({'Threshold': repeat(thresholds, len(self.cells)),
+                                   'Cell': tile(self.cells, len(thresholds)),
+                                   'Immobile': immobile, 'Mobile': mobile, 'Ratio': ratio})
+        sweepfile = join(self.outputdir, self.searchtext + "_ratios_sweep.csv")
+        df_results.to_csv(sweepfile, index=False)
+        print("Output threshold sweep:", sweepfile)
+        return sweepfile
+
     def showPlots(self, ax=None):
         """
         Show overlay of all histograms avg + sem
@@ -266,6 +344,7 @@ if __name__ == "__main__":
         fmsd.runStats()
         # Split to Mobile/immobile fractions - output
         fmsd.splitMobile()
+        fmsd.sweepMobile()
         # Set the figure
         fig = plt.figure(figsize=(10, 5))
         axes1 = plt.subplot(121)
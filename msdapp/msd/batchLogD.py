@@ -31,9 +31,9 @@ from msdapp.msd.batchStats import BatchStats
 
 
 class BatchLogd(BatchStats):
-    def __init__(self, *args):
+    def __init__(self, *args, **kwargs):
         self.datafield = 'FILTERED_FILENAME'
-        super().__init__(*args)
+        super().__init__(*args, **kwargs)
         if self.config is not None:
             if 'BATCHD_FILENAME' in self.config:
                 self.outputfile = self.config['BATCHD_FILENAME']
@@ -60,7 +60,7 @@ class BatchLogd(BatchStats):
             logging.info("BatchLogD: Compiling %d files" % self.numcells)
             batchfile={}
             for f in self.inputfiles:
-                df = pd.read_csv(f)
+                df = self.loadFile(f)
                 cell = self.generateID(f) #TODO add ROI to ID
                 #create dict
                 batchfile[cell] = df[self.logcol]
@@ -17,17 +17,55 @@ Created on Sep 8 2017
 
 import logging
 import re
-from glob import iglob
+from collections import OrderedDict
 from os import R_OK, access
-from os.path import join, isdir, commonpath, sep
+from os.path import isdir, commonpath, sep
 
+import pandas as pd
 from configobj import ConfigObj
-from numpy import unique
+from numpy import unique, isnan, nansum, nanmin, nanmax, nanpercentile, errstate, where, sqrt, nan
+
+from msdapp.fileindex import getIndex
+
+
+def rowStats(matrix, extra=False, median=False):
+    """
+    Summary statistics per row of a matrix (eg bins x cells) - NaN values are ignored (as with pandas)
+    :param matrix: numpy array
+    :param extra: also calculate MEDIAN, IQR, MIN, MAX
+    :param median: also calculate MEDIAN
+    :return: OrderedDict of field: array per row (MEAN, SEM, COUNT, STD, SUM)
+    """
+    valid = ~isnan(matrix)
+    count = valid.sum(axis=1)
+    total = nansum(matrix, axis=1)
+    with errstate(invalid='ignore', divide='ignore'):
+        mean = total / where(count > 0, count, nan)
+        dev = where(valid, matrix - mean[:, None], 0.0)
+        std = sqrt((dev * dev).sum(axis=1) / where(count > 1, count - 1, nan))
+        sem = std / sqrt(count)
+    stats = OrderedDict([('MEAN', mean), ('SEM', sem), ('COUNT', count), ('STD', std), ('SUM', total)])
+    if extra or median:
+        empty = count <= 0
+        if empty.any():
+            # nan-reductions warn on rows with no values - results are NaN as for pandas
+            matrix = where(empty[:, None], 0.0, matrix)
+        if extra:
+            (q1, q2, q3) = nanpercentile(matrix, [25, 50, 75], axis=1)
+            stats['MEDIAN'] = where(empty, nan, q2)
+            stats['IQR'] = where(empty, nan, q3 - q1)
+            stats['MIN'] = where(empty, nan, nanmin(matrix, axis=1))
+            stats['MAX'] = where(empty, nan, nanmax(matrix, axis=1))
+        else:
+            stats['MEDIAN'] = where(empty, nan, nanpercentile(matrix, 50, axis=1))
+    return stats
 
 
 class BatchStats:
-    def __init__(self, inputfiles, outputdir, prefix, expt, configfile=None, nolistfilter=False):
+    def __init__(self, inputfiles, outputdir, prefix, expt, configfile=None, nolistfilter=False, datastore=None):
         self.encoding = 'ISO-8859-1'
+        # dataframes already in memory by filename - these files are not read
+        self.datastore = datastore if datastore is not None else dict()
         self.__loadConfig(configfile)
         if self.config is not None and self.datafield is not None:
             self.datafile = self.config[self.datafield]
@@ -50,6 +88,8 @@ class BatchStats:
             if configfile is not None and access(configfile, R_OK):
                 config = ConfigObj(configfile, encoding=self.encoding)
                 self.config = config
+                # quantile sketch (approximate medians) in accumulators - off by default
+                self.sketch = int(config['QUANTILE_SKETCH']) if 'QUANTILE_SKETCH' in config else 0
                 if 'GROUPBY_ROI' in config.keys():
                     self.roi = int(self.config['GROUPBY_ROI'])
                     msg = "Batch: Config file loaded. Group by ROIs: %d" % self.roi
@@ -59,6 +99,7 @@ class BatchStats:
             else:
                 self.config = None
                 self.roi = 0
+                self.sketch = 0
                 logging.warning("Batch: NO Config file loaded")
 
         except:
@@ -97,13 +138,14 @@ class BatchStats:
         if not isinstance(inputdir, list) and isdir(inputdir):
             base = inputdir
             if access(inputdir, R_OK):
-                allfiles = [y for y in iglob(join(inputdir, '**', datafile), recursive=True)]
+                index = getIndex(inputdir, [datafile])
+                allfiles = index.find(datafile, inputdir)
                 if len(allfiles) > 0:
                     # Filter on searchtext - single word in directory path
                     files = [f for f in allfiles if re.search(searchtext, f, flags=re.IGNORECASE)]
                     if len(files) <= 0:
                         # try separate expt and prefix - case insensitive on windows but ?mac
-                        allfiles = [y for y in iglob(join(base, '**', prefix, '**', datafile), recursive=True)]
+                        allfiles = [f for f in allfiles if prefix in index.components(f, base)]
                         files = [f for f in allfiles if re.search(expt, f, flags=re.IGNORECASE)]
                     if len(files) <= 0:
                         # try uppercase directory name
@@ -138,6 +180,16 @@ class BatchStats:
 
         return (base, files)
 
+    def loadFile(self, f):
+        """
+        Load input file as dataframe - from datastore if available
+        :param f: filename
+        :return: dataframe
+        """
+        if f in self.datastore:
+            return self.datastore[f]
+        return pd.read_csv(f)
+
     def generateID(self, f):
         # Generate unique cell ID
         cells = f.split(sep)
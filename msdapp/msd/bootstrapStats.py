@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+MSD Analysis: bootstrapStats
+Bootstrap confidence intervals of group statistics by resampling cells with replacement.
+
+All resamples are drawn at once as an index matrix (resamples x cells) which is reduced to counts of
+each cell per resample - the mean of every field (eg each lag of the MSD curve) in every resample
+is then a single matrix product:
+
+    means = counts . values / counts . valid        (resamples x fields, NaN values are excluded)
+
+Resamples are drawn in fixed chunks with a seed per group and chunk so results do not depend on the number
+of worker processes. Tables of a group with the same number of cells (eg MSD curves and MSD areas) are
+resampled with the same index matrix, while groups are resampled independently (also with equal numbers of
+cells) as CIs of group differences require.
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import logging
+
+from numpy import arange, bincount, zeros, where, isnan, nan, errstate, nanpercentile, concatenate, asarray
+from numpy.random import RandomState
+
+# Resamples per chunk (and per task with worker processes)
+BOOTSTRAP_CHUNK = 1000
+
+
+def resampleIndex(ncells, nboot, seed=None):
+    """
+    Index matrix of cells drawn with replacement
+    :param ncells: number of cells
+    :param nboot: number of resamples
+    :param seed: random seed (int or sequence of ints)
+    :return: numpy array nboot x ncells
+    """
+    return RandomState(seed).randint(0, ncells, size=(nboot, ncells))
+
+
+def resampleCounts(index, ncells):
+    """
+    Number of times each cell is drawn in each resample
+    :param index: index matrix from resampleIndex
+    :param ncells: number of cells
+    :return: numpy array nboot x ncells
+    """
+    nboot = index.shape[0]
+    offsets = index + (arange(nboot) * ncells)[:, None]
+    return bincount(offsets.ravel(), minlength=nboot * ncells).reshape(nboot, ncells)
+
+
+def resampledMeans(values, counts):
+    """
+    Mean of each field over the resampled cells - NaN values are excluded
+    :param values: numpy array cells x fields
+    :param counts: numpy array nboot x cells from resampleCounts
+    :return: numpy array nboot x fields (NaN if no values)
+    """
+    valid = ~isnan(values)
+    totals = counts.dot(where(valid, values, 0.0))
+    n = counts.dot(valid.astype(float))
+    with errstate(invalid='ignore', divide='ignore'):
+        return where(n > 0, totals / where(n > 0, n, 1), nan)
+
+
+def bootstrapChunk(task):
+    """
+    Resampled means of one chunk - module level for worker processes
+    :param task: (values, nboot, seed)
+    :return: numpy array nboot x fields
+    """
+    (values, nboot, seed) = task
+    counts = resampleCounts(resampleIndex(values.shape[0], nboot, seed), values.shape[0])
+    return resampledMeans(values, counts)
+
+
+class Bootstrap():
+    def __init__(self, nboot=10000, ci=95.0, seed=0, workers=1):
+        """
+        :param nboot: number of resamples
+        :param ci: confidence level (%)
+        :param seed: random seed - same resamples for the same group and number of cells
+        :param workers: number of worker processes for chunks (1 runs in this process)
+        """
+        self.nboot = int(nboot)
+        self.ci = float(ci)
+        self.seed = int(seed)
+        self.workers = int(workers)
+
+    def resample(self, values, group=0):
+        """
+        Means of each field in all resamples
+        :param values: numpy array cells x fields (or 1 field per cell)
+        :param group: group index - seeds differ between groups so groups are resampled independently
+        :return: numpy array nboot x fields
+        """
+        values = asarray(values, dtype=float)
+        if values.ndim == 1:
+            values = values[:, None]
+        if values.shape[0] <= 0:
+            return zeros((self.nboot, values.shape[1])) + nan
+        sizes = [min(BOOTSTRAP_CHUNK, self.nboot - i) for i in range(0, self.nboot, BOOTSTRAP_CHUNK)]
+        tasks = [(values, n, [self.seed, int(group), i]) for (i, n) in enumerate(sizes)]
+        if self.workers > 1 and len(tasks) > 1:
+            from msdapp.workers import runCells
+            chunks = runCells(bootstrapChunk, tasks, self.workers, skiperrors=False)
+        else:
+            chunks = [bootstrapChunk(task) for task in tasks]
+        logging.debug("Bootstrap: %d resamples of %d cells", self.nboot, values.shape[0])
+        return concatenate(chunks)
+
+    def interval(self, samples):
+        """
+        Percentile confidence interval of resampled statistics
+        :param samples: numpy array nboot x fields
+        :return: (lower, upper) arrays per field
+        """
+        alpha = (100.0 - self.ci) / 2
+        empty = isnan(samples).all(axis=0)
+        with errstate(invalid='ignore'):
+            # infinite ratios (no immobile fraction) give NaN limits
+            (lower, upper) = nanpercentile(where(empty, 0.0, samples), [alpha, 100.0 - alpha], axis=0)
+        return (where(empty, nan, lower), where(empty, nan, upper))
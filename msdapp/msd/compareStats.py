@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+MSD Analysis: compareStats
+Comparison of two groups of cells for many metrics at once - each metric is a matrix of cells x fields
+(eg ratio, MSD area and mean log10D with one field, MSD with one field per lag, histogram with one per bin)
+and every field is tested in the same vectorized computation:
+
+1. T-test (equal variance, as scipy.stats.ttest_ind) and Welch t-test
+2. Mann-Whitney U test (two-sided, normal approximation with tie and continuity correction)
+3. Permutation test of the difference of means - the permutations of group labels are drawn once as an
+   index matrix and shared by all metrics with the same numbers of cells:
+
+       sum1 = labels . values        (permutations x fields, NaN values are excluded)
+
+4. FDR (Benjamini-Hochberg) q-values over the fields of each metric (eg all lags, all bins)
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import logging
+from collections import OrderedDict
+
+import pandas as pd
+from numpy import arange, bincount, zeros, full, where, isnan, nan, errstate, sqrt, abs, concatenate, lexsort, \
+    nonzero, cumsum, searchsorted, minimum, asarray, maximum
+from numpy.random import RandomState
+from scipy import stats
+
+# Permutations per chunk of label matrix
+PERMUTATION_CHUNK = 1000
+# p-value columns and their FDR q-value columns
+PVALUES = OrderedDict([('p-value', 'q-value'), ('Welch p-value', 'Welch q-value'),
+                       ('Mann-Whitney p-value', 'Mann-Whitney q-value'), ('Permutation p-value', 'Permutation q-value')])
+
+
+def columnMoments(x):
+    """
+    Count, mean and variance (ddof 1) of each column - NaN values are excluded
+    :param x: numpy array cells x fields
+    :return: (n, mean, var) arrays per field
+    """
+    valid = ~isnan(x)
+    n = valid.sum(axis=0)
+    with errstate(invalid='ignore', divide='ignore'):
+        mean = where(valid, x, 0.0).sum(axis=0) / n
+        dev = where(valid, x - mean, 0.0)
+        var = (dev * dev).sum(axis=0) / (n - 1)
+    return (n, mean, var)
+
+
+def studentTest(x1, x2):
+    """
+    T-test of independent samples with equal variance for each field
+    :param x1, x2: numpy arrays cells x fields of each group
+    :return: (t, p) arrays per field - two-sided
+    """
+    (n1, m1, v1) = columnMoments(x1)
+    (n2, m2, v2) = columnMoments(x2)
+    df = n1 + n2 - 2
+    with errstate(invalid='ignore', divide='ignore'):
+        sp2 = ((n1 - 1) * v1 + (n2 - 1) * v2) / df
+        t = (m1 - m2) / sqrt(sp2 * (1.0 / n1 + 1.0 / n2))
+        p = 2 * stats.t.sf(abs(t), df)
+    return (t, p)
+
+
+def welchTest(x1, x2):
+    """
+    Welch t-test of independent samples (unequal variance) for each field
+    :param x1, x2: numpy arrays cells x fields of each group
+    :return: (t, p) arrays per field - two-sided
+    """
+    (n1, m1, v1) = columnMoments(x1)
+    (n2, m2, v2) = columnMoments(x2)
+    with errstate(invalid='ignore', divide='ignore'):
+        (s1, s2) = (v1 / n1, v2 / n2)
+        t = (m1 - m2) / sqrt(s1 + s2)
+        df = (s1 + s2) ** 2 / (s1 * s1 / (n1 - 1) + s2 * s2 / (n2 - 1))
+        p = 2 * stats.t.sf(abs(t), df)
+    return (t, p)
+
+
+def columnRanks(x):
+    """
+    Average ranks (ties get the mean rank) within each column - NaN values are not ranked
+    :param x: numpy array cells x fields
+    :return: (ranks, ties) - ranks as x (NaN where x is NaN), sum of t^3 - t over tied groups per field
+    """
+    (rows, cols) = nonzero(~isnan(x))
+    values = x[rows, cols]
+    order = lexsort((values, cols))
+    (rows, cols, values) = (rows[order], cols[order], values[order])
+    newgroup = concatenate(([True], (cols[1:] != cols[:-1]) | (values[1:] != values[:-1])))[:len(values)]
+    group = cumsum(newgroup) - 1
+    size = bincount(group)
+    start = nonzero(newgroup)[0]
+    colstart = searchsorted(cols, arange(x.shape[1]))
+    ranks = full(x.shape, nan)
+    ranks[rows, cols] = start[group] + (size[group] - 1) / 2.0 - colstart[cols] + 1
+    ties = bincount(cols[newgroup], weights=size ** 3.0 - size, minlength=x.shape[1])
+    return (ranks, ties)
+
+
+def mannWhitneyTest(x1, x2):
+    """
+    Mann-Whitney U test for each field - two-sided with normal approximation (tie and continuity corrected).
+    The normal approximation is always used, also for the few cells typical of a group (eg 4 vs 4) where
+    an exact test (scipy method='exact') gives different p-values - prefer the permutation p-value there.
+    :param x1, x2: numpy arrays cells x fields of each group
+    :return: (U, p) arrays per field - U of first group
+    """
+    (ranks, ties) = columnRanks(concatenate((x1, x2)))
+    n1 = (~isnan(x1)).sum(axis=0)
+    n2 = (~isnan(x2)).sum(axis=0)
+    n = n1 + n2
+    u1 = where(isnan(x1), 0.0, ranks[:len(x1)]).sum(axis=0) - n1 * (n1 + 1) / 2.0
+    with errstate(invalid='ignore', divide='ignore'):
+        sigma = sqrt(n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1))))
+        z = (maximum(u1, n1 * n2 - u1) - n1 * n2 / 2.0 - 0.5) / sigma
+        p = minimum(2 * stats.norm.sf(z), 1.0)
+    empty = (n1 <= 0) | (n2 <= 0)
+    return (where(empty, nan, u1), where(empty, nan, p))
+
+
+def permutationLabels(ncells, n1, nperm, seed=0):
+    """
+    Label matrices of random assignments of cells to the first group (in chunks)
+    :param ncells: number of cells in both groups
+    :param n1: number of cells in first group
+    :param nperm: number of permutations
+    :param seed: random seed (seed + chunk)
+    :return: list of numpy arrays permutations x cells - 1.0 for first group else 0
+    """
+    labels = []
+    for (i, start) in enumerate(range(0, nperm, PERMUTATION_CHUNK)):
+        n = min(PERMUTATION_CHUNK, nperm - start)
+        index = RandomState(seed + i).rand(n, ncells).argsort(axis=1)[:, :n1]
+        chunk = zeros((n, ncells))
+        chunk[arange(n)[:, None], index] = 1.0
+        labels.append(chunk)
+    return labels
+
+
+def permutationTest(x1, x2, labels):
+    """
+    Permutation test of difference of means for each field
+    :param x1, x2: numpy arrays cells x fields of each group
+    :param labels: list of label matrices from permutationLabels (cells of x1 then x2)
+    :return: p array per field - two-sided, (1 + extreme permutations) / (1 + permutations)
+    """
+    x = concatenate((x1, x2))
+    valid = ~isnan(x)
+    values = where(valid, x, 0.0)
+    valid = valid.astype(float)
+    (total, count) = (values.sum(axis=0), valid.sum(axis=0))
+    with errstate(invalid='ignore', divide='ignore'):
+        observed = abs(values[:len(x1)].sum(axis=0) / valid[:len(x1)].sum(axis=0)
+                       - values[len(x1):].sum(axis=0) / valid[len(x1):].sum(axis=0))
+        # rounding of sums must not exclude permutations equal to observed
+        threshold = observed * (1 - 1e-9)
+        extreme = zeros(x.shape[1])
+        nperm = 0
+        for chunk in labels:
+            (sum1, n1) = (chunk.dot(values), chunk.dot(valid))
+            diff = abs(sum1 / n1 - (total - sum1) / (count - n1))
+            extreme += (diff >= threshold).sum(axis=0)
+            nperm += len(chunk)
+        return where(isnan(observed), nan, (1 + extreme) / (1 + nperm))
+
+
+def fdr(p):
+    """
+    Benjamini-Hochberg adjusted p-values (q-values) - NaN values are excluded
+    :param p: array of p-values
+    :return: array of q-values
+    """
+    p = asarray(p, dtype=float)
+    q = full(len(p), nan)
+    index = nonzero(~isnan(p))[0]
+    if len(index) <= 0:
+        return q
+    order = index[p[index].argsort()]
+    m = len(order)
+    adjusted = p[order] * m / arange(1, m + 1)
+    # monotone from largest p
+    adjusted = minimum.accumulate(adjusted[::-1])[::-1]
+    q[order] = minimum(adjusted, 1.0)
+    return q
+
+
+class GroupComparison():
+    def __init__(self, nperm=10000, seed=0):
+        """
+        :param nperm: number of permutations (0 for no permutation test)
+        :param seed: random seed for permutations
+        """
+        self.nperm = int(nperm)
+        self.seed = int(seed)
+        # label matrices shared by metrics with the same numbers of cells
+        self.labels = dict()
+
+    def getLabels(self, n1, n2):
+        key = (n1, n2)
+        if key not in self.labels:
+            self.labels[key] = permutationLabels(n1 + n2, n1, self.nperm, self.seed)
+        return self.labels[key]
+
+    def compare(self, metrics1, metrics2, prefixes):
+        """
+        Test all fields of all metrics found in both groups
+        :param metrics1, metrics2: OrderedDict of metric: (fields, numpy array cells x fields) for each group
+        :param prefixes: group names
+        :return: dataframe with one row per metric and field
+        """
+        frames = []
+        for (data, (fields, x1)) in metrics1.items():
+            if data not in metrics2:
+                continue
+            x2 = metrics2[data][1]
+            if x1.shape[1] != x2.shape[1]:
+                logging.warning("GroupComparison: %s fields differ between groups - not compared", data)
+                continue
+            (n1, mean1, v1) = columnMoments(x1)
+            (n2, mean2, v2) = columnMoments(x2)
+            # same columns for all pairs of groups - 1 and 2 in order of Groups
+            results = OrderedDict([('Data', data), ('Field', fields), ('Groups', " vs ".join(prefixes)),
+                                   ('N1', n1), ('N2', n2), ('Mean1', mean1), ('Mean2', mean2),
+                                   ('Difference', mean1 - mean2)])
+            (results['T-test'], results['p-value']) = studentTest(x1, x2)
+            (results['Welch t'], results['Welch p-value']) = welchTest(x1, x2)
+            (results['Mann-Whitney U'], results['Mann-Whitney p-value']) = mannWhitneyTest(x1, x2)
+            if self.nperm > 0 and len(x1) > 0 and len(x2) > 0:
+                results['Permutation p-value'] = permutationTest(x1, x2, self.getLabels(len(x1), len(x2)))
+            for (pcol, qcol) in PVALUES.items():
+                if pcol in results:
+                    results[qcol] = fdr(results[pcol])
+            frames.append(pd.DataFrame(results))
+        if len(frames) <= 0:
+            return None
+        return pd.concat(frames, ignore_index=True)
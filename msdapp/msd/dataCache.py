@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+MSD Analysis script: dataCache
+Binary sidecar cache of parsed input data files (eg AllROI-D.txt, AllROI-MSD.txt)
+
+Each input file gets a directory next to it:
+    AllROI-MSD.txt
+    AllROI-MSD.txt.cache
+        | -- meta.json      <-- fingerprint of input file (path, size, mtime, sha1) and parse parameters
+        | -- <name>.npy     <-- one array per parsed column (loaded memory-mapped)
+
+A cache is valid when the input size matches and either the path and mtime match
+or the content hash matches (eg copied or touched files).
+Content hashes are calculated once per file while its size and mtime are unchanged - kept for the process
+and taken from saved fingerprints (caches, manifests) of the same file.
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import hashlib
+import json
+import logging
+import shutil
+from os import R_OK, access, mkdir, stat
+from os.path import join, exists, abspath
+
+import numpy as np
+
+# Content hash of files by (path, size, mtime) - each file is read once while unchanged
+HASHES = dict()
+
+
+def fingerprint(datafile, hashed=True, known=None):
+    """
+    Identify input file
+    :param datafile: full path filename
+    :param hashed: include content hash (reads whole file unless already known with the same size and mtime)
+    :param known: list of saved fingerprints which may include this file (hash is reused if size and mtime match)
+    :return: dict of path, size, mtime and sha1
+    """
+    datafile = abspath(datafile)
+    st = stat(datafile)
+    fp = {'path': datafile, 'size': st.st_size, 'mtime': st.st_mtime_ns}
+    if hashed:
+        key = (datafile, st.st_size, st.st_mtime_ns)
+        if key not in HASHES:
+            for cached in (known if known is not None else []):
+                if cached.get('sha1') is not None and (cached['path'], cached['size'], cached['mtime']) == key:
+                    HASHES[key] = cached['sha1']
+                    break
+        if key not in HASHES:
+            sha = hashlib.sha1()
+            with open(datafile, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(block)
+            HASHES[key] = sha.hexdigest()
+        fp['sha1'] = HASHES[key]
+    return fp
+
+
+def matchFingerprint(datafile, cached):
+    """
+    Check file matches saved fingerprint - size must match and either path and mtime or content hash
+    :param datafile: full path filename
+    :param cached: saved fingerprint
+    :return: (match, fp) where fp is the new fingerprint if confirmed by content hash (to be saved) or None
+    """
+    fp = fingerprint(datafile, hashed=False)
+    if fp['size'] != cached['size']:
+        return (False, None)
+    if fp['path'] == cached['path'] and fp['mtime'] == cached['mtime']:
+        return (True, None)
+    # moved or touched - confirm with content hash
+    fp = fingerprint(datafile)
+    if fp['sha1'] == cached.get('sha1'):
+        return (True, fp)
+    return (False, None)
+
+
+class DataCache():
+    def __init__(self, datafile, suffix='.cache'):
+        """
+        :param datafile: input file
+        :param suffix: cache directory is datafile + suffix (eg separate caches of values derived from input)
+        """
+        self.datafile = abspath(datafile)
+        self.cachedir = self.datafile + suffix
+        self.metafile = join(self.cachedir, 'meta.json')
+
+    def fingerprint(self, hashed=True, known=None):
+        """
+        Identify input file
+        :param hashed: include content hash (reads whole file unless known)
+        :param known: list of saved fingerprints (see fingerprint)
+        :return: dict of path, size, mtime and sha1
+        """
+        return fingerprint(self.datafile, hashed, known)
+
+    def __loadMeta(self):
+        meta = None
+        if access(self.metafile, R_OK):
+            try:
+                with open(self.metafile, 'r') as f:
+                    meta = json.load(f)
+            except ValueError as e:
+                logging.warning("DataCache: corrupt meta file %s - %s", self.metafile, e)
+        return meta
+
+    def isValid(self, params=None):
+        """
+        Check cache matches input file and parse parameters
+        :param params: dict of parameters used to parse file - must match saved values
+        :return: True if valid
+        """
+        meta = self.__loadMeta()
+        if meta is None:
+            return False
+        if params is not None:
+            for key, val in params.items():
+                if meta['params'].get(key) != val:
+                    return False
+        (match, fp) = matchFingerprint(self.datafile, meta['fingerprint'])
+        if match and fp is not None:
+            # moved or touched - update fingerprint
+            meta['fingerprint'] = fp
+            self.__saveMeta(meta)
+        return match
+
+    def load(self, names=None, params=None):
+        """
+        Load arrays from cache as memory-mapped files
+        :param names: list of array names (default all saved arrays)
+        :param params: parse parameters (see isValid)
+        :return: dict of arrays or None if cache is invalid
+        """
+        try:
+            if not self.isValid(params):
+                return None
+            if names is None:
+                names = self.__loadMeta()['arrays']
+            arrays = dict()
+            for name in names:
+                arrays[name] = np.load(join(self.cachedir, name + '.npy'), mmap_mode='r')
+            logging.info("DataCache: loaded %s from cache", self.datafile)
+            return arrays
+        except (IOError, OSError, ValueError, KeyError) as e:
+            logging.warning("DataCache: cannot load cache %s - %s", self.cachedir, e)
+            return None
+
+    def save(self, arrays, params=None):
+        """
+        Save arrays with fingerprint of input file - failure to write is not an error
+        :param arrays: dict of name: array
+        :param params: parse parameters (see isValid)
+        :return: True if saved
+        """
+        try:
+            # fingerprint of replaced cache - input is not hashed again if unchanged
+            previous = self.__loadMeta()
+            known = [previous['fingerprint']] if previous is not None and 'fingerprint' in previous else None
+            if exists(self.cachedir):
+                shutil.rmtree(self.cachedir)
+            mkdir(self.cachedir)
+            for name, arr in arrays.items():
+                np.save(join(self.cachedir, name + '.npy'), np.asarray(arr))
+            meta = {'fingerprint': self.fingerprint(known=known),
+                    'params': params if params is not None else {},
+                    'arrays': list(arrays.keys())}
+            # meta written last so incomplete caches are never valid
+            self.__saveMeta(meta)
+            logging.info("DataCache: saved cache %s", self.cachedir)
+            return True
+        except (IOError, OSError) as e:
+            logging.warning("DataCache: cannot save cache %s - %s", self.cachedir, e)
+            return False
+
+    def __saveMeta(self, meta):
+        with open(self.metafile, 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    def clear(self):
+        if exists(self.cachedir):
+            shutil.rmtree(self.cachedir)
@@ -4,6 +4,10 @@ MSD Analysis script: filterMSD
 Filters data from
 1. AllROI-D.txt - #Diffusion Coefficient in um^2/s; Linear fit performed on the 4 first points of trajectories > 8 points
 2. AllROI-MSD.txt #MSD(DeltaT) in um^2
+With FIT_POINTS in config, log10D is refit from the MSD of each trajectory (see fitMSD) instead of D from file 1
+With ALPHA_POINTS in config, the anomalous exponent of each filtered trajectory is added as column alpha (see fitMSD)
+Sorted log10D (see limitIndex) is built on request and saved with the D data file for previews and sweeps of limits
+The byte offset of each row of the MSD text file is saved with its parsed cache to read full-length MSD (see msdIndex)
 (Data files encoded in ISO-8859-1)
 
 
@@ -13,21 +17,40 @@ Created on Tue Sep 5 2017
 """
 
 import argparse
-import csv
 import logging
 from collections import OrderedDict
 from os import R_OK, access, mkdir
-from os.path import join, splitext, exists
+from os.path import join, split, splitext, exists
 
+import numpy as np
 import pandas as pd
 from configobj import ConfigObj
-# import numpy as np
 from numpy import log10
 
+from msdapp.msd.dataCache import DataCache, fingerprint
+from msdapp.msd.fitMSD import fitLog10D, fitAlpha, ALPHA_COLUMN
+from msdapp.msd.limitIndex import LimitIndex
+from msdapp.msd.msdIndex import MSDIndex
+from msdapp.msd.statsAccumulator import StatsAccumulator, saveCellAccumulator
+
+# Bytes of MSD text file parsed at once (whole rows)
+MSD_BLOCKSIZE = 1 << 24
+# Field and row separators of MSD text - converted to spaces for numpy parser
+MSD_SEPARATORS = bytes.maketrans(b'\t\r\n', b'   ')
+
 
 class FilterMSD():
-    def __init__(self, configfile, datafile, datafile_msd, outputdir, minlimit=-5.0, maxlimit=1.0):
+    def __init__(self, configfile, datafile, datafile_msd, outputdir, minlimit=-5.0, maxlimit=1.0, chunksize=None,
+                 loaddata=True):
         self.encoding = 'ISO-8859-1'
+        self.chunksize = 0
+        self.usecache = 1
+        self.fitpoints = 0
+        self.alphapoints = 0
+        self.sketch = 0
+        self.index = None
+        # full-length MSD rows of text MSD file
+        self.msdindex = None
         if configfile is not None:
             self.__loadConfig(configfile)
         else:
@@ -39,14 +62,26 @@ class FilterMSD():
             self.minlimit = float(minlimit)
             self.maxlimit = float(maxlimit)
             self.roi = 0
-            # Load data
+        if chunksize is not None:
+            self.chunksize = int(chunksize)
         self.outputdir = outputdir
-        print("FilterMSD: Loading data ...")
-        (self.data, self.msd) = self.load_datafiles(datafile, datafile_msd)
-        if self.data is None:
-            raise ValueError("Processing error")
+        self.datafile = datafile
+        self.datafile_msd = datafile_msd
+        # Streaming mode reads files in chunks during runFilter (not available for xls)
+        self.streaming = self.chunksize > 0 and '.xls' not in splitext(datafile_msd)[1]
+        if self.streaming or not loaddata:
+            if self.streaming:
+                print("FilterMSD: Streaming data in chunks of %d rows" % self.chunksize)
+            self.data = None
+            self.msd = None
         else:
-            print("...loaded")
+            # Load data
+            print("FilterMSD: Loading data ...")
+            (self.data, self.msd) = self.load_datafiles(datafile, datafile_msd)
+            if self.data is None:
+                raise ValueError("Processing error")
+            else:
+                print("...loaded")
 
     def __loadConfig(self, configfile=None):
         if configfile is not None:
@@ -65,6 +100,19 @@ class FilterMSD():
             self.minlimit = float(config['MINLIMIT'])
             self.maxlimit = float(config['MAXLIMIT'])
             self.roi = int(config['GROUPBY_ROI'])
+            if 'CHUNKSIZE' in config:
+                self.chunksize = int(config['CHUNKSIZE'])
+            if 'CACHE' in config:
+                self.usecache = int(config['CACHE'])
+            if 'FIT_POINTS' in config:
+                self.fitpoints = min(int(config['FIT_POINTS']), self.msdpoints)
+                self.fitoffset = int(config['FIT_OFFSET']) if 'FIT_OFFSET' in config else 1
+            if 'ALPHA_POINTS' in config:
+                self.alphapoints = min(int(config['ALPHA_POINTS']), self.msdpoints)
+            if 'QUANTILE_SKETCH' in config:
+                self.sketch = int(config['QUANTILE_SKETCH'])
+            if self.fitpoints > 0 or self.alphapoints > 0:
+                self.timeint = float(config['TIME_INTERVAL'])
 
     def load_datafiles(self, datafile, datafile_msd):
         """
@@ -78,63 +126,284 @@ class FilterMSD():
             data = None
             msd = None
             # Load Data file
-            data = pd.read_csv(datafile, encoding=self.encoding, skiprows=2, delimiter='\t')
+            data = self.__load_dfile(datafile)
             # Add log10 column
             data[self.logcolumn] = log10(data[self.diffcolumn])
             logging.info("FilterMSD: datafile loaded with log10D (%s)" % datafile)
             # Load MSD data file
-            max_msdpoints = self.msdpoints + 2  # max msd points plus first 2 cols
-            fpath = splitext(datafile_msd)
-            if '.xls' in fpath[1]:
-                msdall = pd.read_excel(datafile_msd, sheetname=0, skiprows=1)
-                allcols = ['ROI', 'Trace'] + [i for i in range(1, len(msdall.iloc[0]) - 1)]
-                msdall.columns = allcols
-                msd = msdall.iloc[:, 0:max_msdpoints]
-            else:
-                # Txt file is \t delim but has Uneven rows so need to parse line by line - detect max columns
-                # This is very slow but get errors if trying read_csv with pd.read_csv(dmsd, sep='\t')
-                cols = ['ROI', 'Trace'] + [str(x) for x in range(1, self.msdpoints + 1)]
-                msddata = OrderedDict()
-                for c in cols:
-                    msddata[c] = []
-
-                with open(datafile_msd, encoding=self.encoding) as f:
-                    reader = csv.reader(f, delimiter="\t")
-                    d = list(reader)
-                    print("FilterMSD: MSD file Lines=", len(d))
-                    print(d[0][0])
-                    if not (d[0][0].startswith('#MSD')):
-                        msg = "Processing error: datafile maybe corrupt: %s" % datafile_msd
-                        raise Exception(msg)
-                    for row in d:
-                        if row[0].startswith('#') or len(row[0]) <= 0:
-                            continue
-                        msddata['ROI'].append(row[0])
-                        msddata['Trace'].append(row[1])
-                        for i in range(2, max_msdpoints):
-                            if len(row) > i:
-                                msddata[str(i - 1)].append(row[i])
-                            else:
-                                msddata[str(i - 1)].append('')
-
-                msd = pd.DataFrame.from_dict(msddata)
+            msd = self.__load_msdfile(datafile_msd)
             msg = "FilterMSD: msdfile load(%s)" % datafile_msd
             if msd.empty:
                 msg = "Load failed: " + msg
                 raise Exception(msg)
             else:
                 logging.info(msg)
+            if self.fitpoints > 0:
+                if len(msd) != len(data):
+                    raise ValueError("Rows in MSD file do not match data file: %s" % datafile_msd)
+                data[self.logcolumn] = self.fitLog10D(msd.iloc[:, 2:].values, datafile_msd)
             return (data, msd)
         except Exception as e:
             print(e)
             logging.error(e)
 
-    def runFilter(self):
+    def limitParams(self):
+        """
+        Parameters of log10D values - saved with limit index
+        With FIT_POINTS, log10D is refit from the MSD file so the index is also out of date if the MSD file changes
+        :return: dict
+        """
+        params = {'diffcolumn': self.diffcolumn, 'fitpoints': self.fitpoints}
+        if self.fitpoints > 0:
+            params.update({'msdpoints': self.msdpoints, 'fitoffset': self.fitoffset, 'timeint': self.timeint,
+                           'msdfile': fingerprint(self.datafile_msd, hashed=False)})
+        return params
+
+    def limitIndex(self):
+        """
+        Sorted log10D of data (before filtering) - from saved index if valid
+        Data files are loaded if not already loaded (eg streaming) and no saved index - the MSD file only
+        if log10D is refit (FIT_POINTS)
+        :return: LimitIndex
+        """
+        if self.index is None:
+            params = self.limitParams()
+            index = LimitIndex.load(self.datafile, params) if self.usecache else None
+            if index is None or (self.data is not None and len(index) != len(self.data)):
+                if self.data is not None:
+                    values = self.data[self.logcolumn].values
+                elif self.fitpoints > 0:
+                    loaded = self.load_datafiles(self.datafile, self.datafile_msd)
+                    if loaded is None:
+                        raise ValueError("Processing error: cannot load %s" % self.datafile)
+                    values = loaded[0][self.logcolumn].values
+                else:
+                    try:
+                        values = log10(self.__load_dfile(self.datafile)[self.diffcolumn].values)
+                    except KeyError as e:
+                        raise ValueError("Processing error: no column %s in %s" % (e, self.datafile))
+                index = LimitIndex(values)
+                if self.usecache:
+                    index.save(self.datafile, params)
+            self.index = index
+        return self.index
+
+    def __load_dfile(self, datafile):
+        """
+        Load D datafile - from parsed cache if valid
+        :param datafile:
+        :return: dataframe
+        """
+        cache = DataCache(datafile) if self.usecache else None
+        params = {'diffcolumn': self.diffcolumn}
+        arrays = cache.load(params=params) if cache is not None else None
+        if arrays is not None:
+            data = pd.DataFrame(OrderedDict([(k, arrays[k]) for k in ['ROI', 'Trace'] if k in arrays]))
+            data[self.diffcolumn] = arrays['D']
+            print("FilterMSD: datafile loaded from cache")
+        else:
+            data = pd.read_csv(datafile, encoding=self.encoding, skiprows=2, delimiter='\t')
+            if cache is not None:
+                arrays = OrderedDict([(k, data[k].values) for k in ['ROI', 'Trace'] if k in data.columns])
+                arrays['D'] = data[self.diffcolumn].values
+                cache.save(arrays, params)
+        return data
+
+    def __load_msdfile(self, datafile_msd):
+        """
+        Load MSD datafile (txt or xls) with first msdpoints - from parsed cache if valid
+        :param datafile_msd:
+        :return: dataframe with ROI, Trace, 1..msdpoints
+        """
+        cols = [str(x) for x in range(1, self.msdpoints + 1)]
+        cache = DataCache(datafile_msd) if self.usecache else None
+        params = {'msdpoints': self.msdpoints, 'offsets': 1}
+        arrays = cache.load(params=params) if cache is not None else None
+        if arrays is not None:
+            print("FilterMSD: MSD file loaded from cache")
+            (roi, trace, msdmatrix) = (arrays['ROI'], arrays['Trace'], arrays['MSD'])
+            self.msdindex = MSDIndex(datafile_msd, arrays['Offset'], arrays['Fields'])
+        elif '.xls' in splitext(datafile_msd)[1]:
+            max_msdpoints = self.msdpoints + 2  # max msd points plus first 2 cols
+            msdall = pd.read_excel(datafile_msd, sheetname=0, skiprows=1)
+            allcols = ['ROI', 'Trace'] + [i for i in range(1, len(msdall.iloc[0]) - 1)]
+            msdall.columns = allcols
+            msd = msdall.iloc[:, 0:max_msdpoints]
+            return msd
+        else:
+            # Txt file is \t delim but has uneven rows - parse only required columns directly into arrays
+            (roi, trace, msdmatrix) = self.load_msdtext(datafile_msd)
+            if cache is not None:
+                cache.save(OrderedDict([('ROI', roi), ('Trace', trace), ('MSD', msdmatrix),
+                                        ('Offset', self.msdindex.offsets), ('Fields', self.msdindex.fields)]), params)
+        msd = pd.DataFrame(msdmatrix, columns=cols)
+        msd.insert(0, 'Trace', trace)
+        msd.insert(0, 'ROI', roi)
+        return msd
+
+    def fullMSD(self, rows, maxlags=None):
+        """
+        Full-length MSD of trajectories read from MSD text file (not limited to MSD_POINTS)
+        :param rows: row numbers in MSD file (eg index of filtered MSD)
+        :param maxlags: max lags per row (default longest row)
+        :return: numpy array rows x lags padded with NaN
+        """
+        if self.msdindex is None:
+            self.msdindex = MSDIndex.load(self.datafile_msd)
+            if self.msdindex is None:
+                raise ValueError("No MSD row index - load MSD text file first: %s" % self.datafile_msd)
+        return self.msdindex.read(rows, maxlags)
+
+    def fitLog10D(self, msdmatrix, datafile_msd):
+        """
+        Log10 of D refit from MSD of each trajectory - rows must match data file
+        :param msdmatrix: numpy array trajectories x lags
+        :param datafile_msd: filename for messages
+        :return: array of log10D
+        """
+        logd = fitLog10D(msdmatrix.astype(float), self.timeint, self.fitpoints, self.fitoffset)
+        logging.info("FilterMSD: log10D refit over %d lags from %s", self.fitpoints, datafile_msd)
+        return logd
+
+    def load_msdtext(self, datafile_msd):
+        """
+        Parse ragged MSD text file in blocks of whole rows (see parse_msdblock)
+        Only the first MSD_POINTS lags of each row are converted - short rows are padded with NaN
+        The byte offset and number of fields of each row are kept in msdindex (see msdIndex)
+        :param datafile_msd: tab delimited MSD file (first line must start with #MSD)
+        :return: roi, trace, msd matrix (rows x msdpoints)
+        """
+        blocks = []
+        with open(datafile_msd, 'rb') as f:
+            self.__check_msdheader(f, datafile_msd)
+            for (data, position) in self.__read_msdblocks(f):
+                blocks.append(self.parse_msdblock(data, position, datafile_msd))
+        if len(blocks) <= 0:
+            blocks.append(self.parse_msdblock(b'', 0, datafile_msd))
+        (roi, trace, msd, offsets, nfields) = [np.concatenate(arrays) for arrays in zip(*blocks)]
+        print("FilterMSD: MSD file rows=", len(roi))
+        self.msdindex = MSDIndex(datafile_msd, offsets, nfields)
+        return (roi, trace, msd)
+
+    def iter_msdtext(self, datafile_msd, chunksize):
+        """
+        Parse ragged MSD text file in fixed size chunks - as for load_msdtext
+        :param datafile_msd: tab delimited MSD file (first line must start with #MSD)
+        :param chunksize: max rows per chunk
+        :return: generator of roi, trace, msd matrix (chunk rows x msdpoints)
+        """
+        with open(datafile_msd, 'rb') as f:
+            self.__check_msdheader(f, datafile_msd)
+            # parsed rows not yet yielded
+            pending = None
+            for (data, position) in self.__read_msdblocks(f):
+                parsed = self.parse_msdblock(data, position, datafile_msd)[:3]
+                if pending is not None:
+                    parsed = [np.concatenate(arrays) for arrays in zip(pending, parsed)]
+                r = 0
+                while len(parsed[0]) - r >= chunksize:
+                    yield tuple([a[r:r + chunksize] for a in parsed])
+                    r += chunksize
+                pending = [a[r:] for a in parsed]
+            if pending is not None and len(pending[0]) > 0:
+                yield tuple(pending)
+
+    def __check_msdheader(self, f, datafile_msd):
+        header = f.readline()
+        if not header.startswith(b'#MSD'):
+            msg = "Processing error: datafile maybe corrupt: %s" % datafile_msd
+            raise Exception(msg)
+
+    def __read_msdblocks(self, f):
+        """
+        Read open MSD file in blocks of whole rows - the partial row at the end of a block is read again
+        with the next block
+        :param f: MSD file opened in binary mode
+        :return: generator of (bytes-like ending with newline, byte offset of block in file)
+        """
+        position = f.tell()
+        data = f.read(MSD_BLOCKSIZE)
+        eof = len(data) < MSD_BLOCKSIZE
+        while len(data) > 0:
+            last = data.rfind(b'\n') + 1
+            if eof:
+                yield (data if last == len(data) else data + b'\n', position)
+                break
+            if last <= 0:
+                # row longer than block
+                more = f.read(MSD_BLOCKSIZE)
+                (data, eof) = (data + more, len(more) < MSD_BLOCKSIZE)
+                continue
+            yield (memoryview(data)[:last], position)
+            position += last
+            f.seek(position)
+            data = f.read(MSD_BLOCKSIZE)
+            eof = len(data) < MSD_BLOCKSIZE
+
+    def parse_msdblock(self, data, position, datafile_msd):
+        """
+        Parse rows of MSD text as a whole - fields are located from newline and tab positions (vectorized),
+        rows are cut after the required columns and the remaining text is converted at once (numpy).
+        Blank fields are NaN. Comment rows (#) and rows with blank ROI are skipped.
+        :param data: bytes of whole rows (ending with newline)
+        :param position: byte offset of data in file
+        :param datafile_msd: filename for error messages
+        :return: roi, trace, msd matrix (rows x msdpoints), byte offset and number of fields of each row
+        """
+        ncols = self.msdpoints + 2  # max msd points plus first 2 cols
+        buf = np.frombuffer(data, dtype=np.uint8)
+        ends = np.flatnonzero(buf == ord('\n'))
+        starts = np.concatenate(([0], ends + 1))[:len(ends)].astype(np.int64)
+        # tab positions padded so that field positions of any row can be indexed
+        tabs = np.concatenate((np.flatnonzero(buf == ord('\t')), [len(buf)]))
+        firsttab = np.searchsorted(tabs, starts)
+        ntabs = np.searchsorted(tabs, ends) - firsttab
+        # start and end of first ncols fields of each row - absent fields are empty
+        j = np.arange(ncols)
+        fieldtabs = np.minimum(firsttab[:, None] + j[None, :], len(tabs) - 1)
+        fstarts = np.where(j[None, :] == 0, starts[:, None], tabs[np.maximum(fieldtabs - 1, 0)] + 1)
+        fends = np.where(j[None, :] < ntabs[:, None], tabs[fieldtabs], ends[:, None])
+        nonblank = (j[None, :] <= ntabs[:, None]) & (fends > fstarts)
+        # fields of only whitespace (eg trailing tab before CR) are blank - checked where first byte is whitespace
+        spaces = np.frombuffer(b' \r\t\n', dtype=np.uint8)
+        (rows, cols) = np.nonzero(nonblank & np.in1d(buf[np.minimum(fstarts, len(buf) - 1)], spaces).reshape(
+            nonblank.shape))
+        for (r, c) in zip(rows.tolist(), cols.tolist()):
+            nonblank[r, c] = len(bytes(data[fstarts[r, c]:fends[r, c]]).strip()) > 0
+        keep = nonblank[:, 0] & (buf[np.minimum(starts, len(buf) - 1)] != ord('#'))
+        (starts, ntabs, nonblank) = (starts[keep], ntabs[keep], nonblank[keep])
+        cuts = fends[keep, -1]
+        values = np.full((len(starts), ncols), np.nan)
+        if len(starts) > 0:
+            # text of required fields only - separators of fields and rows become spaces
+            text = b' '.join([data[s:c] for (s, c) in zip(starts.tolist(), cuts.tolist())])
+            parsed = np.fromstring(text.translate(MSD_SEPARATORS), sep=' ')
+            if len(parsed) != nonblank.sum() or not nonblank[:, 1].all():
+                msg = "Processing error: datafile maybe corrupt: %s" % datafile_msd
+                raise Exception(msg)
+            values[nonblank] = parsed
+            if (values[:, :2] != np.floor(values[:, :2])).any():
+                msg = "Processing error: datafile maybe corrupt: %s" % datafile_msd
+                raise Exception(msg)
+        return (values[:, 0].astype(np.int64), values[:, 1].astype(np.int64), values[:, 2:],
+                position + starts, (ntabs + 1).astype(np.int32))
+
+    def runFilter(self, savefiles=True, keepoutputs=True):
         """
         Run filter over datasets and save to file
+        Filtered dataframes are kept in outputs (filename: dataframe) for in-memory processing
+        :param savefiles: write output files (otherwise outputs only)
+        :param keepoutputs: keep filtered dataframes in outputs
         :return:
         """
         results = None
+        self.outputs = OrderedDict()
+        # accumulator of each filtered MSD file - saved with file (see statsAccumulator)
+        self.accumulators = OrderedDict()
+        # files written
+        self.outputfiles = []
+        if self.streaming:
+            return self.runFilterStream(savefiles, keepoutputs)
         if not self.data.empty:
             # print(data)
             logcolumn = self.logcolumn
@@ -168,20 +437,32 @@ class FilterMSD():
                             mkdir(sdir)
                         fdata = join(sdir,self.filteredfname)
                         fmsd = join(sdir, self.filtered_msd)
-                        df.to_csv(fdata, columns=[logcolumn], index=False)  # with or without original index numbers
-                        dm.to_csv(fmsd, index=True)
-                        msg ="ROI Files saved: \n\t%s\n\t%s" % (fdata,fmsd)
-                        logging.info(msg)
-                        print(msg)
+                        # row index as read back from saved file
+                        self.outputs[fdata] = df[self.savecolumns()].reset_index(drop=True)
+                        self.outputs[fmsd] = dm
+                        self.__accumulate(fmsd, dm)
+                        if savefiles:
+                            df.to_csv(fdata, columns=self.savecolumns(), index=False)  # with or without original index numbers
+                            dm.to_csv(fmsd, index=True)
+                            msg ="ROI Files saved: \n\t%s\n\t%s" % (fdata,fmsd)
+                            logging.info(msg)
+                            print(msg)
                         results += 1
+                    if savefiles:
+                        self.outputfiles = list(self.outputs.keys()) + self.saveAccumulators()
                 else:
                     fdata = join(self.outputdir, self.filteredfname)
                     fmsd = join(self.outputdir, self.filtered_msd)
-                    print('saving files')
-                    filtered.to_csv(fdata, columns=[logcolumn], index=False)  # with or without original index numbers
-                    filtered_msd.to_csv(fmsd, index=True)
-                    print("Files saved: ")
-                    print('\t', fdata, '\n\t', fmsd)
+                    self.outputs[fdata] = filtered[self.savecolumns()].reset_index(drop=True)
+                    self.outputs[fmsd] = filtered_msd
+                    self.__accumulate(fmsd, filtered_msd)
+                    if savefiles:
+                        print('saving files')
+                        filtered.to_csv(fdata, columns=self.savecolumns(), index=False)  # with or without original index numbers
+                        filtered_msd.to_csv(fmsd, index=True)
+                        print("Files saved: ")
+                        print('\t', fdata, '\n\t', fmsd)
+                        self.outputfiles = [fdata, fmsd] + self.saveAccumulators()
                     results = (fdata, fmsd, num_data, len(filtered), num_msd, len(filtered_msd))
             except IOError as e:
                 logging.error(e)
@@ -191,25 +472,163 @@ class FilterMSD():
             raise ValueError("Data not loaded")
         return results
 
-    def filter_datafiles(self):
+    def runFilterStream(self, savefiles=True, keepoutputs=False):
         """
-        Filter field with minval and maxval
+        Run filter over datasets in chunks of rows and append to output files
+        Memory is limited by chunksize rather than the size of the data files (unless outputs are kept)
+        :param savefiles: append chunks to output files
+        :param keepoutputs: also keep filtered dataframes in outputs (eg for in-memory processing)
+        :return: as for runFilter
+        """
+        logcolumn = self.logcolumn
+        cols = [str(x) for x in range(1, self.msdpoints + 1)]
+        num_data = 0
+        num_filtered = 0
+        num_msd = 0
+        # output files with header written
+        written = set()
+        # filtered chunks by output file if outputs are kept
+        chunks = OrderedDict()
+        if keepoutputs:
+            logging.warning("Filter: filtered data kept in memory - memory is not limited by chunksize: %s",
+                            self.datafile)
+        fdata = join(self.outputdir, self.filteredfname)
+        fmsd = join(self.outputdir, self.filtered_msd)
+        results = None
+        try:
+            datachunks = pd.read_csv(self.datafile, encoding=self.encoding, skiprows=2, delimiter='\t',
+                                     chunksize=self.chunksize)
+            msdchunks = self.iter_msdtext(self.datafile_msd, self.chunksize)
+            for data in datachunks:
+                try:
+                    (roi, trace, msdmatrix) = next(msdchunks)
+                except StopIteration:
+                    raise ValueError("Rows in MSD file do not match data file: %s" % self.datafile_msd)
+                if len(roi) != len(data):
+                    raise ValueError("Rows in MSD file do not match data file: %s" % self.datafile_msd)
+                data[logcolumn] = log10(data[self.diffcolumn])
+                if self.fitpoints > 0:
+                    data[logcolumn] = self.fitLog10D(msdmatrix, self.datafile_msd)
+                msd = pd.DataFrame(msdmatrix, columns=cols, index=data.index)
+                msd.insert(0, 'Trace', trace)
+                msd.insert(0, 'ROI', roi)
+                num_data += len(data)
+                num_msd += len(msd)
+                (filtered, filtered_msd) = self.filter_datafiles(data, msd)
+                num_filtered += len(filtered)
+                if self.roi:
+                    for g, df in filtered.groupby('ROI'):
+                        sdir = join(self.outputdir, 'ROI_' + str(g))
+                        if not exists(sdir):
+                            mkdir(sdir)
+                        dm = filtered_msd[filtered_msd['ROI'] == g]
+                        self.__appendChunks(df, dm, join(sdir, self.filteredfname), join(sdir, self.filtered_msd),
+                                            written, chunks, savefiles, keepoutputs)
+                else:
+                    self.__appendChunks(filtered, filtered_msd, fdata, fmsd, written, chunks, savefiles, keepoutputs)
+            if next(msdchunks, None) is not None:
+                raise ValueError("Rows in MSD file do not match data file: %s" % self.datafile_msd)
+            msg = "Rows filtered: \tData=%d of %d\tMSD=%d of %d\n" % (num_filtered, num_data, num_filtered, num_msd)
+            print(msg)
+            logging.info(msg)
+            for (fname, dfs) in chunks.items():
+                # filtered data with row index as read back from saved file (MSD is saved with index)
+                self.outputs[fname] = pd.concat(dfs, ignore_index=split(fname)[1] == self.filteredfname)
+            if savefiles:
+                self.outputfiles = sorted(written) + self.saveAccumulators()
+            if self.roi:
+                results = len(written) // 2
+            else:
+                results = (fdata, fmsd, num_data, num_filtered, num_msd, num_filtered)
+        except IOError as e:
+            logging.error(e)
+            raise e
+        return results
+
+    def __appendChunks(self, filtered, filtered_msd, fdata, fmsd, written, chunks, savefiles, keepoutputs):
+        """
+        Append filtered chunk to output files - header written with first chunk only
+        :param written: set of output files started
+        :param chunks: filtered chunks by output file (if keepoutputs)
+        """
+        if keepoutputs:
+            chunks.setdefault(fdata, []).append(filtered[self.savecolumns()])
+            chunks.setdefault(fmsd, []).append(filtered_msd)
+        self.__accumulate(fmsd, filtered_msd)
+        for (df, fname, kwargs) in [(filtered, fdata, dict(columns=self.savecolumns(), index=False)),
+                                    (filtered_msd, fmsd, dict(index=True))]:
+            if not savefiles:
+                written.add(fname)
+            elif fname in written:
+                df.to_csv(fname, mode='a', header=False, **kwargs)
+            else:
+                df.to_csv(fname, mode='w', header=True, **kwargs)
+                written.add(fname)
+
+    def __accumulate(self, fmsd, filtered_msd):
+        """
+        Add filtered MSD (or chunk) to accumulator of output file
+        :param fmsd: filtered MSD file
+        :param filtered_msd: dataframe with ROI, Trace, 1..msdpoints
+        """
+        if fmsd not in self.accumulators:
+            self.accumulators[fmsd] = StatsAccumulator(self.msdpoints, sketch=self.sketch)
+        self.accumulators[fmsd].add(filtered_msd.iloc[:, 2:2 + self.msdpoints].values.astype(float))
+
+    def saveAccumulators(self):
+        """
+        Save accumulator of each filtered MSD file next to it for batch processes (see CompareMSD)
+        :return: list of accumulator files
+        """
+        timepoints = [str(x) for x in range(1, self.msdpoints + 1)]
+        return [saveCellAccumulator(fmsd, timepoints, acc) for (fmsd, acc) in self.accumulators.items()]
 
+    def filter_datafiles(self, data=None, msd=None):
+        """
+        Filter field with minval and maxval
+        :param data: dataframe chunk to filter (default all loaded data)
+        :param msd: corresponding msd chunk
         :return: filtered dataframes for data and msd
         """
+        if data is not None:
+            mmfilter = self.__limitfilter(data)
+            return (self.__addAlpha(data[mmfilter], msd[mmfilter]), msd[mmfilter])
         data = self.data
         msd = self.msd
+        # limit index (see limitIndex) is only built for previews and sweeps of limits
+        mmfilter = self.__limitfilter(data)
+        filtered = self.__addAlpha(data[mmfilter], msd[mmfilter])
+        filtered_msd = msd[mmfilter]
+        self.data = filtered
+        self.msd = filtered_msd
+        return (filtered, filtered_msd)
+
+    def __addAlpha(self, filtered, filtered_msd):
+        """
+        Add alpha column fit from MSD of each filtered trajectory (if ALPHA_POINTS in config)
+        :return: filtered dataframe
+        """
+        if self.alphapoints <= 0:
+            return filtered
+        alpha = fitAlpha(filtered_msd.iloc[:, 2:].values.astype(float), self.timeint, self.alphapoints)[0]
+        return filtered.assign(**{ALPHA_COLUMN: alpha})
+
+    def savecolumns(self):
+        """
+        Columns saved to filtered file
+        :return: list of column names
+        """
+        if self.alphapoints > 0:
+            return [self.logcolumn, ALPHA_COLUMN]
+        return [self.logcolumn]
+
+    def __limitfilter(self, data):
         logcolumn = self.logcolumn
         minval = self.minlimit
         maxval = self.maxlimit
         minfilter = data[logcolumn] > minval
         maxfilter = data[logcolumn] < maxval
-        mmfilter = minfilter & maxfilter
-        filtered = data[mmfilter]
-        filtered_msd = msd[mmfilter]
-        self.data = filtered
-        self.msd = filtered_msd
-        return (filtered, filtered_msd)
+        return minfilter & maxfilter
 
 
 if __name__ == "__main__":
@@ -225,6 +644,7 @@ if __name__ == "__main__":
     parser.add_argument('--minlimit', action='store', help='Min filter', default="-5")
     parser.add_argument('--maxlimit', action='store', help='Max filter', default="1")
     parser.add_argument('--config', action='store', help='Config file for parameters', default=None)
+    parser.add_argument('--chunksize', action='store', help='Stream files in chunks of rows (0 to load all)', default=None)
     args = parser.parse_args()
 
     datafile = join(args.filedir, args.datafile)
@@ -233,8 +653,8 @@ if __name__ == "__main__":
     print("Input:", datafile)
 
     try:
-        fmsd = FilterMSD(args.config, datafile, datafile_msd, outputdir, float(args.minlimit), float(args.maxlimit))
-        if fmsd.data is not None:
+        fmsd = FilterMSD(args.config, datafile, datafile_msd, outputdir, float(args.minlimit), float(args.maxlimit), args.chunksize)
+        if fmsd.data is not None or fmsd.streaming:
             fmsd.runFilter()
 
     except ValueError as e:
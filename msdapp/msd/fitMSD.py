@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+MSD Analysis script: fitMSD
+Refits the diffusion coefficient of each trajectory from its MSD curve (instead of D from the tracker):
+
+    MSD(t) = 4Dt + b     where b is an offset (eg localization error) or 0 with FIT_OFFSET = 0
+
+Least squares over the first FIT_POINTS lags at t = lag x TIME_INTERVAL - solved in closed form for all
+trajectories at once. Missing lags are excluded from the fit of that trajectory; trajectories with too few
+lags (2 or 1 without offset) or D <= 0 have no log10D (NaN).
+
+The anomalous exponent alpha is fit in the same way from log10(MSD) vs log10(t) over the first ALPHA_POINTS lags:
+
+    MSD(t) = 4Kt^alpha
+
+1. Filtered_MSD.csv -> Fitted_log10D.csv with log10D (LOG_COLUMN), D and offset per trajectory (same rows)
+2. With FIT_POINTS in config, filterMSD uses the refit log10D of each trajectory from the raw MSD file
+3. With ALPHA_POINTS in config, filterMSD adds alpha of each trajectory to Filtered_log10D.csv which is
+   then histogrammed (Histogram_alpha.csv) and compiled per group (AllHistogram_alpha.csv) as for log10D
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import argparse
+import logging
+from os import R_OK, access
+from os.path import join
+
+import pandas as pd
+from configobj import ConfigObj
+from numpy import arange, isnan, where, errstate, log10, nan, asarray
+
+# Number of lags used by the tracker (see filterMSD)
+FIT_POINTS = 4
+# Default number of lags for alpha and its column label in filtered files
+ALPHA_POINTS = 10
+ALPHA_COLUMN = 'alpha'
+
+
+def linearFit(x, y, intercept=True):
+    """
+    Least squares fit of y = slope * x + intercept for each row of y - NaN values of y are excluded
+    :param x: numpy array of x per column
+    :param y: numpy array rows x columns
+    :param intercept: fit intercept (otherwise 0)
+    :return: (slope, intercept) arrays per row - NaN if too few values (2 or 1 without intercept)
+    """
+    valid = ~isnan(y)
+    y = where(valid, y, 0.0)
+    n = valid.sum(axis=1)
+    sxx = valid.dot(x * x)
+    sxy = y.dot(x)
+    with errstate(invalid='ignore', divide='ignore'):
+        if intercept:
+            sx = valid.dot(x)
+            sy = y.sum(axis=1)
+            slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+            b = (sy - slope * sx) / n
+            return (where(n >= 2, slope, nan), where(n >= 2, b, nan))
+        return (where(n >= 1, sxy / sxx, nan), where(n >= 1, 0.0, nan))
+
+
+def fitMSD(msd, timeint, fitpoints=FIT_POINTS, offset=True):
+    """
+    Least squares fit of MSD = 4Dt + b per trajectory
+    :param msd: numpy array trajectories x lags (NaN for missing lags)
+    :param timeint: time interval between lags (s)
+    :param fitpoints: number of lags to fit
+    :param offset: fit offset b (otherwise b = 0)
+    :return: (D, b) arrays per trajectory - NaN if too few lags
+    """
+    y = asarray(msd, dtype=float)[:, :fitpoints]
+    t = arange(1, y.shape[1] + 1) * timeint
+    (slope, b) = linearFit(t, y, offset)
+    return (slope / 4, b)
+
+
+def fitAlpha(msd, timeint, fitpoints=ALPHA_POINTS):
+    """
+    Anomalous exponent per trajectory from fit of log10(MSD) = alpha * log10(t) + log10(4K)
+    alpha < 1 for confined, 1 for free and > 1 for directed motion
+    :param msd: numpy array trajectories x lags (NaN for missing lags - MSD <= 0 are also excluded)
+    :param timeint: time interval between lags (s)
+    :param fitpoints: number of lags to fit
+    :return: (alpha, log10(4K)) arrays per trajectory - NaN if fewer than 2 lags
+    """
+    y = asarray(msd, dtype=float)[:, :fitpoints]
+    with errstate(invalid='ignore'):
+        positive = y > 0
+    y = where(positive, log10(where(positive, y, 1.0)), nan)
+    t = log10(arange(1, y.shape[1] + 1) * timeint)
+    return linearFit(t, y)
+
+
+def logD(d):
+    """
+    Log10 of D - NaN if D <= 0 or NaN
+    """
+    with errstate(invalid='ignore'):
+        positive = d > 0
+    return where(positive, log10(where(positive, d, 1.0)), nan)
+
+
+def fitLog10D(msd, timeint, fitpoints=FIT_POINTS, offset=True):
+    """
+    Log10 of refit D per trajectory
+    :return: array per trajectory - NaN if no fit or D <= 0
+    """
+    return logD(fitMSD(msd, timeint, fitpoints, offset)[0])
+
+
+class FitMSD():
+    def __init__(self, configfile, datafile_msd, outputdir):
+        """
+        :param configfile: config params
+        :param datafile_msd: Filtered_MSD.csv
+        :param outputdir: output directory
+        """
+        self.encoding = 'ISO-8859-1'
+        self.msdpoints = 10
+        self.timeint = 0.02
+        self.logcolumn = 'log10D'
+        self.fitpoints = FIT_POINTS
+        self.offset = 1
+        self.outputfile = 'Fitted_log10D.csv'
+        if configfile is not None and access(configfile, R_OK):
+            config = ConfigObj(configfile, encoding=self.encoding)
+            self.msdpoints = int(config['MSD_POINTS'])
+            self.timeint = float(config['TIME_INTERVAL'])
+            self.logcolumn = config['LOG_COLUMN']
+            if 'FIT_POINTS' in config and int(config['FIT_POINTS']) > 0:
+                self.fitpoints = int(config['FIT_POINTS'])
+            if 'FIT_OFFSET' in config:
+                self.offset = int(config['FIT_OFFSET'])
+            if 'FITTED_FILENAME' in config:
+                self.outputfile = config['FITTED_FILENAME']
+        if self.fitpoints > self.msdpoints:
+            logging.warning("FitMSD: FIT_POINTS reduced to MSD_POINTS (%d)", self.msdpoints)
+            self.fitpoints = self.msdpoints
+        self.datafile_msd = datafile_msd
+        self.outputdir = outputdir
+
+    def run(self, data=None):
+        """
+        Refit D for all trajectories and save to outputfile
+        :param data: Filtered MSD dataframe (default load datafile_msd)
+        :return: (outputfilename, number of trajectories, number fitted)
+        """
+        if data is None:
+            data = pd.read_csv(self.datafile_msd)
+        cols = [str(x) for x in range(1, self.fitpoints + 1)]
+        (d, b) = fitMSD(data[cols].values, self.timeint, self.fitpoints, self.offset)
+        logd = logD(d)
+        df = pd.DataFrame({self.logcolumn: logd, 'D': d, 'offset': b}, columns=[self.logcolumn, 'D', 'offset'])
+        outputfile = join(self.outputdir, self.outputfile)
+        df.to_csv(outputfile, index=False)
+        fitted = int((~isnan(logd)).sum())
+        msg = "FitMSD: %d of %d trajectories fitted over %d lags: %s" % (fitted, len(df), self.fitpoints, outputfile)
+        print(msg)
+        logging.info(msg)
+        return (outputfile, len(df), fitted)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='fitMSD',
+                                     description='''\
+            Refits D for each trajectory from a filtered MSD file (MSD = 4Dt + offset)
+
+             ''')
+    parser.add_argument('--datafile_msd', action='store', help='Filtered MSD file', default="Filtered_MSD.csv")
+    parser.add_argument('--outputdir', action='store', help='Output directory', default="data")
+    parser.add_argument('--config', action='store', help='Config file for parameters', default=None)
+    args = parser.parse_args()
+
+    try:
+        fit = FitMSD(args.config, args.datafile_msd, args.outputdir)
+        fit.run()
+    except ValueError as e:
+        print("Error:", e)
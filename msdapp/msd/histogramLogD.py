@@ -4,6 +4,14 @@ MSD Analysis script: frequencyDiffusion
 Create frequency histogram data from
 1. Filtered_AllROI-D.txt - #Diffusion Coefficient in um^2/s
 for individual cells and all cells
+2. alpha column of Filtered_log10D.csv (with ALPHA_POINTS in config - see fitMSD) to ALPHA_HISTOGRAM
+   with ALPHA_MINLIMIT, ALPHA_MAXLIMIT and ALPHA_BINWIDTH
+3. base histogram of counts in fine bins (BASE_BINWIDTH in config, default 0.01) saved with each histogram as
+   <histogram>_base.npz - histograms with bin edges on multiples of the base bin width (eg MINLIMIT -5, MAXLIMIT 1,
+   BINWIDTH 0.2) are sums of base bins, so changing bins does not read the log10D data again - values on
+   grid points are saved with their counts and binned as np.histogram (the last bin includes its right edge)
+4. accumulator of the relative frequencies per bin saved with each histogram as <histogram>_accumulator.json
+   for merging in batch stats (see statsAccumulator)
 
 (Data files encoded in ISO-8859-1)
 
@@ -16,7 +24,7 @@ Created on Tue Sep 5 2017
 import argparse
 import logging
 from os import R_OK, access, remove
-from os.path import join, split
+from os.path import join, split, splitext
 # #maintain this order of matplotlib
 # import matplotlib
 # matplotlib.use('TkAgg')
@@ -30,51 +38,326 @@ from configobj import ConfigObj
 from plotly import offline
 from plotly.graph_objs import Layout, Histogram
 
+from msdapp.msd.fitMSD import ALPHA_COLUMN
+from msdapp.msd.statsAccumulator import StatsAccumulator, saveCellAccumulator
+
+# Fine bin width of base histograms
+BASE_BINWIDTH = 0.01
+# Values within this fraction of base bin width of grid points are kept as values in base histograms
+EDGE_TOLERANCE = 1e-5
+
+
+def histogramConfig(configfile=None, alpha=False):
+    """
+    Histogram parameters from config (defaults if no config)
+    :param configfile: config params
+    :param alpha: parameters of alpha histogram instead of log10D
+    :return: dict with histofile, logcolumn, fmin, fmax, binwidth, basewidth, basefile, sketch
+    """
+    config = dict()
+    if configfile is not None:
+        try:
+            access(configfile, R_OK)
+            config = ConfigObj(configfile, encoding='ISO-8859-1')
+            params = {'histofile': config['HISTOGRAM_FILENAME'], 'logcolumn': config['LOG_COLUMN'],
+                      'fmin': float(config['MINLIMIT']), 'fmax': float(config['MAXLIMIT']),
+                      'binwidth': float(config['BINWIDTH'])}
+        except:
+            raise IOError
+    else:
+        # Frequency range limits - logcolumn must be exact label
+        params = {'histofile': 'Histogram_log10D.csv', 'logcolumn': 'log10D', 'fmin': -5.0, 'fmax': 1.0,
+                  'binwidth': 0.2}
+    params['basewidth'] = float(config['BASE_BINWIDTH']) if 'BASE_BINWIDTH' in config else BASE_BINWIDTH
+    if alpha:
+        params['logcolumn'] = ALPHA_COLUMN
+        params['histofile'] = config['ALPHA_HISTOGRAM'] if 'ALPHA_HISTOGRAM' in config else 'Histogram_alpha.csv'
+        params['fmin'] = float(config['ALPHA_MINLIMIT']) if 'ALPHA_MINLIMIT' in config else 0.0
+        params['fmax'] = float(config['ALPHA_MAXLIMIT']) if 'ALPHA_MAXLIMIT' in config else 2.0
+        params['binwidth'] = float(config['ALPHA_BINWIDTH']) if 'ALPHA_BINWIDTH' in config else 0.1
+    params['basefile'] = splitext(params['histofile'])[0] + '_base.npz'
+    params['sketch'] = int(config['QUANTILE_SKETCH']) if 'QUANTILE_SKETCH' in config else 0
+    return params
+
+
+def histogramBins(fmin, fmax, binwidth):
+    """
+    Bins centred on fmin to fmax (to match Graphpad Prism histogram) with edges for counting
+    :param fmin: centre of first bin
+    :param fmax: centre of last bin
+    :param binwidth:
+    :return: (centrebins, edges)
+    """
+    xmin = fmin - (binwidth / 2)
+    xmax = fmax + (binwidth / 2)
+    n_bins = int(abs((fmax - fmin) / binwidth)) + 1
+    centrebins = np.linspace(fmin, fmax, n_bins)
+    edges = np.linspace(xmin, xmax, n_bins + 1)
+    return (centrebins, edges)
+
+
+def binIndex(values, edges):
+    """
+    Bin of each value as np.histogram - values outside the edges (and NaN) are excluded
+    :param values: array of values
+    :param edges: bin edges (evenly spaced)
+    :return: (keep, indices) - mask of values within edges and bin index of each kept value
+    """
+    n_bins = len(edges) - 1
+    keep = (values >= edges[0]) & (values <= edges[-1])
+    values = values[keep]
+    # bin index from shared edges - corrected to within 1 ULP of edges as np.histogram
+    indices = ((values - edges[0]) / (edges[-1] - edges[0]) * n_bins).astype(np.intp)
+    indices[indices == n_bins] -= 1
+    indices[values < edges[indices]] -= 1
+    indices[(values >= edges[indices + 1]) & (indices != n_bins - 1)] += 1
+    return (keep, indices)
+
+
+def batchHistogram(arrays, fmin, fmax, binwidth):
+    """
+    Histogram counts of many cells in one pass - same counts as np.histogram for each cell
+    Values outside the range (and NaN) are excluded, the last bin includes the right edge
+    :param arrays: list of log10D arrays (one per cell)
+    :param fmin: centre of first bin
+    :param fmax: centre of last bin
+    :param binwidth:
+    :return: (centrebins, counts) where counts is a cells x bins matrix
+    """
+    (centrebins, edges) = histogramBins(fmin, fmax, binwidth)
+    n_bins = len(centrebins)
+    n_cells = len(arrays)
+    if n_cells <= 0:
+        return (centrebins, np.zeros((0, n_bins), dtype=np.int64))
+    lengths = [len(a) for a in arrays]
+    values = np.concatenate([np.asarray(a, dtype=np.float64).ravel() for a in arrays])
+    cells = np.repeat(np.arange(n_cells), lengths)
+    (keep, indices) = binIndex(values, edges)
+    cells = cells[keep]
+    counts = np.bincount(cells * n_bins + indices, minlength=n_cells * n_bins).reshape(n_cells, n_bins)
+    return (centrebins, counts)
+
+
+def baseHistogram(values, base=BASE_BINWIDTH):
+    """
+    Counts in fine bins [k * base, (k + 1) * base) over the range of values - NaN values are excluded.
+    Values within EDGE_TOLERANCE of a grid point k * base are kept as distinct values with counts instead,
+    as histogram edges on the grid (see baseIndex) may differ from k * base in the last digits
+    :param values: array of log10D (or alpha) values
+    :param base: base bin width
+    :return: (offset, counts, edgevalues, edgecounts) where offset is k of first bin
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    values = values[np.isfinite(values)]
+    onedge = np.abs(values - np.round(values / base) * base) <= EDGE_TOLERANCE * base
+    (edgevalues, edgecounts) = np.unique(values[onedge], return_counts=True)
+    values = values[~onedge]
+    if len(values) <= 0:
+        return (0, np.zeros(0, dtype=np.int64), edgevalues, edgecounts)
+    k = np.floor(values / base).astype(np.int64)
+    offset = k.min()
+    return (int(offset), np.bincount(k - offset), edgevalues, edgecounts)
+
+
+def baseIndex(x, base):
+    """
+    Position of x on base grid
+    :param x: bin edge or bin width
+    :param base: base bin width
+    :return: k where x = k * base - ValueError if x is not on grid
+    """
+    k = int(np.round(x / base))
+    if abs(k * base - x) > 1e-6 * base:
+        raise ValueError("Histogram bins not aligned with base bin width %g: %g" % (base, x))
+    return k
+
+
+def rebinHistogram(bases, fmin, fmax, binwidth, base=BASE_BINWIDTH):
+    """
+    Histogram counts of many cells (same counts as batchHistogram) by summing base bins (see baseHistogram)
+    Values close to grid points are binned as in batchHistogram, so values on edges (last edge included) match
+    :param bases: base histogram of each cell (offset, counts, edgevalues, edgecounts)
+    :param fmin: centre of first bin
+    :param fmax: centre of last bin
+    :param binwidth: multiple of base
+    :param base: base bin width
+    :return: (centrebins, counts) where counts is a cells x bins matrix - ValueError if edges are not on base grid
+    """
+    (centrebins, edges) = histogramBins(fmin, fmax, binwidth)
+    n_bins = len(centrebins)
+    start = baseIndex(edges[0], base)
+    width = baseIndex(binwidth, base)
+    end = start + n_bins * width
+    if baseIndex(edges[-1], base) != end:
+        raise ValueError("Histogram range %g to %g is not a multiple of bin width %g" % (fmin, fmax, binwidth))
+    # base counts of each cell within range with leading zero for cumulative sums at edges
+    grid = np.zeros((len(bases), end - start + 1), dtype=np.int64)
+    for i, (offset, c, ev, ec) in enumerate(bases):
+        (lo, hi) = (max(offset, start), min(offset + len(c), end))
+        if hi > lo:
+            grid[i, lo - start + 1:hi - start + 1] = c[lo - offset:hi - offset]
+    cumulative = grid.cumsum(axis=1)[:, np.arange(n_bins + 1) * width]
+    rebinned = np.diff(cumulative, axis=1)
+    for i, (offset, c, ev, ec) in enumerate(bases):
+        (keep, indices) = binIndex(np.asarray(ev, dtype=np.float64), edges)
+        rebinned[i] += np.bincount(indices, weights=ec[keep], minlength=n_bins).astype(np.int64)
+    return (centrebins, rebinned)
+
+
+def loadBase(basefile, base=BASE_BINWIDTH):
+    """
+    Load base histogram (see HistogramLogD.saveBase)
+    :param basefile: npz file
+    :param base: base bin width from config
+    :return: (offset, counts, edgevalues, edgecounts) - ValueError if base bin width differs from config
+            or values on grid points are not saved
+    """
+    with np.load(basefile) as npz:
+        if not np.isclose(float(npz['base']), base):
+            raise ValueError("Base histogram bin width %g does not match config: %s" % (npz['base'], basefile))
+        if 'edgevalues' not in npz:
+            raise ValueError("Base histogram without values on grid points: %s" % basefile)
+        return (int(npz['offset']), npz['counts'], npz['edgevalues'], npz['edgecounts'])
+
+
+class HistogramMatrix():
+    def __init__(self, files, centrebins, counts, logcolumn='log10D'):
+        """
+        Relative frequency histograms of many cells (see batchHistogram)
+        :param files: histogram filename for each cell (row of counts)
+        :param centrebins: bin centres
+        :param counts: cells x bins matrix
+        :param logcolumn: column label for histogram data
+        """
+        self.files = list(files)
+        self.rows = dict([(f, i) for i, f in enumerate(self.files)])
+        self.bins = centrebins
+        self.counts = counts
+        self.logcolumn = logcolumn
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.freqs = counts / counts.sum(axis=1)[:, np.newaxis]
+
+    def histdata(self, f):
+        """
+        Histogram of cell as generated by HistogramLogD
+        :param f: histogram filename
+        :return: dataframe
+        """
+        return pandas.DataFrame({'bins': self.bins, self.logcolumn: self.freqs[self.rows[f]]})
+
 
 class HistogramLogD():
-    def __init__(self, datafile, configfile=None, showplots=False):
+    def __init__(self, datafile, configfile=None, showplots=False, data=None, alpha=False):
+        """
+        :param datafile: filtered log10D file
+        :param configfile: config params
+        :param showplots: display plots
+        :param data: dataframe already in memory for datafile (file is not read)
+        :param alpha: histogram of alpha column instead of log10D
+        """
         self.encoding = 'ISO-8859-1'
         self.showplots = showplots
+        self.alpha = alpha
         parts = split(datafile)
         self.datafile = parts[1]
         self.inputdir = parts[0]
         self.cellid = datafile #.replace(sep,"_")
-        if configfile is not None:
-            self.__loadConfig(configfile)
-        else:
+        if configfile is None:
             self.msdpoints = 10
-            self.histofile = 'Histogram_log10D.csv'
-            self.logcolumn = 'log10D'  # must be exact label
-            # Frequency range limits
-            self.fmin = -5.0
-            self.fmax = 1.0
-            self.binwidth = 0.2
+        config = histogramConfig(configfile, alpha)
+        self.histofile = config['histofile']
+        self.logcolumn = config['logcolumn']
+        self.fmin = config['fmin']
+        self.fmax = config['fmax']
+        self.binwidth = config['binwidth']
+        self.basewidth = config['basewidth']
+        self.sketch = config['sketch']
+        self.basefile = config['basefile']
 
         # holds raw or filtered data
         self.data = None
+        # base histogram (offset, counts) - histogram is generated from base instead of data if loaded
+        self.base = None
+        # accumulator saved with histogram file
+        self.accumulatorfile = None
         self.fig = None
 
         # Load data
-        self.__load_datafiles(datafile)
-
-    def __loadConfig(self, configfile=None):
-        if configfile is not None:
-
-            try:
-                access(configfile, R_OK)
-                config = ConfigObj(configfile, encoding=self.encoding)
-                self.histofile = config['HISTOGRAM_FILENAME']
-                self.fmin = float(config['MINLIMIT'])
-                self.fmax = float(config['MAXLIMIT'])
-                self.binwidth = float(config['BINWIDTH'])
-                self.logcolumn = config['LOG_COLUMN']
-            except:
-                raise IOError
+        if data is not None:
+            self.data = data
+        else:
+            self.__load_datafiles(datafile)
 
     def __load_datafiles(self, datafile):
         self.data = pandas.read_csv(datafile, encoding=self.encoding)
         print("Histogram: Data loaded:", len(self.data))
 
+    @staticmethod
+    def batch(datafiles, configfile=None, data=None, alpha=False):
+        """
+        Histograms of all cells in one pass (no files or plots)
+        :param datafiles: filtered log10D files
+        :param configfile: config params
+        :param data: dict of dataframes already in memory by filename
+        :param alpha: histograms of alpha column instead of log10D
+        :return: HistogramMatrix with rows named as histogram files
+        """
+        config = histogramConfig(configfile, alpha)
+        logcolumn = config['logcolumn']
+        arrays = []
+        for f in datafiles:
+            if data is not None and f in data:
+                df = data[f]
+            else:
+                df = pandas.read_csv(f, encoding='ISO-8859-1', usecols=[logcolumn])
+            arrays.append(df[logcolumn].values)
+        (centrebins, counts) = batchHistogram(arrays, config['fmin'], config['fmax'], config['binwidth'])
+        files = [join(split(f)[0], config['histofile']) for f in datafiles]
+        return HistogramMatrix(files, centrebins, counts, logcolumn)
+
+    @staticmethod
+    def batchBase(basefiles, configfile=None, alpha=False):
+        """
+        Histograms of all cells from base histograms - log10D data is not read (no files or plots)
+        :param basefiles: base histogram files (see saveBase)
+        :param configfile: config params - bins must align with base bins
+        :param alpha: histograms of alpha column instead of log10D
+        :return: HistogramMatrix with rows named as histogram files
+        """
+        config = histogramConfig(configfile, alpha)
+        bases = [loadBase(f, config['basewidth']) for f in basefiles]
+        (centrebins, counts) = rebinHistogram(bases, config['fmin'], config['fmax'], config['binwidth'],
+                                              config['basewidth'])
+        files = [join(split(f)[0], config['histofile']) for f in basefiles]
+        return HistogramMatrix(files, centrebins, counts, config['logcolumn'])
+
+    def saveBase(self, outputdir=None):
+        """
+        Save base histogram of data (counts in bins of BASE_BINWIDTH) next to histogram
+        :param outputdir: where to save npz file
+        :return: base filename or None if no data
+        """
+        if self.data.empty or self.logcolumn not in self.data.columns:
+            return None
+        if outputdir is None:
+            outputdir = self.inputdir
+        (offset, counts, edgevalues, edgecounts) = baseHistogram(self.data[self.logcolumn].values, self.basewidth)
+        outputfile = join(outputdir, self.basefile)
+        np.savez_compressed(outputfile, offset=offset, counts=counts, edgevalues=edgevalues, edgecounts=edgecounts,
+                            base=self.basewidth)
+        return outputfile
+
+    def loadBase(self, basefile=None):
+        """
+        Load base histogram - histogram is then generated from base instead of data
+        :param basefile: npz file (default basefile in input directory)
+        :return: (offset, counts, edgevalues, edgecounts) - ValueError if base bin width differs from config
+        """
+        if basefile is None:
+            basefile = join(self.inputdir, self.basefile)
+        self.base = loadBase(basefile, self.basewidth)
+        return self.base
+
     def getStats(self, bimodal=True):
         """
         Get stats from histogram column
@@ -103,35 +386,37 @@ class HistogramLogD():
     def bimodal(self, x, mu1, sigma1, A1, mu2, sigma2, A2):
         return self.gauss(x, mu1, sigma1, A1) + self.gauss(x, mu2, sigma2, A2)
 
-    def generateHistogram(self, freq=0,outputdir=None):
+    def generateHistogram(self, freq=0,outputdir=None, savefile=True):
         """
         Generate histogram and save to outputdir
         :param outputdir: where to save csv and png files to
         :param freq: 0=relative freq, 1=density, 2=cumulative
+        :param savefile: write histogram csv (histdata is always set)
         :return:
         """
-        if not self.data.empty:
+        if not self.data.empty or self.base is not None:
             print("Generating histogram")
             if outputdir is None:
                 outputdir = self.inputdir
-            data = self.data[self.logcolumn]
             # Require centre-bins to match with Graphpad Prism histogram but numpy uses bin-edges
-            # Generate bins around centers
-            xmin = self.fmin - (self.binwidth / 2)
-            xmax = self.fmax + (self.binwidth / 2)
-            n_bins = int(abs((self.fmax - self.fmin) / self.binwidth)) + 1
-            # Generate histogram counts
-            n, bins = np.histogram(data, bins=n_bins, range=(xmin, xmax))
+            # Generate histogram counts with bins labelled as centres
+            if self.base is not None:
+                (centrebins, counts) = rebinHistogram([self.base], self.fmin, self.fmax, self.binwidth,
+                                                      self.basewidth)
+            else:
+                data = self.data[self.logcolumn]
+                (centrebins, counts) = batchHistogram([data.values], self.fmin, self.fmax, self.binwidth)
+            n = counts[0]
             # h = histogram(A,edges,'Normalization','pdf') - PDF normalization gives total=1
             sum_n = sum(n)
-            area_n = sum(n*self.binwidth)
-            # Relabel bins as centres
-            centrebins = np.linspace(self.fmin, self.fmax, n_bins)
             n_norm = n / sum_n
             self.histdata = pandas.DataFrame({'bins': centrebins, self.logcolumn: n_norm})
             outputfile = join(outputdir, self.histofile)
-            self.histdata.to_csv(outputfile, index=False)
-            print("Saved histogram data to ", outputfile)
+            if savefile:
+                self.histdata.to_csv(outputfile, index=False)
+                print("Saved histogram data to ", outputfile)
+                self.accumulatorfile = saveCellAccumulator(outputfile, centrebins.tolist(),
+                                                           StatsAccumulator(len(n_norm), sketch=self.sketch).add(n_norm))
             figtype = 'png'  # png, pdf, ps, eps and svg.
             figfile = outputfile.replace('csv', figtype)
             try:
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+MSD Analysis: limitIndex
+Sorted log10D values of a cell with the permutation back to row order - the rows retained by the
+filter limits (MINLIMIT < log10D < MAXLIMIT) are a slice of the sorted values:
+
+    retained = order[searchsorted(sorted, min, 'right'):searchsorted(sorted, max, 'left')]
+
+so counts for any number of limit pairs (eg live previews while editing limits, or a sweep report with
+MINLIMIT_SWEEP and MAXLIMIT_SWEEP in config as start:stop:step or a list) do not read the data again.
+
+Indexes are built on request (FilterMSD.limitIndex - not by the filter itself) and saved with each D data
+file as <datafile>.log10D (see dataCache).
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import logging
+from collections import OrderedDict
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from msdapp.msd.dataCache import DataCache
+from msdapp.utils import sweepThresholds
+
+# Cache directory suffix of index saved with data file
+LIMITINDEX_SUFFIX = '.log10D'
+
+
+class LimitIndex():
+    def __init__(self, values=None, sortedvalues=None, order=None):
+        """
+        :param values: log10D of each row (NaN rows are never retained)
+        :param sortedvalues, order: saved index instead of values
+        """
+        if values is not None:
+            values = np.asarray(values, dtype=np.float64).ravel()
+            # NaN sorted to end
+            order = np.argsort(values, kind='stable')
+            sortedvalues = values[order]
+        self.sorted = sortedvalues
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def bounds(self, minlimit, maxlimit):
+        """
+        Slices of sorted values within limits (exclusive)
+        :param minlimit: min log10D (scalar or array)
+        :param maxlimit: max log10D (scalar or array)
+        :return: (lo, hi) - hi less than lo if no values
+        """
+        lo = np.searchsorted(self.sorted, minlimit, side='right')
+        hi = np.searchsorted(self.sorted, maxlimit, side='left')
+        return (lo, hi)
+
+    def count(self, minlimit, maxlimit):
+        """
+        Number of rows within limits
+        :param minlimit: min log10D (scalar or array)
+        :param maxlimit: max log10D (scalar or array)
+        :return: count (or array of counts)
+        """
+        (lo, hi) = self.bounds(minlimit, maxlimit)
+        return np.maximum(hi - lo, 0)
+
+    def rows(self, minlimit, maxlimit):
+        """
+        Rows within limits in original row order (as data[(log10D > minlimit) & (log10D < maxlimit)])
+        :param minlimit: min log10D
+        :param maxlimit: max log10D
+        :return: array of row positions
+        """
+        (lo, hi) = self.bounds(minlimit, maxlimit)
+        return np.sort(self.order[lo:max(hi, lo)])
+
+    def save(self, datafile, params=None):
+        """
+        Save index with data file - see dataCache
+        :param datafile: D data file
+        :param params: parameters used to calculate log10D
+        :return: True if saved
+        """
+        return DataCache(datafile, LIMITINDEX_SUFFIX).save(
+            OrderedDict([('sorted', self.sorted), ('order', self.order)]), params)
+
+    @staticmethod
+    def load(datafile, params=None):
+        """
+        Load saved index of data file
+        :param datafile: D data file
+        :param params: parameters used to calculate log10D - must match saved values
+        :return: LimitIndex or None if not saved or out of date
+        """
+        arrays = DataCache(datafile, LIMITINDEX_SUFFIX).load(params=params)
+        if arrays is None:
+            return None
+        return LimitIndex(sortedvalues=arrays['sorted'], order=arrays['order'])
+
+
+def limitPairs(config):
+    """
+    (min, max) limit pairs from config - all combinations of MINLIMIT_SWEEP and MAXLIMIT_SWEEP
+    (MINLIMIT or MAXLIMIT if no sweep)
+    :param config: ConfigObj or dict
+    :return: list of (min, max) or empty list if no sweep in config
+    """
+    if 'MINLIMIT_SWEEP' not in config and 'MAXLIMIT_SWEEP' not in config:
+        return []
+    mins = sweepThresholds(config['MINLIMIT_SWEEP'] if 'MINLIMIT_SWEEP' in config else config['MINLIMIT'])
+    maxs = sweepThresholds(config['MAXLIMIT_SWEEP'] if 'MAXLIMIT_SWEEP' in config else config['MAXLIMIT'])
+    return list(product(mins, maxs))
+
+
+def limitCounts(indexes, pairs):
+    """
+    Retained rows of each cell for each limit pair
+    :param indexes: OrderedDict of name: LimitIndex
+    :param pairs: list of (min, max)
+    :return: dataframe with rows per pair and cell - Cell 'ALL' for totals of all cells
+    """
+    pairs = np.asarray(pairs, dtype=np.float64).reshape(-1, 2)
+    names = list(indexes.keys())
+    counts = np.array([indexes[n].count(pairs[:, 0], pairs[:, 1]) for n in names]).reshape(len(names), len(pairs))
+    totals = np.array([len(indexes[n]) for n in names])
+    # pairs x (cells + ALL)
+    retained = np.column_stack([counts.T, counts.sum(axis=0)])
+    total = np.tile(np.append(totals, totals.sum()), (len(pairs), 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = retained / total
+    ncols = len(names) + 1
+    logging.debug("LimitIndex: counts of %d cells for %d limits", len(names), len(pairs))
+    return pd.DataFrame(OrderedDict([('MinLimit', np.repeat(pairs[:, 0], ncols)),
+                                     ('MaxLimit', np.repeat(pairs[:, 1], ncols)),
+                                     ('Cell', np.tile(names + ['ALL'], len(pairs))),
+                                     ('Total', total.ravel()), ('Retained', retained.ravel()),
+                                     ('Fraction', fraction.ravel())]))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+MSD Analysis: msdIndex
+Byte-offset index of trajectory rows in a raw MSD text file (AllROI-MSD.txt) - the parser keeps only the
+first MSD_POINTS lags of each row but records where each row starts and how many fields it has:
+
+    offset (int64)   <-- byte position of row in file
+    fields (int32)   <-- tab separated fields in row (ROI, Trace, lags ...)
+
+so the full-length MSD of any trajectory can be read later by seeking to its row, without parsing the
+file again. The index is saved with the parsed MSD file cache (see dataCache, filterMSD) and rows are
+numbered as in the parsed data (eg index of Filtered_MSD.csv).
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import logging
+
+import numpy as np
+
+from msdapp.msd.dataCache import DataCache
+
+
+def parseLags(line):
+    """
+    MSD values of a row of the raw MSD file
+    :param line: bytes of row (ROI, Trace, lags ...)
+    :return: numpy array of lags - blank fields are NaN
+    """
+    fields = line.rstrip(b'\r\n').split(b'\t')[2:]
+    try:
+        return np.array(fields, dtype=np.float64)
+    except ValueError:
+        # blank fields (eg trailing tabs)
+        return np.array([float(x) if len(x.strip()) > 0 else np.nan for x in fields], dtype=np.float64)
+
+
+class MSDIndex():
+    def __init__(self, datafile_msd, offsets, fields):
+        """
+        :param datafile_msd: raw MSD text file
+        :param offsets: byte offset of each row
+        :param fields: number of fields in each row
+        """
+        self.datafile_msd = datafile_msd
+        self.offsets = offsets
+        self.fields = fields
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def lags(self, rows=None):
+        """
+        Number of MSD values of rows
+        :param rows: row numbers (default all)
+        :return: array of lags
+        """
+        fields = self.fields if rows is None else self.fields[np.asarray(rows, dtype=np.intp)]
+        return np.maximum(fields - 2, 0)
+
+    def trajectory(self, row):
+        """
+        Full-length MSD of a single row
+        :param row: row number
+        :return: numpy array of lags
+        """
+        with open(self.datafile_msd, 'rb') as f:
+            f.seek(int(self.offsets[row]))
+            return parseLags(f.readline())
+
+    def read(self, rows, maxlags=None):
+        """
+        Full-length MSD of rows - rows are read in file order with one open file
+        :param rows: row numbers
+        :param maxlags: max lags per row (default longest row)
+        :return: numpy array rows x lags padded with NaN
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        lags = self.lags(rows)
+        if maxlags is None:
+            maxlags = int(lags.max()) if len(rows) > 0 else 0
+        msd = np.full((len(rows), maxlags), np.nan)
+        with open(self.datafile_msd, 'rb') as f:
+            for i in np.argsort(self.offsets[rows], kind='stable'):
+                f.seek(int(self.offsets[rows[i]]))
+                values = parseLags(f.readline())[:maxlags]
+                msd[i, :len(values)] = values
+        logging.debug("MSDIndex: read %d trajectories from %s", len(rows), self.datafile_msd)
+        return msd
+
+    @staticmethod
+    def load(datafile_msd):
+        """
+        Index saved with parsed MSD file cache
+        :param datafile_msd: raw MSD text file
+        :return: MSDIndex or None if no valid cache
+        """
+        arrays = DataCache(datafile_msd).load(names=['Offset', 'Fields'])
+        if arrays is None:
+            return None
+        return MSDIndex(datafile_msd, arrays['Offset'], arrays['Fields'])
@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 """
 MSD Analysis script: ratioStats
-Compares ratios from compiled files
+Compares ratios from compiled files of two or more groups - all pairs of groups or each group vs a control group
+(CONTROL_GROUP in config). Compiled files of each group are loaded once and shared by all comparisons and plots.
 1. NOSTIM_ratios.csv and STIM_ratios.csv
 2. Runs paired t-test 2 tailed (p<0.05)
 3. Output ratio_stats.csv
-4. Generates comparative overlay plots for STIM vs NOSTIM
+4. Summary of each group and both groups merged from saved accumulators (see statsAccumulator)
+5. Comparisons of every metric, MSD lag and histogram bin with T-test, Welch, Mann-Whitney and permutation
+   tests (PERMUTATIONS in config) and FDR q-values -> comparisons.csv (see compareStats)
+6. With BOOTSTRAP in config, bootstrap CIs (resampling cells - see bootstrapStats) of the mean MSD curve,
+   group ratio (mean mobile / mean immobile), mean cell ratio and mean MSD area of each group -> bootstrap.csv
+   and CIs of the group differences next to the t-tests (mean cell ratio for the t-test of cell ratios)
+7. Generates comparative overlay plots for STIM vs NOSTIM
     a. Avg MSD +/- SD
     b. Avg Log10D +/- SD
     c. Mobile fraction ratios as grouped scatterplots with mean +/- SD
@@ -17,6 +24,9 @@ Created on Tue Sep 5 2017
 """
 
 import argparse
+import logging
+from collections import OrderedDict, Counter
+from itertools import combinations
 from os import R_OK, access
 from os.path import join, expanduser
 import matplotlib.pyplot as plt
@@ -24,20 +34,30 @@ import pandas as pd
 #import plotly.graph_objs as go
 from plotly.graph_objs import Layout, Scatter, Box
 from configobj import ConfigObj, ConfigObjError
-from numpy import isnan, inf
+from numpy import isnan, isfinite, inf, errstate, array, where, nan
 from plotly import offline, tools
-from scipy import stats
 from seaborn import boxplot, swarmplot
 
+from msdapp.msd.bootstrapStats import Bootstrap
+from msdapp.msd.compareStats import GroupComparison, studentTest
+from msdapp.msd.statsAccumulator import loadAccumulators, mergeAccumulators
+
+# Plot colors of groups in order (repeated for more groups)
+PLOT_COLORS = ['rgb(255,140,0)', 'rgb(70,130,180)', 'rgb(60,179,113)', 'rgb(220,20,60)', 'rgb(138,43,226)',
+               'rgb(128,128,128)']
+# Group accumulators saved by CompareMSD and HistoStats
+SUMMARY_ACCUMULATORS = ['POOLED', 'CELLMEANS', 'CELLS']
+
 
 class MSDStats():
-    def __init__(self, inputdirs, outputdir, prefixes=None, configfile=None):
+    def __init__(self, inputdirs, outputdir, prefixes=None, configfile=None, control=None):
         """
         Load initial data
-        :param inputdirs: [in1, in2]
+        :param inputdirs: [in1, in2, ...] directory of each group (or one directory for all groups)
         :param outputdir: outputdir
-        :param prefixes: [prefix1, prefix2]
+        :param prefixes: [prefix1, prefix2, ...]
         :param configfile: config params
+        :param control: control group - each group is compared with control (default CONTROL_GROUP or all pairs)
         """
         self.encoding = 'ISO-8859-1'
         self.__loadConfig(configfile)
@@ -46,13 +66,26 @@ class MSDStats():
             self.prefixes = [self.group1, self.group2]
         else:
             self.prefixes = prefixes
+        if len(self.prefixes) < 2:
+            raise ValueError("MSDStats: at least two groups are required")
+        if len(inputdirs) == 1:
+            inputdirs = inputdirs * len(self.prefixes)
+        elif len(inputdirs) != len(self.prefixes):
+            raise ValueError("MSDStats: one input directory is required for each group")
+        self.inputdirs = inputdirs
+        self.pairs = self.__comparisonPairs(control if control is not None else self.control)
+        # Compiled tables of each group by (group index, table) - loaded once
+        self.cache = dict()
+        self.cellvalues = dict()
         self.outputfilename = "_".join(self.prefixes) + '_stats.csv'
-        self.histodata = self.__loadData(inputdirs[0], inputdirs[1], self.histo, 'bins')
-        self.ratiodata = self.__loadData(inputdirs[0], inputdirs[1], 'ratios.csv', 'Cell')
-        self.areadata = self.__loadData(inputdirs[0], inputdirs[1], 'areas.csv', 'Cell')
-        # self.msddata = self.__loadData(inputdirs[0], inputdirs[1], self.msd, 'Cell')
-        # self.msddatafiles = []
-        self.msddatafiles = [join(inputdirs[i], self.prefixes[i] + "_" + self.msd) for i in [0, 1]]
+        self.histodata = self.__mergeGroups('histogram', 'bins')
+        self.ratiodata = self.__mergeGroups('ratios', 'Cell')
+        self.areadata = self.__mergeGroups('areas', 'Cell')
+        self.msddatafiles = [self.__groupFile(i, 'msd') for i in range(len(self.prefixes))]
+        self.summaryfilename = "_".join(self.prefixes) + '_summary.csv'
+        self.bootstrapfilename = "_".join(self.prefixes) + '_bootstrap.csv'
+        self.comparisonsfilename = "_".join(self.prefixes) + '_comparisons.csv'
+        self.resamples = None
 
     def __loadConfig(self, configfile):
         """
@@ -66,92 +99,295 @@ class MSDStats():
                 self.config = config
                 self.histo = config['ALLSTATS_FILENAME']
                 self.msd = config['AVGMSD_FILENAME']
+                self.logd = config['BATCHD_FILENAME'] if 'BATCHD_FILENAME' in config else 'All_log10D.csv'
                 self.msdpoints = int(config['MSD_POINTS'])
                 self.timeint = float(config['TIME_INTERVAL'])
                 self.group1 = config['GROUP1']
                 self.group2 = config['GROUP2']
+                self.bootstrap = None
+                if 'BOOTSTRAP' in config and int(config['BOOTSTRAP']) > 0:
+                    self.bootstrap = Bootstrap(int(config['BOOTSTRAP']),
+                                               float(config['BOOTSTRAP_CI']) if 'BOOTSTRAP_CI' in config else 95.0,
+                                               int(config['BOOTSTRAP_SEED']) if 'BOOTSTRAP_SEED' in config else 0,
+                                               int(config['BOOTSTRAP_WORKERS']) if 'BOOTSTRAP_WORKERS' in config else 1)
+                self.control = config['CONTROL_GROUP'] if 'CONTROL_GROUP' in config else None
+                self.comparison = GroupComparison(
+                    int(config['PERMUTATIONS']) if 'PERMUTATIONS' in config else 10000,
+                    int(config['PERMUTATION_SEED']) if 'PERMUTATION_SEED' in config else 0)
                 print("MSDStats: Config file loaded")
             else:
                 self.histo = 'AllHistogram_log10D.csv'
                 self.msd = 'Avg_MSD.csv'
+                self.logd = 'All_log10D.csv'
                 self.msdpoints = 10
                 self.timeint = 0.02
                 self.group1 = 'STIM'
                 self.group2 = 'NOSTIM'
+                self.bootstrap = None
+                self.control = None
+                self.comparison = GroupComparison()
                 print("MSDStats: using config defaults")
         except ConfigObjError as c:
             raise ValueError("ERROR: config file load error: %s", configfile)
 
-    def __loadData(self, dir1, dir2, basename, mergefield):
+    def __comparisonPairs(self, control):
         """
-        Find AllHistogram files for each
-        :param dir1: group1 directory
-        :param dir2: group2 directory
-        :param basename: filename to search for +prefix
-        :return:
+        Pairs of groups to compare
+        :param control: control group (prefix or group name at end of prefix) or None for all pairs
+        :return: list of (group index, group index) - (group, control) for control
         """
-        # Load from csv and merge
-        data = None
-        try:
-            dirs = [dir1, dir2]
-            files = []
-            i = 0
-            for prefix in self.prefixes:
-                files.append(join(dirs[i], prefix + "_" + basename))
-                i = i + 1
-            prefixes = ["_" + p for p in self.prefixes]
-            if len(files) == 2:
-                data = pd.read_csv(files[0])
-                data2 = pd.read_csv(files[1])
-                data = data.merge(data2, how='outer', left_on=mergefield, right_on=mergefield, suffixes=prefixes)
-
-        except ValueError as e:
-            print('Error: Unable to merge data files:', e)
-            raise e
+        if control is None or len(control) <= 0:
+            return list(combinations(range(len(self.prefixes)), 2))
+        matches = [i for (i, p) in enumerate(self.prefixes) if p == control]
+        if len(matches) <= 0:
+            matches = [i for (i, p) in enumerate(self.prefixes) if p.upper().endswith(control.upper())]
+        if len(matches) != 1:
+            raise ValueError("MSDStats: control group not found in groups: %s" % control)
+        return [(i, matches[0]) for i in range(len(self.prefixes)) if i != matches[0]]
+
+    def __groupFile(self, i, table):
+        """
+        Compiled file of group
+        :param i: group index
+        :param table: histogram, ratios, areas, msd or logd
+        :return: filename
+        """
+        basenames = {'histogram': self.histo, 'ratios': 'ratios.csv', 'areas': 'areas.csv', 'msd': self.msd,
+                     'logd': self.logd}
+        return join(self.inputdirs[i], self.prefixes[i] + "_" + basenames[table])
 
+    def getTable(self, i, table):
+        """
+        Compiled table of group - each file is read once
+        :param i: group index
+        :param table: histogram, ratios, areas (required) or msd, logd (None if not found)
+        :return: dataframe
+        """
+        key = (i, table)
+        if key not in self.cache:
+            filename = self.__groupFile(i, table)
+            if table in ['msd', 'logd'] and not access(filename, R_OK):
+                self.cache[key] = None
+            else:
+                try:
+                    self.cache[key] = pd.read_csv(filename)
+                except ValueError as e:
+                    print('Error: Unable to load data file:', e)
+                    raise e
+        return self.cache[key]
+
+    def __mergeGroups(self, table, mergefield):
+        """
+        Merge table of all groups - columns found in more than one group get suffix _prefix (as with two groups)
+        :param table: histogram, ratios or areas
+        :param mergefield: column to merge on
+        :return: dataframe
+        """
+        frames = [self.getTable(i, table) for i in range(len(self.prefixes))]
+        counts = Counter([c for df in frames for c in df.columns if c != mergefield])
+        data = None
+        for (prefix, df) in zip(self.prefixes, frames):
+            df = df.rename(columns=dict([(c, c + "_" + prefix) for c in df.columns
+                                         if c != mergefield and counts[c] > 1]))
+            data = df if data is None else data.merge(df, how='outer', on=mergefield)
         return data
 
     def runTtests(self):
         """
-         T-test on TWO RELATED samples of scores, a and b.
-         This is a two-sided test for the null hypothesis that 2 related or repeated samples have identical average (expected) values.
+        T-test of cell ratios and MSD areas of each pair of groups (independent samples, equal variance).
+        This is a two-sided test for the null hypothesis that the 2 groups have identical average (expected) values.
         :return: dataframe
         """
         print("Running t-tests on data")
         headers = ['Compare', 'Groups', 'T-test', 'p-value', 'Significance (0.05)']
-        df = pd.DataFrame(columns=headers)
-        # Ratios comparison
-        if self.ratiodata is not None:
-            # extract data columns for testing
-            cond1 = [s for s in self.ratiodata['Ratio_' + self.prefixes[0]] if not isnan(s)]
-            cond2 = [s for s in self.ratiodata['Ratio_' + self.prefixes[1]] if not isnan(s)]
-            (dstats, p) = stats.ttest_ind(cond1, cond2)
-            # Output as CSV
-            if not isnan(p):
-                signif = (p < 0.05)
-            else:
-                signif = 'unknown'
-            data = ['Ratios', " vs ".join(self.prefixes), dstats, p, signif]
-            df1 = pd.DataFrame([data], columns=headers)
-            df = df.append(df1)
-
-        # Areas comparison
-        if self.areadata is not None:
-            # Exclude ALL row
-            areas = self.areadata[self.areadata['Cell'] != 'ALL']
-            cond1 = [s for s in areas['MSD Area_' + self.prefixes[0]] if not isnan(s)]
-            cond2 = [s for s in areas['MSD Area_' + self.prefixes[1]] if not isnan(s)]
-            (dstats, p) = stats.ttest_ind(cond1, cond2)
-            # Output as CSV
-            if not isnan(p):
-                signif = (p < 0.05)
+        if self.bootstrap is not None:
+            headers += ['Difference', 'CI lower', 'CI upper']
+        rows = []
+        # Ratios comparison - t-test of cell ratios so difference of mean cell ratios (bootstrap of Cell Ratio)
+        # Areas comparison - without ALL row
+        tests = [('Ratios', 'Ratio', 'Cell Ratio'), ('MSD Area', 'MSD Area', 'MSD Area')]
+        for pair in self.pairs:
+            prefixes = [self.prefixes[i] for i in pair]
+            for (compare, values, data) in tests:
+                # per group tables (as comparisons) - cell IDs may repeat across groups
+                (cond1, cond2) = [self.__cellValues(i)[values][1] for i in pair]
+                (dstats, p) = [v[0] for v in studentTest(cond1, cond2)]
+                # Output as CSV
+                if not isnan(p):
+                    signif = (p < 0.05)
+                else:
+                    signif = 'unknown'
+                row = [compare, " vs ".join(prefixes), dstats, p, signif]
+                if self.bootstrap is not None:
+                    row += self.bootstrapDifference(data, pair)
+                rows.append(row)
+        return pd.DataFrame(rows, columns=headers)
+
+    def __cellValues(self, i):
+        """
+        Per cell values of group for comparisons - non-finite ratios (no immobile fraction) are excluded
+        :param i: group index
+        :return: OrderedDict of data: (fields, numpy array cells x fields)
+        """
+        if i in self.cellvalues:
+            return self.cellvalues[i]
+        values = OrderedDict()
+        ratios = self.getTable(i, 'ratios')['Ratio'].dropna().values.astype(float)
+        values['Ratio'] = (['Ratio'], where(isfinite(ratios), ratios, nan)[:, None])
+        areas = self.getTable(i, 'areas')
+        areas = areas[areas['Cell'] != 'ALL']['MSD Area'].dropna().values.astype(float)
+        values['MSD Area'] = (['MSD Area'], areas[:, None])
+        logd = self.getTable(i, 'logd')
+        if logd is not None:
+            values['Mean log10D'] = (['Mean log10D'], logd.mean().values.astype(float)[:, None])
+        df = self.getTable(i, 'msd')
+        if df is not None:
+            df = df[(df['Stats'] == 'Mean') & (df['Cell'] != 'ALL')]
+            values['MSD'] = ([x * self.timeint for x in range(1, self.msdpoints + 1)],
+                             df[[str(x) for x in range(1, self.msdpoints + 1)]].values.astype(float))
+        df = self.getTable(i, 'histogram')
+        # cell columns are before summary statistics
+        cells = list(df.columns[1:list(df.columns).index('MEAN')])
+        values['Histogram'] = (df['bins'].tolist(), df[cells].values.astype(float).T)
+        self.cellvalues[i] = values
+        return values
+
+    def runComparisons(self):
+        """
+        T-test, Welch, Mann-Whitney and permutation tests of every metric (ratio, MSD area, mean log10D)
+        and of each MSD lag and histogram bin - with FDR q-values over the lags and bins (see compareStats)
+        :return: dataframe with a row per metric and field or None if no data
+        """
+        print("Running comparisons of groups with %d permutations" % self.comparison.nperm)
+        frames = [self.comparison.compare(self.__cellValues(i), self.__cellValues(j),
+                                          [self.prefixes[i], self.prefixes[j]]) for (i, j) in self.pairs]
+        frames = [df for df in frames if df is not None]
+        if len(frames) <= 0:
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+    def __groupValues(self, i):
+        """
+        Per cell values of group for bootstrap
+        :param i: group index
+        :return: OrderedDict of data: numpy array cells x fields (MSD curves, Immobile/Mobile, cell ratio, MSD Area)
+        """
+        values = OrderedDict()
+        df = self.getTable(i, 'msd')
+        if df is not None:
+            df = df[(df['Stats'] == 'Mean') & (df['Cell'] != 'ALL')]
+            values['MSD'] = df[[str(x) for x in range(1, self.msdpoints + 1)]].values.astype(float)
+        ratios = self.getTable(i, 'ratios')
+        values['Ratio'] = ratios[['Immobile', 'Mobile']].dropna(how='all').values.astype(float)
+        # cell ratios as in t-tests and comparisons - non-finite ratios are excluded
+        cellratios = ratios['Ratio'].dropna().values.astype(float)
+        values['Cell Ratio'] = where(isfinite(cellratios), cellratios, nan)[:, None]
+        areas = self.getTable(i, 'areas')
+        values['MSD Area'] = areas[areas['Cell'] != 'ALL']['MSD Area'].dropna().values.astype(float)[:, None]
+        return values
+
+    def __statistic(self, data, means):
+        """
+        Group statistic from means of each field (per resample or of cells)
+        :param data: MSD, Ratio, Cell Ratio or MSD Area
+        :param means: numpy array resamples x fields
+        :return: numpy array resamples x statistics
+        """
+        if data == 'Ratio':
+            # group ratio of mean mobile to mean immobile fractions
+            with errstate(invalid='ignore', divide='ignore'):
+                return means[:, 1:2] / means[:, 0:1]
+        return means
+
+    def getResamples(self):
+        """
+        Bootstrap of each group - all resamples held for CIs of group differences
+        :return: OrderedDict of (data, prefix): (estimate, resampled statistics)
+        """
+        if self.resamples is None:
+            self.resamples = OrderedDict()
+            for i in range(len(self.prefixes)):
+                for (data, values) in self.__groupValues(i).items():
+                    estimate = self.__statistic(data, array([pd.DataFrame(values).mean().values]))[0]
+                    samples = self.__statistic(data, self.bootstrap.resample(values, group=i))
+                    self.resamples[(data, self.prefixes[i])] = (estimate, samples)
+        return self.resamples
+
+    def bootstrapDifference(self, data, pair=(0, 1)):
+        """
+        Bootstrap CI of difference between groups (first - second)
+        :param data: Ratio, Cell Ratio or MSD Area
+        :param pair: group indices
+        :return: [difference, CI lower, CI upper]
+        """
+        resamples = self.getResamples()
+        keys = [(data, self.prefixes[i]) for i in pair]
+        if not all([k in resamples for k in keys]):
+            return [None, None, None]
+        (e1, s1) = resamples[keys[0]]
+        (e2, s2) = resamples[keys[1]]
+        (lower, upper) = self.bootstrap.interval(s1 - s2)
+        return [e1[0] - e2[0], lower[0], upper[0]]
+
+    def runBootstrap(self):
+        """
+        Bootstrap CIs of each group: mean MSD at each lag, group ratio, mean cell ratio and mean MSD area
+        :return: dataframe (Data, Group, Field, Estimate, CI lower, CI upper) or None if not configured
+        """
+        if self.bootstrap is None:
+            return None
+        print("Running bootstrap with %d resamples" % self.bootstrap.nboot)
+        headers = ['Data', 'Group', 'Field', 'Estimate', 'CI lower', 'CI upper']
+        frames = []
+        for ((data, prefix), (estimate, samples)) in self.getResamples().items():
+            (lower, upper) = self.bootstrap.interval(samples)
+            if data == 'MSD':
+                fields = [x * self.timeint for x in range(1, self.msdpoints + 1)]
             else:
-                signif = 'unknown'
-            data = ['MSD Area', " vs ".join(self.prefixes), dstats, p, signif]
-            df1 = pd.DataFrame([data], columns=headers)
-            df = df.append(df1)
+                fields = [data]
+            frames.append(pd.DataFrame(OrderedDict([('Data', data), ('Group', prefix), ('Field', fields),
+                                                    ('Estimate', estimate), ('CI lower', lower),
+                                                    ('CI upper', upper)]), columns=headers))
+        return pd.concat(frames, ignore_index=True)
 
-        return df
+    def summarizeGroups(self):
+        """
+        Summary statistics per field of each group and of all groups merged - from accumulators saved
+        with compiled MSD and histogram files (no cell data is loaded)
+        :return: dataframe (Data, Group, Accumulator, Field, MEAN, SEM, COUNT, STD, MEDIAN, MIN, MAX) or None
+        """
+        print("Summarizing groups from accumulators")
+        headers = ['Data', 'Group', 'Accumulator', 'Field', 'MEAN', 'SEM', 'COUNT', 'STD', 'MEDIAN', 'MIN', 'MAX']
+        frames = []
+        for (data, basename) in [('MSD', '_MSD_accumulators.json'), ('Histogram', '_Histogram_accumulators.json'),
+                                 ('Alpha', '_Histogram_alpha_accumulators.json')]:
+            files = [join(self.inputdirs[i], self.prefixes[i] + basename) for i in range(len(self.prefixes))]
+            if not all([access(f, R_OK) for f in files]):
+                logging.info("MSDStats: no accumulators for %s summary", data)
+                continue
+            saved = [loadAccumulators(f) for f in files]
+            fields = saved[0][0]
+            groups = list(zip(self.prefixes, [s[1] for s in saved]))
+            if all([s[0] == fields for s in saved]):
+                # Merge each group accumulator (not cells) over groups
+                names = [n for n in groups[0][1].keys() if n in SUMMARY_ACCUMULATORS]
+                merged = OrderedDict([(n, mergeAccumulators([accs[n] for (g, accs) in groups])) for n in names])
+                groups.append(('ALL', merged))
+            else:
+                logging.warning("MSDStats: %s fields differ between groups - not merged", data)
+            for (group, accs) in groups:
+                for (name, acc) in accs.items():
+                    if name not in SUMMARY_ACCUMULATORS:
+                        continue
+                    df = pd.DataFrame(acc.stats())
+                    df.insert(0, 'Field', fields)
+                    df.insert(0, 'Accumulator', name)
+                    df.insert(0, 'Group', group)
+                    df.insert(0, 'Data', data)
+                    frames.append(df.reindex(columns=headers))
+        if len(frames) <= 0:
+            return None
+        return pd.concat(frames, ignore_index=True)
 
     def showMSDAvgPlot(self, ax=None):
         """
@@ -163,8 +399,8 @@ class MSDStats():
             fig, ax = plt.subplots()
         x = [str(x) for x in range(1, self.msdpoints + 1)]
         xi = [x * self.timeint for x in range(1, self.msdpoints + 1)]  # convert to times
-        for file in self.msddatafiles:
-            df = pd.read_csv(file)
+        for i in range(len(self.prefixes)):
+            df = self.getTable(i, 'msd')
             all = df.groupby('Cell').get_group('ALL')
             allmeans = all.groupby('Stats').get_group('Mean')
             allsems = all.groupby('Stats').get_group('SEM')
@@ -256,7 +492,7 @@ class MSDStats():
         linewidth = 1.5
         markerdiam = 4
         errbarw = 3
-        colors = {self.prefixes[0]: 'rgb(255,140,0)', self.prefixes[1]: 'rgb(70,130,180)'}
+        colors = dict([(prefix, PLOT_COLORS[i % len(PLOT_COLORS)]) for (i, prefix) in enumerate(self.prefixes)])
         # HistoAvg
         trace1 = []
         df = self.histodata
@@ -274,9 +510,8 @@ class MSDStats():
         x = [str(x) for x in range(1, self.msdpoints + 1)]
         xi = [x * self.timeint for x in range(1, self.msdpoints + 1)]  # convert to times
 
-        i = 0
-        for file in self.msddatafiles:
-            df = pd.read_csv(file)
+        for i in range(len(self.prefixes)):
+            df = self.getTable(i, 'msd')
             all = df.groupby('Cell').get_group('ALL')
             allmeans = all.groupby('Stats').get_group('Mean')
             allsems = all.groupby('Stats').get_group('SEM')
@@ -286,7 +521,6 @@ class MSDStats():
                                      marker=dict(color=colors[self.prefixes[i]], size=markerdiam),
                                      error_y=dict(array=allsems[x].iloc[0], type='data', symmetric=True,
                                                   color=colors[self.prefixes[i]], thickness=linewidth, width=errbarw)))
-            i += 1
 
         # Ratios
         trace3 = []
@@ -307,14 +541,9 @@ class MSDStats():
         fig = tools.make_subplots(rows=2, cols=2, subplot_titles=(
         'Mean D with SEM', 'Mean MSD with SEM', 'Log10(D) Ratios', 'MSD Areas'))
 
-        fig.append_trace(trace1[0], 1, 1)
-        fig.append_trace(trace1[1], 1, 1)
-        fig.append_trace(trace2[0], 1, 2)
-        fig.append_trace(trace2[1], 1, 2)
-        fig.append_trace(trace3[0], 2, 1)
-        fig.append_trace(trace3[1], 2, 1)
-        fig.append_trace(trace4[0], 2, 2)
-        fig.append_trace(trace4[1], 2, 2)
+        for (traces, row, col) in [(trace1, 1, 1), (trace2, 1, 2), (trace3, 2, 1), (trace4, 2, 2)]:
+            for trace in traces:
+                fig.append_trace(trace, row, col)
 
         fig['layout'].update(height=800, width=800, title=title)
         fig['layout']['xaxis1'].update(title='Log<sub>10</sub>(D)')
@@ -342,6 +571,9 @@ if __name__ == "__main__":
     parser.add_argument('--dir2', action='store', help='Directory with group2 data', default="output")
     parser.add_argument('--prefix1', action='store', help='Group1', default="NOSTIM")
     parser.add_argument('--prefix2', action='store', help='Group2', default="STIM")
+    parser.add_argument('--prefixes', action='store', nargs='+', help='Groups (instead of prefix1 and prefix2)')
+    parser.add_argument('--dirs', action='store', nargs='+', help='Directory of each group (or one for all groups)')
+    parser.add_argument('--control', action='store', help='Control group (default all pairs of groups)')
     parser.add_argument('--outputdir', action='store', help='Output directory (must exist)', default="output")
     parser.add_argument('--config', action='store', help='Configfile', default="~\.msdcfg")
     args = parser.parse_args()
@@ -350,9 +582,20 @@ if __name__ == "__main__":
     else:
         configfile = args.config
     try:
-        rs = MSDStats([args.dir1, args.dir2], args.outputdir, [args.prefix1, args.prefix2], configfile)
+        prefixes = args.prefixes if args.prefixes is not None else [args.prefix1, args.prefix2]
+        dirs = args.dirs if args.dirs is not None else [args.dir1, args.dir2]
+        rs = MSDStats(dirs, args.outputdir, prefixes, configfile, args.control)
         results_df = rs.runTtests()
         print(results_df)
+        summary_df = rs.summarizeGroups()
+        if summary_df is not None:
+            summary_df.to_csv(join(args.outputdir, rs.summaryfilename), index=False)
+        bootstrap_df = rs.runBootstrap()
+        if bootstrap_df is not None:
+            bootstrap_df.to_csv(join(args.outputdir, rs.bootstrapfilename), index=False)
+        comparisons_df = rs.runComparisons()
+        if comparisons_df is not None:
+            comparisons_df.to_csv(join(args.outputdir, rs.comparisonsfilename), index=False)
         # rs.showPlots("Test cells")
         rs.showPlotly()
 
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+MSD Analysis: statsAccumulator
+Mergeable summary statistics - each cell (or group) emits an accumulator once and pooled summaries of
+groups or experiments (see msdStats summarizeGroups) are produced by merging accumulators without reloading
+the data.  Compiled tables per cell (eg Median rows) are still calculated exactly from the cell files.
+
+An accumulator holds per field (eg timepoint or bin) the count, sum, mean and M2 (sum of squared
+deviations, as Welford/Chan) and min/max.  An optional quantile sketch (relative accuracy, as DDSketch)
+gives approximate medians which are also mergeable - with QUANTILE_SKETCH = 1 in config (off by default
+as buckets are counted per field in Python; MEDIAN of summaries is NaN without it).
+
+Saved as json (min and max are null where no values):
+    {'fields': [field names], 'accumulators': {name: accumulator}}
+
+Cell processes (filter, histogram) save the accumulator of each cell output file next to it as
+<output>_accumulator.json (see saveCellAccumulator) for batch processes to merge.
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import json
+import logging
+from collections import OrderedDict
+from os import replace, R_OK, access
+from os.path import splitext, getmtime
+
+from numpy import zeros, full, inf, nan, isnan, nansum, where, sqrt, errstate, int64, log, ceil, \
+    unique, asarray, atleast_2d, array, isfinite, allclose
+
+# Name of accumulator in cell accumulator files
+CELL_ACCUMULATOR = 'CELL'
+
+
+class QuantileSketch():
+    def __init__(self, nfields, accuracy=0.01):
+        """
+        Counts of values in logarithmic buckets per field - quantiles are within accuracy (relative)
+        :param nfields: number of fields
+        :param accuracy: relative accuracy of quantiles
+        """
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.lngamma = log(self.gamma)
+        self.positive = [dict() for i in range(nfields)]
+        self.negative = [dict() for i in range(nfields)]
+        self.zeros = zeros(nfields, dtype=int64)
+
+    def __addBuckets(self, buckets, values):
+        if len(values) > 0:
+            (keys, counts) = unique(ceil(log(values) / self.lngamma).astype(int64), return_counts=True)
+            for (k, c) in zip(keys.tolist(), counts.tolist()):
+                buckets[k] = buckets.get(k, 0) + c
+
+    def add(self, values):
+        """
+        Add observations
+        :param values: numpy array observations x fields (NaN ignored)
+        """
+        for j in range(values.shape[1]):
+            col = values[:, j]
+            col = col[~isnan(col)]
+            self.__addBuckets(self.positive[j], col[col > 0])
+            self.__addBuckets(self.negative[j], -col[col < 0])
+            self.zeros[j] += (col == 0).sum()
+
+    def merge(self, other):
+        """
+        Add counts of another sketch (same accuracy)
+        :param other: QuantileSketch
+        """
+        if other.accuracy != self.accuracy:
+            raise ValueError("Cannot merge quantile sketches with different accuracy")
+        for j in range(len(self.zeros)):
+            for (mine, theirs) in [(self.positive[j], other.positive[j]), (self.negative[j], other.negative[j])]:
+                for (k, c) in theirs.items():
+                    mine[k] = mine.get(k, 0) + c
+        self.zeros += other.zeros
+
+    def quantile(self, q):
+        """
+        Approximate quantile per field
+        :param q: quantile 0-1
+        :return: array per field (NaN if no values)
+        """
+        rtn = full(len(self.zeros), nan)
+        for j in range(len(self.zeros)):
+            # ordered buckets: negative (largest magnitude first), zero, positive
+            buckets = [(k, c, -1) for (k, c) in sorted(self.negative[j].items(), reverse=True)]
+            buckets += [(0, int(self.zeros[j]), 0)]
+            buckets += [(k, c, 1) for (k, c) in sorted(self.positive[j].items())]
+            total = sum([b[1] for b in buckets])
+            if total <= 0:
+                continue
+            rank = q * (total - 1)
+            n = 0
+            for (k, c, sign) in buckets:
+                n += c
+                if n > rank:
+                    rtn[j] = sign * 2 * self.gamma ** k / (self.gamma + 1)
+                    break
+        return rtn
+
+    def toDict(self):
+        return {'accuracy': self.accuracy,
+                'positive': [dict([(str(k), c) for (k, c) in b.items()]) for b in self.positive],
+                'negative': [dict([(str(k), c) for (k, c) in b.items()]) for b in self.negative],
+                'zeros': self.zeros.tolist()}
+
+    @staticmethod
+    def fromDict(d):
+        sketch = QuantileSketch(len(d['zeros']), d['accuracy'])
+        sketch.positive = [dict([(int(k), c) for (k, c) in b.items()]) for b in d['positive']]
+        sketch.negative = [dict([(int(k), c) for (k, c) in b.items()]) for b in d['negative']]
+        sketch.zeros = array(d['zeros'], dtype=int64)
+        return sketch
+
+
+class StatsAccumulator():
+    def __init__(self, nfields, sketch=False):
+        """
+        Empty accumulator
+        :param nfields: number of fields (eg timepoints, bins)
+        :param sketch: also keep quantile sketch (for MEDIAN)
+        """
+        self.count = zeros(nfields, dtype=int64)
+        self.sum = zeros(nfields)
+        self.mean = zeros(nfields)
+        self.m2 = zeros(nfields)
+        self.min = full(nfields, inf)
+        self.max = full(nfields, -inf)
+        self.sketch = QuantileSketch(nfields) if sketch else None
+
+    def add(self, values):
+        """
+        Add observations - NaN values are ignored
+        :param values: numpy array observations x fields (or one observation)
+        :return: self
+        """
+        values = atleast_2d(asarray(values, dtype=float))
+        batch = StatsAccumulator(values.shape[1])
+        batch.count = (~isnan(values)).sum(axis=0)
+        if batch.count.sum() > 0:
+            missing = isnan(values)
+            batch.sum = nansum(values, axis=0)
+            batch.mean = batch.sum / where(batch.count > 0, batch.count, 1)
+            batch.m2 = nansum((values - batch.mean) ** 2, axis=0)
+            batch.min = where(missing, inf, values).min(axis=0)
+            batch.max = where(missing, -inf, values).max(axis=0)
+            self.__mergeStats(batch)
+        if self.sketch is not None:
+            self.sketch.add(values)
+        return self
+
+    def merge(self, other):
+        """
+        Combine with another accumulator of the same fields (parallel algorithm of Chan et al)
+        :param other: StatsAccumulator
+        :return: self
+        """
+        if len(other.count) != len(self.count):
+            raise ValueError("Cannot merge accumulators with different fields")
+        self.__mergeStats(other)
+        if self.sketch is not None and other.sketch is not None:
+            self.sketch.merge(other.sketch)
+        elif self.sketch is not None:
+            logging.warning("StatsAccumulator: merged accumulator without sketch - quantiles are incomplete")
+        return self
+
+    def __mergeStats(self, other):
+        n = self.count + other.count
+        with errstate(invalid='ignore', divide='ignore'):
+            delta = other.mean - self.mean
+            frac = where(n > 0, other.count / where(n > 0, n, 1), 0.0)
+            self.mean = self.mean + delta * frac
+            self.m2 = self.m2 + other.m2 + delta * delta * self.count * frac
+        self.count = n
+        self.sum = self.sum + other.sum
+        self.min = where(other.min < self.min, other.min, self.min)
+        self.max = where(other.max > self.max, other.max, self.max)
+
+    def stats(self):
+        """
+        Summary statistics per field (as rowStats) - NaN where no values
+        :return: OrderedDict of MEAN, SEM, COUNT, STD, SUM, MIN, MAX (and MEDIAN if sketch)
+        """
+        empty = self.count <= 0
+        with errstate(invalid='ignore', divide='ignore'):
+            std = sqrt(self.m2 / where(self.count > 1, self.count - 1, nan))
+            sem = std / sqrt(self.count)
+        stats = OrderedDict([('MEAN', where(empty, nan, self.mean)), ('SEM', sem), ('COUNT', self.count),
+                             ('STD', std), ('SUM', self.sum), ('MIN', where(empty, nan, self.min)),
+                             ('MAX', where(empty, nan, self.max))])
+        if self.sketch is not None:
+            stats['MEDIAN'] = self.sketch.quantile(0.5)
+        return stats
+
+    def toDict(self):
+        # no min or max (infinite) where no values - null in json
+        d = {'count': self.count.tolist(), 'sum': self.sum.tolist(), 'mean': self.mean.tolist(),
+             'm2': self.m2.tolist(), 'min': [x if isfinite(x) else None for x in self.min.tolist()],
+             'max': [x if isfinite(x) else None for x in self.max.tolist()]}
+        if self.sketch is not None:
+            d['sketch'] = self.sketch.toDict()
+        return d
+
+    @staticmethod
+    def fromDict(d):
+        acc = StatsAccumulator(len(d['count']))
+        acc.count = array(d['count'], dtype=int64)
+        for field in ['sum', 'mean', 'm2']:
+            setattr(acc, field, array(d[field], dtype=float))
+        acc.min = array([inf if x is None else x for x in d['min']], dtype=float)
+        acc.max = array([-inf if x is None else x for x in d['max']], dtype=float)
+        if 'sketch' in d:
+            acc.sketch = QuantileSketch.fromDict(d['sketch'])
+        return acc
+
+
+def mergeAccumulators(accumulators):
+    """
+    Merge accumulators (not changed) into a new accumulator
+    :param accumulators: list of StatsAccumulator with the same fields
+    :return: StatsAccumulator or None if list is empty
+    """
+    if len(accumulators) <= 0:
+        return None
+    merged = StatsAccumulator(len(accumulators[0].count), sketch=all([a.sketch is not None for a in accumulators]))
+    for acc in accumulators:
+        merged.merge(acc)
+    return merged
+
+
+def saveAccumulators(filename, fields, accumulators):
+    """
+    Save accumulators to json file
+    :param filename: output file
+    :param fields: list of field names (eg timepoints, bins)
+    :param accumulators: dict of name: StatsAccumulator
+    :return: filename
+    """
+    tmpfile = filename + '.tmp'
+    with open(tmpfile, 'w') as f:
+        json.dump({'fields': list(fields),
+                   'accumulators': OrderedDict([(k, a.toDict()) for (k, a) in accumulators.items()])}, f,
+                  allow_nan=False)
+    replace(tmpfile, filename)
+    logging.info("Accumulators saved to %s", filename)
+    return filename
+
+
+def loadAccumulators(filename):
+    """
+    Load accumulators from json file
+    :param filename: saved file
+    :return: (fields, OrderedDict of name: StatsAccumulator)
+    """
+    with open(filename, 'r') as f:
+        saved = json.load(f, object_pairs_hook=OrderedDict)
+    return (saved['fields'], OrderedDict([(k, StatsAccumulator.fromDict(d))
+                                          for (k, d) in saved['accumulators'].items()]))
+
+
+def cellAccumulatorFile(datafile):
+    """
+    Accumulator file of cell output file
+    :param datafile: cell output file (eg Filtered_MSD.csv, Histogram_log10D.csv)
+    :return: <datafile>_accumulator.json
+    """
+    return splitext(datafile)[0] + '_accumulator.json'
+
+
+def saveCellAccumulator(datafile, fields, accumulator):
+    """
+    Save accumulator of cell output file next to it
+    :param datafile: cell output file
+    :param fields: list of field names
+    :param accumulator: StatsAccumulator
+    :return: accumulator filename
+    """
+    return saveAccumulators(cellAccumulatorFile(datafile), fields, OrderedDict([(CELL_ACCUMULATOR, accumulator)]))
+
+
+def loadCellAccumulator(datafile, fields):
+    """
+    Accumulator saved with cell output file
+    :param datafile: cell output file
+    :param fields: field names expected (strings or numbers)
+    :return: StatsAccumulator or None if not saved, older than datafile or fields differ
+    """
+    accfile = cellAccumulatorFile(datafile)
+    if not access(accfile, R_OK) or not access(datafile, R_OK) or getmtime(accfile) < getmtime(datafile):
+        return None
+    try:
+        (saved, accumulators) = loadAccumulators(accfile)
+    except (ValueError, KeyError, IOError, OSError) as e:
+        logging.warning("StatsAccumulator: cannot load %s - %s", accfile, e)
+        return None
+    if len(saved) != len(fields) or CELL_ACCUMULATOR not in accumulators:
+        return None
+    try:
+        match = allclose(asarray(saved, dtype=float), asarray(fields, dtype=float))
+    except ValueError:
+        match = [str(x) for x in saved] == [str(x) for x in fields]
+    return accumulators[CELL_ACCUMULATOR] if match else None
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+MSD Analysis script: trackMSD
+Computes MSD data from raw trajectory coordinates instead of the tracker output files:
+
+    Tracks file (TRACKS_FILENAME: csv or tab delimited txt) with one row per localization
+    and columns from TRACK_COLUMNS: trajectory id, x, y, frame (frame is optional)
+
+    -> AllROI-MSD.txt (MSD_FILENAME)  #MSD(DeltaT) in um^2 - time-averaged MSD at ALL lags of each trajectory
+    -> AllROI-D.txt (DATA_FILENAME)   #Diffusion Coefficient in um^2/s - linear fit of the first 4 lags (see fitMSD)
+
+which are then filtered as usual (filterMSD).
+
+The MSD of each trajectory is calculated from correlations by FFT (O(N log N) rather than O(N^2) per trajectory):
+
+    MSD(m) = sum_i w(i)w(i+m)[r(i+m)^2 + r(i)^2 - 2r(i).r(i+m)] / sum_i w(i)w(i+m)
+
+where w is 1 for frames with a position - missing frames (gaps) are excluded from the pairs at each lag.
+Trajectories are sorted by length and padded to the same FFT size so that each batch is transformed at once.
+Frames are integers (frame numbers) or times in s (converted with TIME_INTERVAL).
+Trajectories with fewer than TRACK_MINPOINTS positions are excluded.
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import argparse
+import logging
+from collections import OrderedDict
+from os import R_OK, access, replace
+from os.path import join, splitext, dirname
+
+import pandas as pd
+from configobj import ConfigObj
+from numpy import arange, zeros, full, nan, rint, where, int64, concatenate, errstate, lexsort, bincount
+from numpy.fft import rfft, irfft
+
+from msdapp.msd.fitMSD import fitMSD, FIT_POINTS
+
+# Max values per FFT batch (trajectories x FFT size)
+BATCH_SIZE = 2 ** 22
+
+
+def fftSize(n):
+    """
+    FFT size without wraparound of correlations for lags < n (power of 2 >= 2n)
+    """
+    size = 2
+    while size < 2 * n:
+        size *= 2
+    return size
+
+
+def batchMSD(x, y, w, maxlag):
+    """
+    Time-averaged MSD of trajectories padded to the same length - by FFT
+    :param x, y: numpy arrays trajectories x frames (0 where no position)
+    :param w: numpy array trajectories x frames - 1 where position else 0
+    :param maxlag: number of lags
+    :return: numpy array trajectories x maxlag (lags 1..maxlag) - NaN where no pairs of positions
+    """
+    size = fftSize(x.shape[1])
+    fw = rfft(w, size)
+    fr2 = rfft(w * (x * x + y * y), size)
+    fx = rfft(x, size)
+    fy = rfft(y, size)
+    # corr(r2, w) + corr(w, r2) - 2 corr(x, x) - 2 corr(y, y)
+    sumsq = irfft(2 * (fr2.conj() * fw).real - 2 * ((fx * fx.conj()).real + (fy * fy.conj()).real), size)
+    pairs = rint(irfft((fw * fw.conj()).real, size))
+    sumsq = sumsq[:, 1:maxlag + 1]
+    pairs = pairs[:, 1:maxlag + 1]
+    with errstate(invalid='ignore', divide='ignore'):
+        return where(pairs > 0, sumsq / where(pairs > 0, pairs, 1), nan)
+
+
+class TrackMSD():
+    def __init__(self, configfile, datafile_tracks, outputdir=None):
+        """
+        :param configfile: config params
+        :param datafile_tracks: tracks file
+        :param outputdir: output directory (default directory of tracks file)
+        """
+        self.encoding = 'ISO-8859-1'
+        self.datafile = 'AllROI-D.txt'
+        self.datafile_msd = 'AllROI-MSD.txt'
+        self.diffcolumn = 'D(µm²/s)'
+        self.timeint = 0.02
+        self.columns = ['Trajectory', 'x', 'y', 'Frame']
+        self.minpoints = 8
+        self.maxlag = 0
+        self.offset = 1
+        if configfile is not None and access(configfile, R_OK):
+            try:
+                # as filterMSD - column names must match when data files are read
+                config = ConfigObj(configfile)
+            except UnicodeDecodeError:
+                config = ConfigObj(configfile, encoding=self.encoding)
+            self.datafile = config['DATA_FILENAME']
+            self.datafile_msd = config['MSD_FILENAME']
+            self.diffcolumn = config['DIFF_COLUMN']
+            self.timeint = float(config['TIME_INTERVAL'])
+            if 'TRACK_COLUMNS' in config:
+                self.columns = config['TRACK_COLUMNS']
+            if 'TRACK_MINPOINTS' in config:
+                self.minpoints = int(config['TRACK_MINPOINTS'])
+            if 'TRACK_MAXLAG' in config:
+                self.maxlag = int(config['TRACK_MAXLAG'])
+            if 'FIT_OFFSET' in config:
+                self.offset = int(config['FIT_OFFSET'])
+        if len(self.columns) < 3:
+            raise ValueError("TrackMSD: TRACK_COLUMNS requires trajectory, x and y columns")
+        self.datafile_tracks = datafile_tracks
+        self.outputdir = outputdir if outputdir is not None else dirname(datafile_tracks)
+        self.outputfiles = [join(self.outputdir, self.datafile), join(self.outputdir, self.datafile_msd)]
+
+    def load_tracks(self):
+        """
+        Load tracks file as arrays - one row per position sorted by trajectory and frame
+        :return: OrderedDict of ROI, Trace (per trajectory), index (trajectory per position), frame, x, y
+        """
+        delimiter = '\t' if splitext(self.datafile_tracks)[1] == '.txt' else ','
+        usecols = list(self.columns[:4])
+        header = pd.read_csv(self.datafile_tracks, encoding=self.encoding, delimiter=delimiter, nrows=0)
+        missing = [c for c in usecols[:3] if c not in header.columns]
+        if len(missing) > 0:
+            raise ValueError("TrackMSD: columns not found in %s: %s" % (self.datafile_tracks, ", ".join(missing)))
+        hasframe = len(usecols) > 3 and usecols[3] in header.columns
+        if len(usecols) > 3 and not hasframe:
+            logging.warning("TrackMSD: no frame column (%s) - positions are consecutive frames", usecols[3])
+            usecols = usecols[:3]
+        if 'ROI' in header.columns and 'ROI' not in usecols:
+            usecols.append('ROI')
+        data = pd.read_csv(self.datafile_tracks, encoding=self.encoding, delimiter=delimiter, usecols=usecols)
+        data = data.dropna(subset=usecols[:3])
+        if data.empty:
+            raise ValueError("TrackMSD: no positions in %s" % self.datafile_tracks)
+        (codes, ids) = pd.factorize(data[usecols[0]], sort=True)
+        if hasframe:
+            frame = data[usecols[3]].values
+            if frame.dtype.kind == 'f' and (frame != rint(frame)).any():
+                # times in s
+                frame = frame / self.timeint
+            frame = rint(frame).astype(int64)
+        else:
+            # consecutive in file order
+            frame = pd.Series(codes).groupby(codes).cumcount().values.astype(int64)
+        order = lexsort((frame, codes))
+        codes = codes[order]
+        frame = frame[order]
+        duplicated = concatenate(([False], (codes[1:] == codes[:-1]) & (frame[1:] == frame[:-1])))
+        if duplicated.any():
+            logging.warning("TrackMSD: %d duplicate frames ignored in %s", duplicated.sum(), self.datafile_tracks)
+            order = order[~duplicated]
+            codes = codes[~duplicated]
+            frame = frame[~duplicated]
+        # frames from start of each trajectory
+        first = concatenate(([True], codes[1:] != codes[:-1]))
+        start = zeros(len(ids), dtype=int64)
+        start[codes[first]] = frame[first]
+        tracks = OrderedDict()
+        if 'ROI' in data.columns:
+            tracks['ROI'] = data['ROI'].values[order][first].astype(int64)
+        else:
+            tracks['ROI'] = arange(1, len(ids) + 1, dtype=int64)
+        tracks['Trace'] = ids.values.astype(int64) if ids.dtype.kind in 'iu' else arange(len(ids), dtype=int64)
+        tracks['index'] = codes
+        tracks['frame'] = frame - start[codes]
+        tracks['x'] = data[usecols[1]].values[order].astype(float)
+        tracks['y'] = data[usecols[2]].values[order].astype(float)
+        return tracks
+
+    def calculateMSD(self, tracks):
+        """
+        MSD of all trajectories - batched by FFT size
+        :param tracks: from load_tracks
+        :return: (keep, msdlist) - trajectories with at least minpoints and MSD array of each (lags 1..length-1)
+        """
+        index = tracks['index']
+        frame = tracks['frame']
+        ntracks = len(tracks['Trace'])
+        points = bincount(index, minlength=ntracks)
+        # sorted by frame so last position of each trajectory has max frame
+        length = zeros(ntracks, dtype=int64)
+        last = concatenate((index[1:] != index[:-1], [True])) if len(index) > 0 else index.astype(bool)
+        length[index[last]] = frame[last] + 1
+        keep = where(points >= max(self.minpoints, 2))[0]
+        # positions relative to mean of each trajectory (precision of FFT correlations)
+        counts = where(points > 0, points, 1)
+        x = tracks['x'] - (bincount(index, tracks['x'], ntracks) / counts)[index]
+        y = tracks['y'] - (bincount(index, tracks['y'], ntracks) / counts)[index]
+        # trajectories by length - positions in the same order so each batch is a slice
+        order = keep[length[keep].argsort(kind='mergesort')]
+        rank = full(ntracks, len(order), dtype=int64)
+        rank[order] = arange(len(order))
+        positions = rank[index].argsort(kind='mergesort')
+        rowstart = concatenate(([0], points[order].cumsum()))
+        sizes = [fftSize(n) for n in length[order].tolist()]
+        msdlist = [None] * ntracks
+        i = 0
+        while i < len(order):
+            size = sizes[i]
+            nbatch = max(BATCH_SIZE // size, 1)
+            j = i
+            while j < len(order) and j - i < nbatch and sizes[j] == size:
+                j += 1
+            batch = order[i:j]
+            rows = positions[rowstart[i]:rowstart[j]]
+            brow = rank[index[rows]] - i
+            maxlen = int(length[batch].max())
+            (bx, by, bw) = (zeros((len(batch), maxlen)), zeros((len(batch), maxlen)), zeros((len(batch), maxlen)))
+            bx[brow, frame[rows]] = x[rows]
+            by[brow, frame[rows]] = y[rows]
+            bw[brow, frame[rows]] = 1.0
+            lags = maxlen - 1 if self.maxlag <= 0 else min(maxlen - 1, self.maxlag)
+            msd = batchMSD(bx, by, bw, lags)
+            for (k, t) in enumerate(batch.tolist()):
+                n = int(length[t]) - 1 if self.maxlag <= 0 else min(int(length[t]) - 1, self.maxlag)
+                msdlist[t] = msd[k, :n]
+            i = j
+        return (keep, msdlist)
+
+    def run(self):
+        """
+        Calculate MSD and D for all trajectories and save as data files
+        :return: (datafile, msdfile, number of trajectories)
+        """
+        tracks = self.load_tracks()
+        (keep, msdlist) = self.calculateMSD(tracks)
+        # D from linear fit of first lags as tracker
+        fitmatrix = full((len(keep), FIT_POINTS), nan)
+        for (k, t) in enumerate(keep):
+            m = msdlist[t][:FIT_POINTS]
+            fitmatrix[k, :len(m)] = m
+        (d, b) = fitMSD(fitmatrix, self.timeint, FIT_POINTS, self.offset)
+        (roi, trace) = (tracks['ROI'][keep], tracks['Trace'][keep])
+        (datafile, msdfile) = self.outputfiles
+        tmpfile = datafile + '.tmp'
+        with open(tmpfile, 'w', encoding=self.encoding) as f:
+            f.write("#Diffusion Coefficient in um^2/s\n#fit %d points\n" % FIT_POINTS)
+            f.write("ROI\tTrace\t%s\n" % self.diffcolumn)
+            for (r, t, dval) in zip(roi.tolist(), trace.tolist(), d.tolist()):
+                f.write("%d\t%d\t%.9g\n" % (r, t, dval))
+        replace(tmpfile, datafile)
+        tmpfile = msdfile + '.tmp'
+        with open(tmpfile, 'w', encoding=self.encoding) as f:
+            f.write("#MSD(DeltaT) in um^2\n#ROI\tTrace\tvalues\n")
+            for (r, t, k) in zip(roi.tolist(), trace.tolist(), keep.tolist()):
+                f.write("%d\t%d\t%s\n" % (r, t, "\t".join(["%.9g" % v for v in msdlist[k].tolist()])))
+        replace(tmpfile, msdfile)
+        excluded = len(tracks['Trace']) - len(keep)
+        msg = "TrackMSD: %d trajectories (%d excluded with < %d points) from %s" \
+              % (len(keep), excluded, self.minpoints, self.datafile_tracks)
+        print(msg)
+        logging.info(msg)
+        return (datafile, msdfile, len(keep))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='trackMSD',
+                                     description='''\
+            Calculates MSD (all lags) and D of each trajectory from a tracks file of positions
+            and saves as data files for filterMSD
+
+             ''')
+    parser.add_argument('--datafile_tracks', action='store', help='Tracks file', default="Tracks.csv")
+    parser.add_argument('--outputdir', action='store', help='Output directory (default with tracks file)')
+    parser.add_argument('--config', action='store', help='Config file for parameters', default=None)
+    args = parser.parse_args()
+
+    try:
+        tmsd = TrackMSD(args.config, args.datafile_tracks, args.outputdir)
+        tmsd.run()
+    except ValueError as e:
+        print("Error:", e)
@@ -0,0 +1,134 @@
+"""
+Dependency-aware scheduling of processes
+Dependencies are taken from the 'files' (input) and 'filesout' (output) config fields of each process.
+Tasks are keyed by (process, group) so group tasks start as soon as the same group (or all cells) of
+the producing processes are complete. Independent tasks run concurrently in separate threads.
+Tasks which depend on a failed (or skipped) task are skipped.
+
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+# Task states when finished
+FINISHED = ['done', 'error', 'skipped']
+
+class StageScheduler():
+    def __init__(self, processes, maxindiv=1):
+        """
+        :param processes: list of process dicts with href, ptype, files, filesout
+        :param maxindiv: max per-cell (indiv) tasks of each process running at once - each may use a pool of
+        processes
+        """
+        self.processes = OrderedDict([(p['href'], p) for p in processes])
+        self.tasks = OrderedDict()
+        self.lock = threading.Lock()
+        # per-cell tasks of different processes (eg filter and histogram of different groups) run concurrently
+        self.indiv = dict([(href, threading.Semaphore(maxindiv)) for href, p in self.processes.items()
+                           if p['ptype'] == 'indiv'])
+        self.alldone = threading.Condition(self.lock)
+
+    def producers(self, href):
+        """
+        Processes which output files required as input by process href
+        :param href:
+        :return: list of hrefs
+        """
+        filesin = set(self.processes[href]['files'].split(", "))
+        return [p for p in self.processes.keys()
+                if p != href and filesin & set(self.processes[p]['filesout'].split(", "))]
+
+    def dependencies(self, href, group=None):
+        """
+        Tasks already submitted which produce the inputs for this task
+        :param href: process
+        :param group: group name or None for all cells
+        :return: list of task keys
+        """
+        producers = self.producers(href)
+        return [key for key in self.tasks.keys()
+                if key[0] in producers and (group is None or key[1] is None or key[1] == group)]
+
+    def submit(self, href, group, func, deps=None):
+        """
+        Add task which is started as soon as its dependencies are complete
+        :param href: process
+        :param group: group name or None for all cells
+        :param func: callable run in its own thread
+        :param deps: list of task keys (default from dependencies())
+        :return: task key
+        """
+        key = (href, group)
+        if deps is None:
+            deps = self.dependencies(href, group)
+        with self.lock:
+            self.tasks[key] = {'func': func, 'deps': deps, 'state': 'pending', 'start': None, 'end': None}
+        logging.info("Scheduler: task %s waiting on %s", key, deps)
+        self.__startReady()
+        return key
+
+    def __startReady(self):
+        with self.lock:
+            # skipped tasks can make further tasks skipped
+            skipped = True
+            while skipped:
+                skipped = [key for key, task in self.tasks.items() if task['state'] == 'pending'
+                           and any(self.tasks[d]['state'] in ['error', 'skipped'] for d in task['deps'])]
+                for key in skipped:
+                    self.tasks[key]['state'] = 'skipped'
+                    logging.warning("Scheduler: task %s skipped as inputs failed", key)
+            ready = [key for key, task in self.tasks.items() if task['state'] == 'pending'
+                     and all(self.tasks[d]['state'] == 'done' for d in task['deps'])]
+            for key in ready:
+                self.tasks[key]['state'] = 'running'
+            self.alldone.notify_all()
+        for key in ready:
+            t = threading.Thread(target=self.__run, args=(key,), name="%s_%s" % key)
+            t.start()
+
+    def __run(self, key):
+        task = self.tasks[key]
+        indiv = self.indiv.get(key[0])
+        state = 'done'
+        try:
+            if indiv is not None:
+                indiv.acquire()
+            task['start'] = time.time()
+            logging.info("Scheduler: task %s started", key)
+            task['func']()
+        except Exception as e:
+            logging.error("Scheduler: task %s failed: %s", key, e)
+            state = 'error'
+        finally:
+            if indiv is not None:
+                indiv.release()
+            task['end'] = time.time()
+            with self.lock:
+                task['state'] = state
+                self.alldone.notify_all()
+            logging.info("Scheduler: task %s finished (%s)", key, state)
+        self.__startReady()
+
+    def wait(self, timeout=None):
+        """
+        Block until all submitted tasks are finished
+        :return: True if all finished
+        """
+        with self.lock:
+            return self.alldone.wait_for(
+                lambda: all(t['state'] in FINISHED for t in self.tasks.values()), timeout)
+
+    def summary(self):
+        """
+        State and timing of each task
+        :return: list of dicts
+        """
+        rtn = []
+        for key, task in self.tasks.items():
+            elapsed = None
+            if task['start'] is not None and task['end'] is not None:
+                elapsed = task['end'] - task['start']
+            rtn.append({'process': key[0], 'group': key[1], 'state': task['state'],
+                        'start': task['start'], 'end': task['end'], 'seconds': elapsed})
+        return rtn
@@ -2,6 +2,8 @@ import logging
 from os import access, R_OK, getcwd
 from os.path import join, abspath, dirname
 
+import numpy as np
+
 
 ##### Global functions
 def findResourceDir():
@@ -23,4 +25,20 @@ def findResourceDir():
     else:
         msg = 'Resources dir located to: %s ' % abspath(resource_dir)
         logging.info(msg)
-    return abspath(resource_dir)
\ No newline at end of file
+    return abspath(resource_dir)
+
+
+def sweepThresholds(sweep):
+    """
+    Thresholds from config value (eg THRESHOLD_SWEEP, MINLIMIT_SWEEP)
+    :param sweep: 'start:stop:step' (stop included) or list of thresholds
+    :return: list of thresholds
+    """
+    if isinstance(sweep, str):
+        if ':' in sweep:
+            (start, stop, step) = [float(x) for x in sweep.split(':')]
+            if step <= 0:
+                raise ValueError("Threshold sweep step must be positive: %s" % sweep)
+            return np.round(np.arange(start, stop + step / 2, step), 10).tolist()
+        sweep = [sweep]
+    return [float(x) for x in sweep if len(str(x).strip()) > 0]
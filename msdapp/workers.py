@@ -0,0 +1,481 @@
+"""
+Processing functions for the pipeline - per-cell functions can run in a pool of worker processes
+(no wx - results and progress are returned to the caller)
+
+"""
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing import cpu_count, get_context, get_all_start_methods
+from os import access, R_OK, mkdir
+from os.path import join, dirname, exists, splitext, split, abspath
+
+import matplotlib
+import pandas
+from configobj import ConfigObj
+
+from msdapp.fileindex import getIndex
+from msdapp.manifest import Manifest, configParams
+from msdapp.msd.batchCompareMSD import CompareMSD
+from msdapp.msd.batchHistogramStats import HistoStats
+from msdapp.msd.batchLogD import BatchLogd
+from msdapp.msd.filterMSD import FilterMSD
+from msdapp.msd.fitMSD import ALPHA_COLUMN
+from msdapp.msd.histogramLogD import HistogramLogD, histogramConfig
+from msdapp.msd.trackMSD import TrackMSD
+
+# Processes in pipeline order - dependencies are from input (files) and output (filesout) config fields
+PROCESSES = [
+    {'caption': '1. Filter Data', 'href': 'filter',
+     'description': 'For each cell, generate log10 of diffusion coefficient, then filters between min and max range. MSD data is also filtered with corresponding rows.','ptype':'indiv',
+     'files': 'DATA_FILENAME, MSD_FILENAME',
+     'filesout': 'FILTERED_FILENAME, FILTERED_MSD'},
+    {'caption': '2. Generate Histograms', 'href': 'histogram',
+     'description': 'For each cell, generate relative frequency histograms of log10(D) data',
+     'files': 'FILTERED_FILENAME','ptype':'indiv',
+     'filesout': 'HISTOGRAM_FILENAME'},
+    {'caption': '2. Batch Log10(D)', 'href': 'batchd',
+     'description': 'Compiles all filtered log10(D) data',
+     'files': 'FILTERED_FILENAME', 'ptype': 'batch',
+     'filesout': 'BATCHD_FILENAME'},
+    {'caption': '3. Histogram Stats', 'href': 'stats',
+     'description': 'Compiles histogram data with descriptive statistics from all cells (batch) into one file per group in output directory',
+     'files': 'HISTOGRAM_FILENAME','ptype':'batch',
+     'filesout': 'ALLSTATS_FILENAME'},
+    {'caption': '4. Compile MSD', 'href': 'msd',
+     'description': 'Compiles MSD data with descriptive statistics from all cells (batch) into one file per group in output directory',
+     'files': 'FILTERED_MSD','ptype':'batch',
+     'filesout': 'AVGMSD_FILENAME'}
+]
+
+# Config fields used by each process - outputs are rebuilt when these change (incremental processing)
+TRACK_FIELDS = ['DATA_FILENAME', 'MSD_FILENAME', 'DIFF_COLUMN', 'TIME_INTERVAL', 'TRACK_COLUMNS', 'TRACK_MINPOINTS',
+                'TRACK_MAXLAG', 'FIT_OFFSET']
+FILTER_FIELDS = ['FILTERED_FILENAME', 'FILTERED_MSD', 'DIFF_COLUMN', 'LOG_COLUMN', 'MSD_POINTS', 'MINLIMIT',
+                 'MAXLIMIT', 'GROUPBY_ROI', 'FIT_POINTS', 'FIT_OFFSET', 'ALPHA_POINTS', 'TIME_INTERVAL', 'QUANTILE_SKETCH']
+HISTOGRAM_FIELDS = ['HISTOGRAM_FILENAME', 'MINLIMIT', 'MAXLIMIT', 'BINWIDTH', 'LOG_COLUMN', 'ALPHA_POINTS',
+                    'ALPHA_HISTOGRAM', 'ALPHA_MINLIMIT', 'ALPHA_MAXLIMIT', 'ALPHA_BINWIDTH', 'BASE_BINWIDTH', 'QUANTILE_SKETCH']
+# Base histograms are rebuilt only when these change - histograms with other bins are sums of base bins
+BASE_FIELDS = ['HISTOGRAM_FILENAME', 'LOG_COLUMN', 'ALPHA_POINTS', 'ALPHA_HISTOGRAM', 'BASE_BINWIDTH']
+BATCH_FIELDS = {'stats': ['ALLSTATS_FILENAME', 'HISTOGRAM_FILENAME', 'THRESHOLD', 'THRESHOLD_SWEEP', 'EXTRA_STATS',
+                          'ALPHA_POINTS', 'ALPHA_HISTOGRAM', 'ALLSTATS_ALPHA', 'CELLID', 'GROUPBY_ROI',
+                          'QUANTILE_SKETCH'],
+                'msd': ['AVGMSD_FILENAME', 'FILTERED_MSD', 'MSD_POINTS', 'TIME_INTERVAL', 'TRAJECTORY_AUC', 'CELLID',
+                        'GROUPBY_ROI', 'QUANTILE_SKETCH'],
+                'batchd': ['BATCHD_FILENAME', 'FILTERED_FILENAME', 'LOG_COLUMN', 'CELLID', 'GROUPBY_ROI']}
+
+
+def CheckFilenames(filenames, configfiles, datastore=None):
+    """
+    Check that filenames are appropriate for the script required
+    :param filenames: list of full path filenames
+    :param configfiles: matching filename for script as in config
+    :param datastore: dataframes held in memory by filename - included as if files exist
+    :return: filtered list
+    """
+    newfiles = []
+    if len(filenames) <= 0:
+        return newfiles
+    # single walk of each input directory tree - an index of a parent directory (eg input directory) is reused
+    indexes = []
+    for d in sorted(set([abspath(split(f)[0]) for f in filenames]), key=len):
+        if not any([d == i.root or d.startswith(join(i.root, '')) for i in indexes]):
+            indexes.append(getIndex(d, configfiles))
+    for conf in configfiles:
+        for f in filenames:
+            parts = split(f)
+            if conf in parts[1]:
+                newfiles.append(f)
+            else:
+                # extract directory and seek files
+                for index in indexes:
+                    newfiles = newfiles + index.find(conf, parts[0])
+                if datastore:
+                    newfiles = newfiles + [y for y in datastore.keys() if split(y)[1] == conf
+                                           and y.startswith(join(parts[0], '')) and y not in newfiles]
+    return newfiles
+
+
+def initWorker(logqueue=None, loglevel=logging.INFO):
+    """
+    Worker processes cannot display plots
+    Log records are sent to the parent process (see runCells) as workers are started without logging setup
+    :param logqueue: queue read by parent process
+    :param loglevel: level of parent root logger
+    :return:
+    """
+    matplotlib.use('Agg')
+    if logqueue is not None:
+        logger = logging.getLogger()
+        logger.handlers = [QueueHandler(logqueue)]
+        logger.setLevel(loglevel)
+
+
+class LogForwarder(QueueListener):
+    """
+    Log records from worker processes are passed to the logger of the same name in this process
+    (and so to its handlers eg log file)
+    """
+
+    def handle(self, record):
+        logger = logging.getLogger(record.name)
+        if logger.isEnabledFor(record.levelno):
+            logger.handle(record)
+
+
+def poolContext():
+    """
+    Start worker processes from a clean process (forkserver, or spawn as on Windows)
+    Forking this process can deadlock workers if other threads (eg batch processes) hold locks
+    :return: multiprocessing context
+    """
+    if 'forkserver' in get_all_start_methods():
+        ctx = get_context('forkserver')
+        ctx.set_forkserver_preload(['msdapp.workers'])
+        return ctx
+    return get_context('spawn')
+
+
+def numWorkers(workers):
+    """
+    Number of worker processes to use
+    :param workers: from config or command line - 0 for all cores
+    :return: int
+    """
+    workers = int(workers)
+    if workers <= 0:
+        workers = cpu_count()
+    return workers
+
+
+def tracksCell(task):
+    """
+    Calculate MSD and D data files from tracks file for a single cell (in same directory)
+    :param task: (configfile, filename, incremental)
+    :return: (filename, results) where results is (datafile, msdfile, number of trajectories)
+    """
+    (configfile, filename, incremental) = task
+    logging.info("Process Tracks with file: %s", filename)
+    # data files (and manifest) in directory of tracks file
+    outputdir = dirname(filename)
+    manifest = None
+    if incremental:
+        manifest = Manifest(outputdir)
+        params = configParams(ConfigObj(configfile, encoding='ISO-8859-1'), TRACK_FIELDS)
+        if manifest.isCurrent('tracks', [filename], params):
+            logging.info("Tracks: data files up to date for %s", filename)
+            return (filename, manifest.results('tracks'))
+        manifest.remove('tracks')
+    tmsd = TrackMSD(configfile, filename, outputdir)
+    results = tmsd.run()
+    if manifest is not None:
+        manifest.update('tracks', [filename], params, tmsd.outputfiles, list(results))
+    return (filename, results)
+
+
+def filterCell(task):
+    """
+    Run filter for a single cell
+    :param task: (configfile, filename, datafile, msdfile, savefiles, inmemory, incremental)
+    :return: (filename, results, outputs) where outputs are the filtered dataframes if inmemory
+    """
+    (configfile, filename, datafile, msdfile, savefiles, inmemory, incremental) = task
+    logging.info("Process Filter with file: %s", filename)
+    datafile_msd = filename.replace(datafile, msdfile)
+    # Check datafile_msd is accessible - can use txt instead of xls
+    if not access(datafile_msd, R_OK) and '.xls' in splitext(datafile_msd)[1]:
+        f1 = datafile_msd.replace(splitext(datafile_msd)[1], '.txt')
+        if access(f1, R_OK):
+            datafile_msd = f1
+    # create local subdir for output
+    outputdir = join(dirname(filename), 'processed')
+    if not exists(outputdir):
+        mkdir(outputdir)
+    # Skip if output files are up to date
+    manifest = None
+    if incremental and savefiles:
+        manifest = Manifest(outputdir)
+        inputs = [filename, datafile_msd]
+        params = configParams(ConfigObj(configfile, encoding='ISO-8859-1'), FILTER_FIELDS)
+        if manifest.isCurrent('filter', inputs, params):
+            logging.info("Filter: outputs up to date for %s", filename)
+            return (filename, manifest.results('filter'), None)
+        manifest.remove('filter')
+    fmsd = FilterMSD(configfile, filename, datafile_msd, outputdir)
+    results = None
+    outputs = None
+    if fmsd.data is not None or fmsd.streaming:
+        results = fmsd.runFilter(savefiles=savefiles, keepoutputs=inmemory)
+        if inmemory:
+            outputs = fmsd.outputs
+        if manifest is not None and results is not None:
+            manifest.update('filter', inputs, params, fmsd.outputfiles, results)
+    return (filename, results, outputs)
+
+
+def limitIndexCell(task):
+    """
+    Sorted log10D of a single cell for previews of filter limits - saved index or loaded data
+    :param task: (configfile, filename, datafile, msdfile)
+    :return: (filename, LimitIndex) - index is None if data cannot be loaded
+    """
+    (configfile, filename, datafile, msdfile) = task
+    datafile_msd = filename.replace(datafile, msdfile)
+    try:
+        fmsd = FilterMSD(configfile, filename, datafile_msd, dirname(filename), loaddata=False)
+        return (filename, fmsd.limitIndex())
+    except (ValueError, IOError, OSError) as e:
+        logging.warning("Limits: cannot load %s - %s", filename, e)
+        return (filename, None)
+
+
+def histogramCell(task):
+    """
+    Generate histogram for a single cell
+    :param task: (configfile, datafile, data, showplots, savefile, incremental)
+                where data is an in-memory dataframe or None
+    :return: (datafile, results, histdata) - histdata is None if output files are up to date
+    """
+    (configfile, datafile, data, showplots, savefile, incremental) = task
+    logging.info("Process histogram with file: %s", datafile)
+    outputdir = dirname(datafile)
+    # Skip if output files are up to date - not for data in memory (changed in this run) or plots
+    manifest = None
+    if incremental and savefile and data is None and not showplots:
+        manifest = Manifest(outputdir)
+        config = ConfigObj(configfile, encoding='ISO-8859-1')
+        params = configParams(config, HISTOGRAM_FIELDS)
+        if manifest.isCurrent('histogram', [datafile], params):
+            logging.info("Histogram: outputs up to date for %s", datafile)
+            return (datafile, manifest.results('histogram'), None)
+        manifest.remove('histogram')
+        # Only bins changed - sums of base histograms
+        if manifest.isCurrent('histogram_base', [datafile], configParams(config, BASE_FIELDS)):
+            rebinned = rebinCell(configfile, datafile, outputdir)
+            if rebinned is not None:
+                (results, histdata, outputs) = rebinned
+                manifest.update('histogram', [datafile], params, outputs, list(results))
+                return (datafile, results, histdata)
+    fd = HistogramLogD(datafile, configfile=configfile, showplots=showplots, data=data)
+    results = fd.generateHistogram(freq=0, outputdir=outputdir, savefile=savefile)
+    histdata = fd.histdata if results is not None else None
+    outputs = [f for f in list(results) + [fd.accumulatorfile] if f] if results is not None else []
+    basefiles = [fd.saveBase(outputdir)] if results is not None and savefile else []
+    if results is not None and alphaPoints(configfile) > 0:
+        # alpha histogram file is always written - compiled from file in batch stats
+        if ALPHA_COLUMN in fd.data.columns:
+            fa = HistogramLogD(datafile, configfile=configfile, data=fd.data, alpha=True)
+            outputs += [f for f in fa.generateHistogram(freq=0, outputdir=outputdir, savefile=True) if f]
+            outputs.append(fa.accumulatorfile)
+            basefiles.append(fa.saveBase(outputdir))
+        else:
+            logging.warning("Histogram: no alpha in %s - run filter with ALPHA_POINTS", datafile)
+    if manifest is not None and results is not None:
+        manifest.update('histogram', [datafile], params, outputs, list(results))
+        manifest.update('histogram_base', [datafile], configParams(config, BASE_FIELDS), basefiles)
+    return (datafile, results, histdata)
+
+
+def rebinCell(configfile, datafile, outputdir):
+    """
+    Histograms of a single cell from its base histograms - filtered data is not read
+    :param configfile: config params - bins must align with base bins
+    :param datafile: filtered log10D file
+    :param outputdir: directory of base histograms and histogram outputs
+    :return: (results, histdata, outputs) or None if bins do not align with base bins
+    """
+    try:
+        fd = HistogramLogD(datafile, configfile=configfile, data=pandas.DataFrame())
+        fd.loadBase(join(outputdir, fd.basefile))
+        results = fd.generateHistogram(freq=0, outputdir=outputdir)
+        outputs = [f for f in results if f] + [fd.accumulatorfile]
+        if alphaPoints(configfile) > 0:
+            fa = HistogramLogD(datafile, configfile=configfile, data=pandas.DataFrame(), alpha=True)
+            fa.loadBase(join(outputdir, fa.basefile))
+            outputs += [f for f in fa.generateHistogram(freq=0, outputdir=outputdir) if f] + [fa.accumulatorfile]
+    except (IOError, OSError, ValueError, KeyError) as e:
+        logging.info("Histogram: rebuilding from data for %s - %s", datafile, e)
+        return None
+    logging.info("Histogram: rebinned from base histograms for %s", datafile)
+    return (results, fd.histdata, outputs)
+
+
+def groupHistograms(configfile, filenames, datastore=None, alpha=False):
+    """
+    Histograms of a group of cells in one pass for batch stats - from filtered data held in memory
+    (see HistogramLogD.batch) or else from base histograms up to date with the filtered files
+    (see HistogramLogD.batchBase), as histograms written by the histogram process are from the same data
+    :param configfile: config params
+    :param filenames: histogram files of cells
+    :param datastore: in-memory dataframes by filename or None
+    :param alpha: alpha histograms instead of log10D
+    :return: HistogramMatrix or None if neither filtered data nor base histograms of all cells are available
+    """
+    if len(filenames) <= 0:
+        return None
+    config = ConfigObj(configfile, encoding='ISO-8859-1')
+    datafiles = [join(dirname(f), config['FILTERED_FILENAME']) for f in filenames]
+    if datastore is not None and all([f in datastore for f in datafiles]):
+        if alpha and not all([ALPHA_COLUMN in datastore[f].columns for f in datafiles]):
+            return None
+        return HistogramLogD.batch(datafiles, configfile, data=datastore, alpha=alpha)
+    if datastore is not None and any([f in datastore for f in datafiles]):
+        return None
+    # base histograms recorded in manifest of each cell with the filtered file they were built from
+    params = configParams(config, BASE_FIELDS)
+    if not all([Manifest(dirname(f)).isCurrent('histogram_base', [f], params) for f in datafiles]):
+        return None
+    basefile = histogramConfig(configfile, alpha)['basefile']
+    try:
+        return HistogramLogD.batchBase([join(dirname(f), basefile) for f in filenames], configfile, alpha=alpha)
+    except (IOError, OSError, ValueError, KeyError) as e:
+        logging.info("Batch: histograms read from files - %s", e)
+        return None
+
+
+def alphaPoints(configfile):
+    """
+    Number of lags for alpha fit from config - 0 if not used
+    :param configfile:
+    :return: int
+    """
+    config = ConfigObj(configfile, encoding='ISO-8859-1')
+    return int(config['ALPHA_POINTS']) if 'ALPHA_POINTS' in config else 0
+
+
+def batchGroup(type, filenames, outputdir, group, expt, configfile, nolistfilter, datastore=None, showplots=False,
+               incremental=False):
+    """
+    Run batch process for one group of cells
+    :param type: stats, msd or batchd
+    :param filenames: checked list of input files
+    :param datastore: in-memory dataframes by filename or None
+    :param incremental: skip if compiled files are up to date with all input files
+    :return: (compiledfile, ratiofile, plotfile) - all None if type is unknown
+    """
+    if type not in BATCH_FIELDS:
+        return (None, None, None)
+    # Alpha histograms in same directories as log10D histograms
+    alphafiles = []
+    if type == 'stats' and alphaPoints(configfile) > 0:
+        alphafile = ConfigObj(configfile, encoding='ISO-8859-1')['ALPHA_HISTOGRAM']
+        alphafiles = [f for f in [join(dirname(f), alphafile) for f in filenames] if exists(f)]
+    # Skip if compiled files are up to date - not for data in memory (changed in this run) or plots
+    manifest = None
+    step = "%s_%s" % (type, expt + group)
+    inmemory = datastore is not None and any([f in datastore for f in filenames])
+    if incremental and not showplots and not inmemory:
+        manifest = Manifest(outputdir)
+        params = configParams(ConfigObj(configfile, encoding='ISO-8859-1'), BATCH_FIELDS[type])
+        params.update({'group': group, 'expt': expt, 'nolistfilter': bool(nolistfilter)})
+        if manifest.isCurrent(step, filenames + alphafiles, params):
+            logging.info("Batch: %s up to date for %s", type, expt + group)
+            (compiledfile, ratiofile) = manifest.results(step)
+            return (compiledfile, ratiofile, None)
+        manifest.remove(step)
+    plotfile = None
+    outputs = []
+    if type == 'stats':
+        fmsd = HistoStats(filenames, outputdir, group, expt, configfile, nolistfilter, datastore=datastore,
+                          histograms=groupHistograms(configfile, filenames, datastore))
+        compiledfile = fmsd.runStats()
+        # Split to Mobile/immobile fractions - output
+        ratiofile = fmsd.splitMobile()
+        outputs += [fmsd.sweepMobile(), fmsd.accumulatorfile]
+        if len(alphafiles) > 0:
+            astats = HistoStats(alphafiles, outputdir, group, expt, configfile, True, alpha=True,
+                                histograms=groupHistograms(configfile, alphafiles, datastore, alpha=True))
+            outputs += [astats.runStats(), astats.accumulatorfile]
+        if showplots:
+            plotfile = fmsd.showPlotly()
+    elif type == 'msd':
+        fmsd = CompareMSD(filenames, outputdir, group, expt, configfile, nolistfilter, datastore=datastore)
+        compiledfile = fmsd.compiledfile
+        ratiofile = fmsd.calculateAreas()
+        outputs += [fmsd.accumulatorfile, fmsd.areasfile if fmsd.trajectoryauc else None]
+        if showplots:
+            plotfile = fmsd.showPlotly()
+    else:
+        fmsd = BatchLogd(filenames, outputdir, group, expt, configfile, nolistfilter, datastore=datastore)
+        fmsd.saveCompiled()
+        compiledfile = fmsd.compiledfile
+        ratiofile = ''
+    if manifest is not None:
+        outputs = [f for f in [compiledfile, ratiofile] + outputs if f and exists(f)]
+        manifest.update(step, filenames + alphafiles, params, outputs,
+                        [compiledfile, ratiofile])
+    return (compiledfile, ratiofile, plotfile)
+
+
+def runTask(job):
+    """
+    Run func over a single task - errors are logged (in worker processes forwarded to the parent log)
+    :param job: (func, task)
+    :return: (True, result) or (False, None) if func failed
+    """
+    (func, task) = job
+    try:
+        return (True, func(task))
+    except Exception:
+        logging.exception("Task %s failed for %s", func.__name__, taskName(task))
+        return (False, None)
+
+
+def taskName(task):
+    """
+    Short description of task for messages - filename of cell tasks
+    :param task: tuple of task arguments
+    :return: string
+    """
+    if isinstance(task, tuple) and len(task) > 1 and isinstance(task[1], str):
+        return task[1]
+    return str(type(task).__name__)
+
+
+def runCells(func, tasks, workers=1, callback=None, skiperrors=True):
+    """
+    Run func over tasks - in a process pool if more than one worker
+    Results are returned in task order and callback is called as each completes (in order)
+    :param func: module level function taking a single task
+    :param tasks: list of tasks
+    :param workers: number of processes (1 runs in this process)
+    :param callback: function(i, total) called after task i (1-based) completes or fails
+    :param skiperrors: log failed tasks and continue with the others (otherwise the first error is raised)
+    :return: list of results of tasks that did not fail
+    """
+    total = len(tasks)
+    results = []
+    failed = 0
+    workers = min(numWorkers(workers), total)
+    jobs = [(func, task) for task in tasks] if skiperrors else tasks
+    run = runTask if skiperrors else func
+    pool = None
+    if workers > 1:
+        logging.info("Running %d tasks with %d worker processes", total, workers)
+        ctx = poolContext()
+        logqueue = ctx.Queue()
+        listener = LogForwarder(logqueue)
+        listener.start()
+    try:
+        if workers <= 1:
+            outputs = map(run, jobs)
+        else:
+            pool = ctx.Pool(workers, initializer=initWorker,
+                            initargs=(logqueue, logging.getLogger().getEffectiveLevel()))
+            outputs = pool.imap(run, jobs)
+        for i, output in enumerate(outputs):
+            if not skiperrors:
+                results.append(output)
+            elif output[0]:
+                results.append(output[1])
+            else:
+                failed += 1
+            if callback is not None:
+                callback(i + 1, total)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if workers > 1:
+            listener.stop()
+    if failed > 0:
+        logging.error("%d of %d tasks failed for %s - see log", failed, total, func.__name__)
+    return results
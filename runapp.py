@@ -3,10 +3,10 @@
 import csv
 import re
 import time
-from glob import iglob
 from os import access, R_OK
 from os.path import join, expanduser, isdir, sep
 import shutil
+import threading
 # maintain this order of matplotlib
 # TkAgg causes Runtime errors in Thread
 import matplotlib
@@ -21,9 +21,12 @@ import sys
 from configobj import ConfigObj
 from msdapp.guicontrollers import EVT_RESULT, EVT_DATA
 from msdapp.guicontrollers import MSDController
+from msdapp.fileindex import getIndex, configFilenames
 from msdapp.utils import findResourceDir
 from gui.gui_spt import ConfigPanel, FilesPanel, ComparePanel, WelcomePanel, ProcessPanel, dlgLogViewer
 __version__='2.1.1'
+# Delay after last keystroke in filter limits before preview (ms)
+LIMITS_DELAY = 500
 
 ########################################################################
 class HomePanel(WelcomePanel):
@@ -107,10 +110,93 @@ class MSDConfig(ConfigPanel):
         self.currentconfig= join(expanduser('~'), '.msdcfg')
         if parent.controller.loaded:
             self.__loadValues(parent.controller)
+        # Live preview of trajectories retained by filter limits - after typing pauses, counted in a thread
+        self.limitstimer = None
+        self.limitsthread = None
+        self.limitspending = False
+        self.m_textCtrl10.Bind(wx.EVT_TEXT, self.OnLimits)
+        self.m_textCtrl11.Bind(wx.EVT_TEXT, self.OnLimits)
 
     def loadController(self):
         pass
 
+    def OnLimits(self, event):
+        """
+        Preview of filter limits when typing pauses (see previewLimits)
+        :param event:
+        :return:
+        """
+        event.Skip()
+        if self.limitstimer is not None and self.limitstimer.IsRunning():
+            self.limitstimer.Restart(LIMITS_DELAY)
+        else:
+            self.limitstimer = wx.CallLater(LIMITS_DELAY, self.previewLimits)
+
+    def previewLimits(self):
+        """
+        Show trajectories of selected files retained by min and max limits (without running filter)
+        Counts run in a thread - one at a time, repeated with the latest limits if these changed meanwhile
+        :return:
+        """
+        if self.limitsthread is not None and self.limitsthread.is_alive():
+            self.limitspending = True
+            return
+        filepanel = self.getFilePanel()
+        if filepanel is None:
+            return
+        filenames = [filepanel.m_dataViewListCtrl1.GetValue(i, 2)
+                     for i in range(filepanel.m_dataViewListCtrl1.GetItemCount())
+                     if filepanel.m_dataViewListCtrl1.GetToggleValue(i, 0)]
+        try:
+            minlimit = float(self.m_textCtrl10.GetValue())
+            maxlimit = float(self.m_textCtrl11.GetValue())
+        except ValueError:
+            return
+        if len(filenames) <= 0:
+            return
+        self.m_status.SetLabel("Counting trajectories retained by limits ... please wait")
+        self.limitsthread = threading.Thread(target=self.__countLimits, args=(filenames, minlimit, maxlimit))
+        self.limitsthread.daemon = True
+        self.limitsthread.start()
+
+    def __countLimits(self, filenames, minlimit, maxlimit):
+        """
+        Count retained trajectories (in thread) - result shown in GUI thread
+        """
+        try:
+            counts = self.Parent.controller.LimitCounts(filenames, minlimit, maxlimit)
+        except Exception as e:
+            print("Limits preview error: ", e)
+            counts = None
+        wx.CallAfter(self.__showLimits, counts)
+
+    def __showLimits(self, counts):
+        """
+        Show retained trajectories then repeat preview if limits changed while counting
+        """
+        if counts is not None and counts[1] > 0:
+            (retained, total, ncells) = counts
+            msg = "Limits retain %d of %d trajectories (%0.1f%%) in %d cells" % (retained, total,
+                                                                               100.0 * retained / total, ncells)
+            self.m_status.SetLabel(msg)
+        else:
+            self.m_status.SetLabel("Limits: no trajectories counted in selected files")
+        if self.limitspending:
+            self.limitspending = False
+            self.previewLimits()
+
+    def getFilePanel(self):
+        """
+        Get access to filepanel
+        :return:
+        """
+        filepanel = None
+        for fp in self.Parent.Children:
+            if isinstance(fp, FileSelectPanel):
+                filepanel = fp
+                break
+        return filepanel
+
     def __loadValues(self, parent):
         print("Config loaded")
         self.m_textCtrl15.SetValue(parent.datafile)
@@ -164,6 +250,10 @@ class MSDConfig(ConfigPanel):
         config['CELLID'] = self.m_tcCellid.GetValue()
         config['BATCHD_FILENAME'] = self.m_txtAlllogdfilename.GetValue()
         config['GROUPBY_ROI'] = int(self.m_cbROI.GetValue())
+        # Keep options which are not shown on this panel (eg CHUNKSIZE)
+        for key in self.Parent.controller.config.keys():
+            if key not in config:
+                config[key] = self.Parent.controller.config[key]
         config.write()
         # Reload to parent
         try:
@@ -341,10 +431,9 @@ class FileSelectPanel(FilesPanel):
         self.btnAutoFind.Disable()
         fullsearch = self.m_cbMatchAny.GetValue()
         self.m_status.SetLabelText("Finding files ... please wait")
-        if fullsearch:
-            allfiles = [y for y in iglob(join(self.inputdir, '**', '*'+self.datafile), recursive=True)]
-        else:
-            allfiles = [y for y in iglob(join(self.inputdir, '**', self.datafile), recursive=True)]
+        # index all configured filenames so later processes can use it
+        index = getIndex(self.inputdir, configFilenames(self.controller.config))
+        allfiles = index.find(self.datafile, self.inputdir, matchany=fullsearch)
         searchtext = self.m_tcSearch.GetValue()
         if (len(searchtext) > 0):
             filenames = [f for f in allfiles if re.search(searchtext, f, flags=re.IGNORECASE)]
@@ -492,6 +581,8 @@ class ProcessRunPanel(ProcessPanel):
         """
         # Clear processing window
         self.m_dataViewListCtrlRunning.DeleteAllItems()
+        # Release in-memory data and tasks from previous run
+        self.controller.startRun()
         # Disable Run button
         # self.m_btnRunProcess.Disable()
         btn = event.GetEventObject()
@@ -537,7 +628,7 @@ class ProcessRunPanel(ProcessPanel):
                 for p in selections:
                     i = [i for i in range(len(self.controller.processes)) if p == self.controller.processes[i]['caption']][0]
                     if self.controller.processes[i]['ptype'] == 'indiv':
-                        self.controller.RunProcess(self, filenames['all'], i, outputdir, expt, row, indivplots)
+                        self.controller.RunProcess(self, filenames, i, outputdir, expt, row, indivplots)
                     else:
                         self.controller.RunProcess(self, filenames, i, outputdir, expt, row, showplots)
                     row = row + 1
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of bootstrapStats: resampling of cells for each group
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import numpy as np
+
+from msdapp.msd.bootstrapStats import Bootstrap, BOOTSTRAP_CHUNK
+
+
+def test_resample_groups_independent():
+    bootstrap = Bootstrap(nboot=BOOTSTRAP_CHUNK + 500, seed=3)
+    values = np.arange(8.0)[:, None]
+    first = bootstrap.resample(values, group=0)
+    second = bootstrap.resample(values, group=1)
+    assert first.shape == (BOOTSTRAP_CHUNK + 500, 1)
+    # same cells in two groups - different resamples so group differences vary
+    assert not np.array_equal(first, second)
+    assert np.std(first - second) > 0.5 * np.std(first)
+    # tables of the same group with the same number of cells share resamples
+    assert np.array_equal(first, bootstrap.resample(values, group=0))
+    assert np.array_equal(2 * first, bootstrap.resample(2 * values, group=0))
+
+
+def test_resample_workers():
+    values = np.random.RandomState(0).normal(size=(6, 3))
+    single = Bootstrap(nboot=2 * BOOTSTRAP_CHUNK, seed=1).resample(values, group=2)
+    assert np.allclose(single.mean(axis=0), values.mean(axis=0), atol=0.1)
+    # chunks in worker processes - same resamples
+    assert np.array_equal(single, Bootstrap(nboot=2 * BOOTSTRAP_CHUNK, seed=1, workers=2).resample(values, group=2))
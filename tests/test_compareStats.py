@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of compareStats: vectorized tests of every field against scipy.stats applied one field at a time
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import numpy as np
+import pytest
+from scipy import stats
+
+from msdapp.msd.compareStats import studentTest, welchTest, mannWhitneyTest, fdr
+
+
+def groups(rs, n1=7, n2=9, fields=6, nanfraction=0.15, decimals=None):
+    """
+    Random groups cells x fields with NaN values (and ties if rounded) - at least 3 values per field
+    """
+    x1 = rs.normal(0, 1, (n1, fields))
+    x2 = rs.normal(0.5, 2, (n2, fields))
+    if decimals is not None:
+        (x1, x2) = (np.round(x1, decimals), np.round(x2, decimals))
+    for x in (x1, x2):
+        x[3:][rs.rand(len(x) - 3, fields) < nanfraction] = np.nan
+    return (x1, x2)
+
+
+def columns(x1, x2):
+    """
+    Valid values of each field of both groups
+    """
+    for j in range(x1.shape[1]):
+        yield (x1[~np.isnan(x1[:, j]), j], x2[~np.isnan(x2[:, j]), j])
+
+
+def scipyMannWhitney(a, b):
+    """
+    Two-sided Mann-Whitney with normal approximation - method only in newer scipy (always asymptotic before)
+    """
+    try:
+        return stats.mannwhitneyu(a, b, use_continuity=True, alternative='two-sided', method='asymptotic')
+    except TypeError:
+        return stats.mannwhitneyu(a, b, use_continuity=True, alternative='two-sided')
+
+
+def test_studentTest():
+    (x1, x2) = groups(np.random.RandomState(1))
+    (t, p) = studentTest(x1, x2)
+    for (j, (a, b)) in enumerate(columns(x1, x2)):
+        expected = stats.ttest_ind(a, b)
+        assert np.isclose(t[j], expected[0], rtol=1e-10)
+        assert np.isclose(p[j], expected[1], rtol=1e-10)
+
+
+def test_welchTest():
+    (x1, x2) = groups(np.random.RandomState(2))
+    (t, p) = welchTest(x1, x2)
+    for (j, (a, b)) in enumerate(columns(x1, x2)):
+        expected = stats.ttest_ind(a, b, equal_var=False)
+        assert np.isclose(t[j], expected[0], rtol=1e-10)
+        assert np.isclose(p[j], expected[1], rtol=1e-10)
+
+
+@pytest.mark.parametrize('n1,n2', [(4, 4), (7, 9), (25, 30)])
+def test_mannWhitneyTest_ties(n1, n2):
+    # rounded values - ties within and between groups
+    (x1, x2) = groups(np.random.RandomState(n1), n1, n2, decimals=0)
+    (u, p) = mannWhitneyTest(x1, x2)
+    for (j, (a, b)) in enumerate(columns(x1, x2)):
+        expected = scipyMannWhitney(a, b)
+        assert np.isclose(u[j], expected[0], rtol=1e-10)
+        assert np.isclose(p[j], expected[1], rtol=1e-10)
+
+
+def test_mannWhitneyTest_empty():
+    (x1, x2) = groups(np.random.RandomState(3))
+    x2[:, 1] = np.nan
+    (u, p) = mannWhitneyTest(x1, x2)
+    assert np.isnan(u[1]) and np.isnan(p[1])
+    assert np.isfinite(p[[0, 2, 3, 4, 5]]).all()
+
+
+def test_fdr():
+    p = np.random.RandomState(4).uniform(0, 0.2, 40)
+    p[[3, 17]] = np.nan
+    p[5] = p[6]
+    q = fdr(p)
+    valid = ~np.isnan(p)
+    assert np.array_equal(np.isnan(q), ~valid)
+    # direct Benjamini-Hochberg: q(i) = min over p(j) >= p(i) of p(j) * m / rank(j)
+    m = valid.sum()
+    ranks = stats.rankdata(p[valid], method='max')
+    adjusted = p[valid] * m / ranks
+    expected = np.array([min(adjusted[p[valid] >= x].min(), 1.0) for x in p[valid]])
+    assert np.allclose(q[valid], expected, rtol=1e-12)
+    if hasattr(stats, 'false_discovery_control'):
+        assert np.allclose(q[valid], stats.false_discovery_control(p[valid]), rtol=1e-12)
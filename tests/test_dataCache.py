@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of dataCache: fingerprints of input files hashed once while unchanged
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import hashlib
+from os import utime, stat
+
+import numpy as np
+
+from msdapp.msd import dataCache
+from msdapp.msd.dataCache import DataCache, fingerprint
+
+
+def countHashes(monkeypatch):
+    """
+    Count content hashes of files from now
+    """
+    calls = []
+    sha1 = hashlib.sha1
+
+    def counted(*args):
+        calls.append(1)
+        return sha1(*args)
+    monkeypatch.setattr(dataCache, 'HASHES', dict())
+    monkeypatch.setattr(dataCache.hashlib, 'sha1', counted)
+    return calls
+
+
+def test_fingerprint_hashed_once(tmp_path, monkeypatch):
+    datafile = str(tmp_path / 'AllROI-D.txt')
+    with open(datafile, 'w') as f:
+        f.write('ROI\tTrace\tD\n1\t1\t0.1\n')
+    calls = countHashes(monkeypatch)
+    fp = fingerprint(datafile)
+    assert fingerprint(datafile) == fp and len(calls) == 1
+    # cache and index saved with the same file - not hashed again
+    for suffix in ['.cache', '.log10D']:
+        assert DataCache(datafile, suffix).save({'D': np.arange(3.0)})
+        assert DataCache(datafile, suffix).load() is not None
+    assert len(calls) == 1
+    # hash of a saved fingerprint is reused while size and mtime match
+    monkeypatch.setattr(dataCache, 'HASHES', dict())
+    assert fingerprint(datafile, known=[fp]) == fp and len(calls) == 1
+    # touched file - hashed again and still matches cache
+    st = stat(datafile)
+    utime(datafile, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert DataCache(datafile).load() is not None
+    assert fingerprint(datafile)['sha1'] == fp['sha1'] and len(calls) == 2
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of filterMSD: parsing of ragged MSD text files in blocks of rows
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import numpy as np
+import pytest
+
+from msdapp.msd import filterMSD
+from msdapp.msd.filterMSD import FilterMSD
+
+MSDPOINTS = 4
+
+
+def expectedRows(lines):
+    """
+    Rows of MSD text parsed line by line - comment rows and rows with blank ROI skipped, blank lags NaN
+    """
+    (roi, trace, msd, offsets, nfields) = ([], [], [], [], [])
+    position = len(lines[0])
+    for line in lines[1:]:
+        fields = line.split(b'\t')
+        if not fields[0].startswith(b'#') and len(fields[0].strip()) > 0:
+            roi.append(int(fields[0]))
+            trace.append(int(fields[1]))
+            lags = [float(x) if len(x.strip()) > 0 else np.nan for x in fields[2:2 + MSDPOINTS]]
+            msd.append(lags + [np.nan] * (MSDPOINTS - len(lags)))
+            offsets.append(position)
+            nfields.append(len(fields))
+        position += len(line)
+    return (roi, trace, np.array(msd), offsets, nfields)
+
+
+@pytest.mark.parametrize('blocksize', [16, 64, 1 << 24])
+def test_load_msdtext(tmp_path, monkeypatch, blocksize):
+    rs = np.random.RandomState(5)
+    lines = [b'#MSD(DeltaT) in um^2\n', b'#ROI\tTrace\tvalues\n']
+    for i in range(60):
+        lags = [repr(x).encode() for x in rs.rand(rs.randint(1, 9))]
+        if i % 7 == 3:
+            lags[0] = b''
+        if i % 5 == 1:
+            lags.append(b'')
+        lines.append(b'\t'.join([str(i // 10 + 1).encode(), str(i).encode()] + lags) +
+                     (b'\r\n' if i % 11 == 0 else b'\n'))
+    # blank lines, blank ROI, whitespace field before CR, last row without newline
+    lines[10:10] = [b'\n', b'\t\t0.5\n', b'  \t3\t0.1\n', b'7\t70\t0.25\t \r\n']
+    lines[-1] = lines[-1].rstrip(b'\r\n')
+    msdfile = str(tmp_path / 'AllROI-MSD.txt')
+    with open(msdfile, 'wb') as f:
+        f.write(b''.join(lines))
+    # blocks smaller than rows are extended to whole rows
+    monkeypatch.setattr(filterMSD, 'MSD_BLOCKSIZE', blocksize)
+    fmsd = FilterMSD.__new__(FilterMSD)
+    fmsd.msdpoints = MSDPOINTS
+    (roi, trace, msd) = fmsd.load_msdtext(msdfile)
+    (eroi, etrace, emsd, offsets, nfields) = expectedRows(lines)
+    assert roi.tolist() == eroi and trace.tolist() == etrace
+    assert np.array_equal(msd, emsd, equal_nan=True)
+    assert fmsd.msdindex.offsets.tolist() == offsets and fmsd.msdindex.fields.tolist() == nfields
+    chunks = list(fmsd.iter_msdtext(msdfile, 7))
+    assert [len(c[0]) for c in chunks[:-1]] == [7] * (len(chunks) - 1)
+    assert np.array_equal(np.concatenate([c[2] for c in chunks]), emsd, equal_nan=True)
+
+
+def test_load_msdtext_corrupt(tmp_path):
+    msdfile = str(tmp_path / 'AllROI-MSD.txt')
+    fmsd = FilterMSD.__new__(FilterMSD)
+    fmsd.msdpoints = MSDPOINTS
+    for row in [b'1\t2\t0.1\tx0.2\n', b'1\t\t0.1\n', b'1.5\t2\t0.1\n']:
+        with open(msdfile, 'wb') as f:
+            f.write(b'#MSD(DeltaT) in um^2\n1\t1\t0.1\t0.2\n' + row)
+        with pytest.raises(Exception, match='datafile maybe corrupt'):
+            fmsd.load_msdtext(msdfile)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of histogramLogD: histograms rebinned from base histograms against histograms built from data
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import numpy as np
+import pytest
+
+from msdapp.msd.histogramLogD import baseHistogram, rebinHistogram, batchHistogram, histogramBins
+
+
+@pytest.mark.parametrize('fmin,fmax,binwidth', [(-5.0, 1.0, 0.2), (0.0, 2.0, 0.1), (-4.0, 0.5, 0.5)])
+def test_rebinHistogram_edges(fmin, fmax, binwidth):
+    rs = np.random.RandomState(0)
+    (centrebins, edges) = histogramBins(fmin, fmax, binwidth)
+    arrays = []
+    for i in range(20):
+        values = rs.uniform(fmin - 1, fmax + 1, 300)
+        # values on first, last and inner edges and rounded to base bin width
+        values[:10] = edges[-1]
+        values[10:15] = edges[0]
+        values[15:25] = rs.choice(edges, 10)
+        values[25:35] = np.round(rs.uniform(fmin, fmax, 10), 2)
+        values[35:40] = np.nan
+        arrays.append(values)
+    (bins, counts) = batchHistogram(arrays, fmin, fmax, binwidth)
+    for (values, c) in zip(arrays, counts):
+        assert np.array_equal(c, np.histogram(values[np.isfinite(values)], edges)[0])
+    (rebins, rebinned) = rebinHistogram([baseHistogram(values) for values in arrays], fmin, fmax, binwidth)
+    assert np.allclose(rebins, bins)
+    assert np.array_equal(rebinned, counts)
+
+
+def test_rebinHistogram_unaligned():
+    with pytest.raises(ValueError):
+        rebinHistogram([baseHistogram(np.arange(10.0))], -5.0, 1.0, 0.015)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of msdStats: t-tests of groups from compiled tables of each group
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+from os.path import join
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from msdapp.msd.msdStats import MSDStats
+
+
+def writeGroup(outputdir, prefix, cells, ratios, areas):
+    """
+    Compiled ratios, areas and histogram tables of a group (as batch processes)
+    """
+    pd.DataFrame({'Cell': cells, 'Immobile': 1.0, 'Mobile': ratios, 'Ratio': ratios},
+                 columns=['Cell', 'Immobile', 'Mobile', 'Ratio']).to_csv(join(outputdir, prefix + '_ratios.csv'),
+                                                                       index=False)
+    pd.DataFrame({'Cell': cells + ['ALL'], 'MSD Area': areas + [np.mean(areas)]},
+                 columns=['Cell', 'MSD Area']).to_csv(join(outputdir, prefix + '_areas.csv'), index=False)
+    histogram = pd.DataFrame({'bins': [-1.0, 0.0]})
+    for cell in cells:
+        histogram[cell] = [0.5, 0.5]
+    for stat in ['MEAN', 'SEM', 'COUNT', 'STD', 'SUM']:
+        histogram[stat] = 0.0
+    histogram.to_csv(join(outputdir, prefix + '_AllHistogram_log10D.csv'), index=False)
+
+
+def test_runTtests_repeated_cells(tmp_path):
+    outputdir = str(tmp_path)
+    # same cell IDs in both groups (and repeated in a group) - not matched between groups
+    groups = {'stim': (['c001', 'c002', 'c003', 'c001'], [2.0, 3.5, 1.5, 4.0], [0.2, 0.3, 0.25, 0.4]),
+              'nostim': (['c001', 'c002', 'c003'], [1.0, 1.2, np.inf], [0.1, 0.15, 0.12])}
+    for (prefix, (cells, ratios, areas)) in groups.items():
+        writeGroup(outputdir, prefix, cells, ratios, areas)
+    df = MSDStats([outputdir], outputdir, ['stim', 'nostim']).runTtests()
+    # non-finite ratios are excluded as in comparisons
+    (t, p) = stats.ttest_ind([2.0, 3.5, 1.5, 4.0], [1.0, 1.2])
+    row = df[df['Compare'] == 'Ratios'].iloc[0]
+    assert np.isclose(row['T-test'], t) and np.isclose(row['p-value'], p)
+    (t, p) = stats.ttest_ind([0.2, 0.3, 0.25, 0.4], [0.1, 0.15, 0.12])
+    row = df[df['Compare'] == 'MSD Area'].iloc[0]
+    assert np.isclose(row['T-test'], t) and np.isclose(row['p-value'], p)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the pipeline without GUI: compiled files from filtered data held in memory against files saved per cell
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+from os import makedirs, listdir
+from os.path import join, dirname
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from msdapp.cli import PipelineRunner
+
+CONFIG = join(dirname(dirname(__file__)), 'resources', 'msd.cfg')
+GROUPS = ['stim', 'nostim']
+
+
+def writeCell(celldir, rs, ntraces=120):
+    """
+    Synthetic D and MSD files of a cell - some D outside filter limits, MSD rows of uneven length
+    """
+    makedirs(celldir)
+    d = 10 ** rs.uniform(-3.5, 0.5, ntraces)
+    d[rs.rand(ntraces) < 0.2] = 10 ** rs.uniform(-7, -5.5)
+    roi = np.sort(rs.randint(1, 4, ntraces))
+    with open(join(celldir, 'AllROI-D.txt'), 'w', encoding='ISO-8859-1') as f:
+        f.write('#Diffusion Coefficient in um^2/s\n#fit 4 points\nROI\tTrace\tD(µm²/s)\n')
+        for i in range(ntraces):
+            f.write('%d\t%d\t%.9f\n' % (roi[i], i, d[i]))
+    with open(join(celldir, 'AllROI-MSD.txt'), 'w', encoding='ISO-8859-1') as f:
+        f.write('#MSD(DeltaT) in um^2\n#ROI\tTrace\tvalues\n')
+        for i in range(ntraces):
+            lags = 4 * d[i] * 0.02 * np.arange(1, rs.randint(6, 20)) * rs.uniform(0.8, 1.2)
+            f.write('%d\t%d\t%s\n' % (roi[i], i, '\t'.join(['%.10f' % x for x in lags])))
+
+
+def writeConfig(configfile, **values):
+    """
+    Config from resources with values replaced (or added)
+    """
+    with open(CONFIG, encoding='ISO-8859-1') as f:
+        lines = f.read().splitlines()
+    keys = [line.split(' = ')[0] for line in lines]
+    lines = ["%s = %s" % (key, values[key]) if key in values else line for (key, line) in zip(keys, lines)]
+    lines += ["%s = %s" % (key, value) for (key, value) in values.items() if key not in keys]
+    with open(configfile, 'w', encoding='ISO-8859-1') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def runPipeline(tmp_path, name, **values):
+    """
+    Run filter, histogram and batch processes over the same synthetic cells
+    :return: output directory
+    """
+    rs = np.random.RandomState(7)
+    inputdir = str(tmp_path / name / 'input')
+    for group in GROUPS:
+        for cell in range(3):
+            writeCell(join(inputdir, 'ProtA_' + group, 'cell%d' % cell), rs)
+    configfile = str(tmp_path / name / 'msd.cfg')
+    writeConfig(configfile, **values)
+    outputdir = str(tmp_path / name / 'output')
+    runner = PipelineRunner(configfile, inputdir, outputdir, 'ProtA_', GROUPS, jobs=1,
+                            processes=['filter', 'histogram', 'batchd', 'stats', 'msd'], force=True)
+    summary = runner.run()
+    assert summary['state'] == 'done'
+    return outputdir
+
+
+@pytest.mark.parametrize('chunksize', [0, 50])
+def test_inmemory_compiled(tmp_path, chunksize):
+    ondisk = runPipeline(tmp_path, 'ondisk', CHUNKSIZE=chunksize, INMEMORY=0, SAVE_INTERMEDIATE=1)
+    inmemory = runPipeline(tmp_path, 'inmemory', CHUNKSIZE=chunksize, INMEMORY=1, SAVE_INTERMEDIATE=0)
+    compiled = sorted([f for f in listdir(ondisk) if f.endswith('.csv')])
+    assert 'ProtA_stim_All_log10D.csv' in compiled and 'ProtA_nostim_Avg_MSD.csv' in compiled
+    assert compiled == sorted([f for f in listdir(inmemory) if f.endswith('.csv')])
+    for f in compiled:
+        expected = pd.read_csv(join(ondisk, f))
+        df = pd.read_csv(join(inmemory, f))
+        pd.testing.assert_frame_equal(df, expected, check_exact=False, rtol=1e-12)
+
+
+def test_limits_sweep_summary(tmp_path):
+    rs = np.random.RandomState(7)
+    inputdir = str(tmp_path / 'input')
+    for group in GROUPS:
+        writeCell(join(inputdir, 'ProtA_' + group, 'cell0'), rs)
+    configfile = str(tmp_path / 'msd.cfg')
+    writeConfig(configfile, MINLIMIT_SWEEP='-5:-3:1', MAXLIMIT_SWEEP='0, 1')
+    outputdir = str(tmp_path / 'output')
+    summary = PipelineRunner(configfile, inputdir, outputdir, 'ProtA_', GROUPS, jobs=1, processes=['filter'],
+                             force=True).run()
+    stages = dict([(s['process'], s) for s in summary['stages']])
+    assert summary['state'] == 'done' and stages['limits']['state'] == 'done'
+    assert len(pd.read_csv(join(outputdir, 'ProtA_limits_sweep.csv'))) > 0
+    # sweep file cannot be written - failed sweep is in summary
+    makedirs(join(str(tmp_path / 'failed'), 'ProtA_limits_sweep.csv'))
+    summary = PipelineRunner(configfile, inputdir, str(tmp_path / 'failed'), 'ProtA_', GROUPS, jobs=1,
+                             processes=['filter'], force=True).run()
+    stages = dict([(s['process'], s) for s in summary['stages']])
+    assert stages['filter']['state'] == 'done'
+    assert stages['limits']['state'] == 'error' and summary['state'] == 'error'
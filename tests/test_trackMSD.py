@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of trackMSD: FFT MSD of trajectories with gaps against a direct sum over pairs of positions
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import numpy as np
+import pandas as pd
+
+from msdapp.msd.trackMSD import TrackMSD, batchMSD
+
+
+def bruteMSD(frames, x, y, maxlag):
+    """
+    Time-averaged MSD at lags 1..maxlag from all pairs of positions - NaN where no pairs
+    """
+    msd = np.full(maxlag, np.nan)
+    positions = dict(zip(frames.tolist(), zip(x.tolist(), y.tolist())))
+    for m in range(1, maxlag + 1):
+        sq = [(positions[f + m][0] - positions[f][0]) ** 2 + (positions[f + m][1] - positions[f][1]) ** 2
+              for f in positions if f + m in positions]
+        if len(sq) > 0:
+            msd[m - 1] = np.mean(sq)
+    return msd
+
+
+def randomTracks(rs, ntracks=40, maxlength=60):
+    """
+    Random walks with missing frames - (frames, x, y) per trajectory
+    """
+    tracks = []
+    for i in range(ntracks):
+        length = rs.randint(2, maxlength)
+        frames = np.sort(rs.choice(length + 10, length, replace=False))
+        x = np.cumsum(rs.normal(0, 0.1, length)) + rs.uniform(0, 50)
+        y = np.cumsum(rs.normal(0, 0.1, length)) + rs.uniform(0, 50)
+        tracks.append((frames - frames[0], x, y))
+    return tracks
+
+
+def test_batchMSD_gaps():
+    rs = np.random.RandomState(1)
+    tracks = randomTracks(rs)
+    nframes = max([f[-1] for (f, x, y) in tracks]) + 1
+    (bx, by, bw) = (np.zeros((len(tracks), nframes)), np.zeros((len(tracks), nframes)),
+                    np.zeros((len(tracks), nframes)))
+    for (i, (f, x, y)) in enumerate(tracks):
+        (bx[i, f], by[i, f], bw[i, f]) = (x, y, 1.0)
+    msd = batchMSD(bx, by, bw, nframes - 1)
+    assert msd.shape == (len(tracks), nframes - 1)
+    for (i, (f, x, y)) in enumerate(tracks):
+        expected = bruteMSD(f, x, y, nframes - 1)
+        assert np.array_equal(np.isnan(msd[i]), np.isnan(expected))
+        assert np.allclose(msd[i], expected, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+def test_calculateMSD_file(tmp_path):
+    rs = np.random.RandomState(2)
+    tracks = randomTracks(rs)
+    rows = []
+    for (i, (f, x, y)) in enumerate(tracks):
+        # frames offset per trajectory and rows shuffled - sorted by load_tracks
+        rows += [(100 + i, xi, yi, fi + 5 * i) for (fi, xi, yi) in zip(f.tolist(), x.tolist(), y.tolist())]
+    df = pd.DataFrame(rows, columns=['Trajectory', 'x', 'y', 'Frame']).sample(frac=1, random_state=rs)
+    tracksfile = str(tmp_path / 'Tracks.csv')
+    df.to_csv(tracksfile, index=False)
+    tmsd = TrackMSD(None, tracksfile)
+    (keep, msdlist) = tmsd.calculateMSD(tmsd.load_tracks())
+    expected_keep = [i for (i, (f, x, y)) in enumerate(tracks) if len(f) >= tmsd.minpoints]
+    assert list(keep) == expected_keep
+    for i in expected_keep:
+        (f, x, y) = tracks[i]
+        assert len(msdlist[i]) == f[-1]
+        assert np.allclose(msdlist[i], bruteMSD(f, x, y, f[-1]), rtol=1e-9, atol=1e-9, equal_nan=True)
+    # lags limited by TRACK_MAXLAG
+    tmsd.maxlag = 5
+    (keep, msdlist) = tmsd.calculateMSD(tmsd.load_tracks())
+    for i in expected_keep:
+        (f, x, y) = tracks[i]
+        assert np.allclose(msdlist[i], bruteMSD(f, x, y, min(f[-1], 5)), rtol=1e-9, atol=1e-9, equal_nan=True)
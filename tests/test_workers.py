@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of workers: cell tasks in this process and in worker processes
+
+Created on Oct 18 2026
+
+@author: QBI Software
+"""
+
+import logging
+
+import pytest
+
+from msdapp.workers import runCells
+
+
+def squareCell(task):
+    """
+    Cell task failing for negative values
+    """
+    (configfile, value) = task
+    if value < 0:
+        raise ValueError("negative value %d" % value)
+    return (value, value * value)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_runCells_errors(workers, caplog):
+    tasks = [('', v) for v in [1, 2, -3, 4, -5, 6]]
+    progress = []
+    with caplog.at_level(logging.INFO):
+        results = runCells(squareCell, tasks, workers, lambda i, n: progress.append((i, n)))
+    # failed cells are logged and the others completed in task order
+    assert results == [(1, 1), (2, 4), (4, 16), (6, 36)]
+    assert progress == [(i, 6) for i in range(1, 7)]
+    assert '2 of 6 tasks failed for squareCell' in caplog.text
+    with pytest.raises(ValueError):
+        runCells(squareCell, tasks, workers, skiperrors=False)